@@ -80,15 +80,28 @@ function BacktestContent() {
       const res = await fetch("https://api.richacle.com/api/backtest", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ strategy: selectedStrat.code, email: userEmail }),
+        body: JSON.stringify({ strategy: selectedStrat.code, email: userEmail, strategyId: selectedStrat.id }),
       });  
-      const data = await res.json();
+      const job = await res.json();
 
       if (res.status === 403) {
           toast.error("Insufficient backtest credits, Upgrade your Plan!");
           router.push("/pricing");
           return;
       }
+
+      // Backtests run as background jobs; poll until the job finishes
+      let data = job;
+      while (data.job_id && (data.status === "queued" || data.status === "running")) {
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        const poll = await fetch(`https://api.richacle.com/api/backtest/${job.job_id}?email=${encodeURIComponent(userEmail)}`);
+        data = await poll.json();
+      }
+
+      if (data.status === "failed") {
+        toast.error("Backtest failed. Check your strategy code.");
+        return;
+      }
       
 
       if (data.status === "success") {
@@ -1,8 +1,13 @@
 from fastapi import APIRouter, Form, HTTPException
-from openai import OpenAI
+from openai import AsyncOpenAI
+from pydantic import BaseModel, ValidationError
+import asyncio
+import json
 import os
 from dotenv import load_dotenv
-from db import users_collection
+from db_async import find_strategy, list_strategies, insert_strategy, update_strategy, get_plan, get_credits, user_exists
+from quota import charge
+from completion_cache import completion_cache, autocomplete_gate, Superseded
 from typing import Optional
 import traceback
 from uuid import uuid4
@@ -10,232 +15,180 @@ from uuid import uuid4
 load_dotenv()
 
 router = APIRouter()
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-
-@router.post("/api/strategy")
-async def predict_trade(
-    email: str = Form(...),
-    input: str = Form(...),
-    id: Optional[str] = Form(None)
-):
-    try:
-        user = users_collection.find_one({"email": email})
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-
-        if user.get("credits", 0) < 1:
-            raise HTTPException(status_code=403, detail="Insufficient credits")
-
-        strategies = user.get("strategies", [])
-        existing_strategy = None
-
-        if id:
-            existing_strategy = next(
-                (s for s in strategies if s.get("id") == id),
-                None
-            )
-            if not existing_strategy:
-                raise HTTPException(status_code=404, detail="Strategy not found")
-
-        # Generate strategy name only for NEW strategy
-        name = existing_strategy["name"] if existing_strategy else None
-        if not existing_strategy:
-            res = openai_client.responses.create(
-                model="gpt-4o-mini",
-                input=[
-                    {"role": "system", "content": "write a short simple name for algorithm trading, dont use "". "},
-                    {"role": "user", "content": input},
-                ],
-            )
-            name = res.output_text.strip()
-
-        symbolres = openai_client.responses.create(
-                model="gpt-4o-mini",
-                input=[
-                    {"role": "system", "content": (
-                "Identify the single Crypto trading pair symbol from the user input. "
-                "Format: SYMBOL/USDT (e.g., BTC/USDT, ETH/USDT, SOL/USDT). "
-                "If no specific coin is mentioned, output 'BTC/USDT'. "
-                "Output ONLY the symbol string. No explanation, no quotes, no markdown."
-            )},
-                    {"role": "user", "content": input},
-                ],
-            )
-        symbol = symbolres.output_text.strip()
-
-        amountres = openai_client.responses.create(
-                model="gpt-4o-mini",
-                input=[
-                    {"role": "system", "content": (
-                "Extract the trading amount in USDT from the user input. "
-                "Rules:\n"
-                "1. Output ONLY the number (e.g., 100.0).\n"
-                "2. Remove any '$' or 'USDT' symbols.\n"
-                "3. If no amount is found, output '100.0' as the default.\n"
-                "4. No words, no punctuation, no explanations.\n"
-                "\nExamples:\n"
-                "Input: 'buy $500 of btc' -> Output: 500\n"
-                "Input: 'trade with 100.0 usdt' -> Output: 100.0\n"
-                "Input: 'start a strategy' -> Output: 100.0"
-            )},
-                    {"role": "user", "content": input},
-                ],
-            )
-        raw_amount = amountres.output_text.strip()
-
+# Async client for handlers; OPENAI_BASE_URL points it at fake_openai.py offline
+async_openai = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+TIMEFRAMES = ["1m", "5m", "15m", "30m", "1h", "4h", "1d"]
+MAX_LEVERAGE = 20
+
+PARAMS_INSTRUCTIONS = (
+    "Extract the trading strategy parameters from the user input.\n"
+    "- name: a short simple name for the algorithm, without quotes.\n"
+    "- symbol: the single crypto pair as SYMBOL/USDT (e.g. BTC/USDT, SOL/USDT); BTC/USDT if no coin is mentioned.\n"
+    "- amount: the trading amount in USDT as a number; 100 if none is given.\n"
+    f"- leverage: integer leverage; 1 if none is mentioned, at most {MAX_LEVERAGE}.\n"
+    "- take_profit: take profit as a decimal ('5%' -> 0.05); 0.05 if none is given.\n"
+    "- stop_loss: stop loss as a decimal ('2.5%' -> 0.025); 0.03 if none is given.\n"
+    f"- timeframe: one of {', '.join(TIMEFRAMES)}; 1m if none is mentioned."
+)
+
+# Strict structured output: the model can only answer with this object
+PARAMS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string"},
+        "symbol": {"type": "string"},
+        "amount": {"type": "number"},
+        "leverage": {"type": "integer"},
+        "take_profit": {"type": "number"},
+        "stop_loss": {"type": "number"},
+        "timeframe": {"type": "string", "enum": TIMEFRAMES},
+    },
+    "required": ["name", "symbol", "amount", "leverage", "take_profit", "stop_loss", "timeframe"],
+    "additionalProperties": False,
+}
+
+
+class StrategyParams(BaseModel):
+    name: str = "Strategy"
+    symbol: str = "BTC/USDT"
+    amount: float = 100.0
+    leverage: int = 1
+    take_profit: float = 0.05
+    stop_loss: float = 0.02
+    timeframe: str = "1m"
+
+
+def clean_params(raw):
+    """Validates extracted parameters, falling back to defaults field by field."""
+    raw = {k: v for k, v in (raw if isinstance(raw, dict) else {}).items() if k in StrategyParams.model_fields and v is not None}
+    while True:
         try:
-          clean_amount = "".join(c for c in raw_amount if c.isdigit() or c == '.')
-          amount = float(clean_amount) if clean_amount else 100.0
-        except ValueError:
-          amount = 100.0 # Final fallback if AI hallucinates text
+            params = StrategyParams(**raw).model_dump()
+            break
+        except ValidationError as e:
+            for error in e.errors():
+                raw.pop(error["loc"][0], None)
+
+    params["name"] = params["name"].strip().strip('"') or "Strategy"
+    symbol = params["symbol"].strip().upper().replace("-", "/")
+    params["symbol"] = symbol if "/" in symbol else f"{symbol.removesuffix('USDT') or 'BTC'}/USDT"
+    params["amount"] = params["amount"] if params["amount"] > 0 else 100.0
+    params["leverage"] = min(max(params["leverage"], 1), MAX_LEVERAGE)
+    for key, default in (("take_profit", 0.05), ("stop_loss", 0.02)):
+        value = params[key]
+        value = value / 100 if value >= 1 else value  # "5" meant 5%
+        params[key] = value if value > 0 else default
+    if params["timeframe"] not in TIMEFRAMES:
+        params["timeframe"] = "1m"
+    return params
+
+
+async def extract_params(input):
+    """All strategy parameters from one structured-output call."""
+    res = await async_openai.responses.create(
+        model="gpt-4o-mini",
+        input=[
+            {"role": "system", "content": PARAMS_INSTRUCTIONS},
+            {"role": "user", "content": input},
+        ],
+        text={"format": {"type": "json_schema", "name": "strategy_params", "schema": PARAMS_SCHEMA, "strict": True}},
+    )
+    try:
+        raw = json.loads(res.output_text)
+    except ValueError:
+        raw = {}
+    return clean_params(raw)
 
-        leverageres = openai_client.responses.create(
-            model="gpt-4o-mini",
-            input=[
-                {"role": "system", "content": (
-                    "Extract leverage from user input. Rules:\n"
-                    "1. Output ONLY the integer (e.g., 5).\n"
-                    "2. If no leverage is mentioned, output '1'.\n"
-                    "3. Max limit is 20.\n"
-                    "Examples: '10x leverage' -> 10, 'use 5 leverage' -> 5, 'no mention' -> 1"
-                )},
-                {"role": "user", "content": input},
-            ],
-        )
-        try:
-            leverage = int("".join(filter(str.isdigit, leverageres.output_text.strip())))
-            leverage = min(max(leverage, 1), 20) # Keep between 1x and 20x
-        except:
-            leverage = 1
-
-        takeProfitres = openai_client.responses.create(
-                model="gpt-4o-mini",
-                input=[
-                    {
-            "role": "system", 
-            "content": (
-                "Extract Take Profit and convert to decimal. Output ONLY the number.\n"
-                "Examples:\n"
-                "Input: 'take profit 5%' -> Output: 0.05\n"
-                "Input: 'tp at 10%' -> Output: 0.10\n"
-                "Default: 0.05"
-            )
-            },
-                    {"role": "user", "content": input},
-                ],
-            )
-        take_profit = takeProfitres.output_text.strip()
-
-
-        stopLossres = openai_client.responses.create(
-                model="gpt-4o-mini",
-                input=[
-                    {
-            "role": "system", 
-            "content": (
-                "Extract Stop Loss and convert to decimal. Output ONLY the number.\n"
-                "Examples:\n"
-                "Input: 'stop loss 3%' -> Output: 0.03\n"
-                "Input: 'sl at 2.5%' -> Output: 0.025\n"
-                "Default: 0.03"
-            )
-        },
-                    {"role": "user", "content": input},
-                ],
-            )
-        stop_loss = stopLossres.output_text.strip()
-
-        if take_profit == 0: take_profit = 0.05
-        if stop_loss == 0: stop_loss = 0.02
-
-        timeframeres = openai_client.responses.create(
-            model="gpt-4o-mini",
-              input=[
-              {"role": "system", "content": (
-                   "Identify the trading timeframe from user input. "
-                   "Valid options: '1m', '5m', '15m', '30m', '1h', '4h', '1d'. "
-                   "If none mentioned, output '1m'. Output ONLY the string."
-               )},
-              {"role": "user", "content": input},
-           ],
-        )
-        timeframe = timeframeres.output_text.strip()
 
-        prompt = f"""
+async def generate_code(input):
+    prompt = f"""
 You are a professional Quant Coder. Generate a Python function for a LONG-ONLY trading strategy.
 
 STRICT RULES:
-1. Output ONLY the function `def run_strategy(df):`. No markdown, no backticks, no comments.
-2. Use 'pd' for pandas and 'np' for numpy.
-3. The function MUST return: `trades` (a list of dicts) and `latest_signal` (a string).
-4. Trade Dictionary Format: 
-   - Each trade MUST be: {{'entry_price': float, 'exit_price': float, 'qty': 1}}
-5. latest_signal: "BUY" (if current candle meets entry), "SELL" (if in trade and exit met), or "HOLD".
+1. Output ONLY the function `def signals(df):`. No markdown, no backticks, no comments.
+2. Use 'pd' for pandas, 'np' for numpy and 'ind' for indicators (shared and cached, prefer them):
+   ind.ema(df, span), ind.sma(df, window), ind.std(df, window), ind.rsi(df, period),
+   ind.atr(df, period), ind.highest(df, window), ind.lowest(df, window),
+   ind.macd(df, fast, slow, signal) -> (macd, signal, hist), ind.bollinger(df, window, k) -> (mid, upper, lower).
+3. The function MUST return two boolean Series aligned with df: `entry` and `exit`.
+   - entry: True on candles where a long position should be opened.
+   - exit: True on candles where an open position should be closed.
+4. Use vectorized pandas/numpy operations only. No loops over rows, no `.iloc[i]`.
+5. The engine opens and closes the trades from these signals; do not build trade lists.
 
 ENVIRONMENT:
 - df columns: ['timestamp', 'open', 'high', 'low', 'close', 'volume']
 - All price columns are already floats.
 
 EXAMPLE STRUCTURE:
-def run_strategy(df):
-    df['ema'] = df['close'].ewm(span=20).mean()
-    trades = []
-    open_trade = None
-    latest_signal = "HOLD"
-    for i in range(len(df)):
-        price = df['close'].iloc[i]
-        if open_trade is None:
-            if price > df['ema'].iloc[i]: # Entry Logic
-                open_trade = {{'entry_price': price, 'qty': 1}}
-                if i == len(df)-1: latest_signal = "BUY"
-        else:
-            if price < df['ema'].iloc[i]: # Exit Logic
-                trades.append({{'entry_price': open_trade['entry_price'], 'exit_price': price, 'qty': 1}})
-                open_trade = None
-                if i == len(df)-1: latest_signal = "SELL"
-    if open_trade:
-        trades.append({{'entry_price': open_trade['entry_price'], 'exit_price': df['close'].iloc[-1], 'qty': 1}})
-    return trades, latest_signal
+def signals(df):
+    ema = ind.ema(df, 20)
+    entry = df['close'] > ema # Entry Logic
+    exit = df['close'] < ema # Exit Logic
+    return entry, exit
 
 USER STRATEGY REQUEST:
 {input}
 """
 
+    response = await async_openai.responses.create(
+        model="gpt-4o-mini",
+        input=[
+            {
+                "role": "system",
+                "content": "You are a professional quant trader and Python coder. Write fully working algorithmic trading strategies."
+            },
+            {"role": "user", "content": prompt},
+        ],
+    )
+    return response.output_text.strip()
 
-        response = openai_client.responses.create(
-            model="gpt-4o-mini",
-            input=[
-                {
-                    "role": "system",
-                    "content": "You are a professional quant trader and Python coder. Write fully working algorithmic trading strategies."
-                },
-                {"role": "user", "content": prompt},
-            ],
-        )
 
-        result_text = response.output_text.strip()
+@router.post("/api/strategy")
+async def predict_trade(
+    email: str = Form(...),
+    input: str = Form(...),
+    id: Optional[str] = Form(None)
+):
+    credit = None
+    try:
+        # Reserve the credit up front; it is refunded if generation fails
+        credit = await charge(email, "credits")
+
+        existing_strategy = None
+
+        if id:
+            existing_strategy = await find_strategy(email, id, ["name"])
+            if not existing_strategy:
+                raise HTTPException(status_code=404, detail="Strategy not found")
+
+        # Parameters and code come from two independent calls made concurrently
+        params, result_text = await asyncio.gather(extract_params(input), generate_code(input))
+
+        # Keep the name of an existing strategy
+        name = existing_strategy["name"] if existing_strategy else params["name"]
+        symbol = params["symbol"]
+        amount = params["amount"]
+        leverage = params["leverage"]
+        take_profit = params["take_profit"]
+        stop_loss = params["stop_loss"]
+        timeframe = params["timeframe"]
 
         if existing_strategy:
             # UPDATE existing strategy
-            users_collection.update_one(
-                {
-                    "email": email,
-                    "strategies.id": id
-                },
-                {
-                    "$set": {
-                        "strategies.$.input": input,
-                        "strategies.$.symbol": symbol,
-                        "strategies.$.amount": amount,
-                        "strategies.$.leverage": leverage,
-                        "strategies.$.code": result_text,
-                        "strategies.$.take_profit": take_profit,
-                        "strategies.$.stop_loss": stop_loss,
-                        "strategies.$.timeframe": timeframe,
-                    }
+            await update_strategy(email, id, {
+                "$set": {
+                    "input": input,
+                    "symbol": symbol,
+                    "amount": amount,
+                    "leverage": leverage,
+                    "code": result_text,
+                    "take_profit": take_profit,
+                    "stop_loss": stop_loss,
+                    "timeframe": timeframe,
                 }
-            )
+            })
         else:
             # CREATE new strategy
             strategy_doc = {
@@ -252,25 +205,20 @@ USER STRATEGY REQUEST:
                 "timeframe": timeframe,
             }
 
-            users_collection.update_one(
-                {"email": email},
-                {"$push": {"strategies": strategy_doc}}
-            )
-
-        # Deduct 1 credit
-        users_collection.update_one(
-            {"email": email},
-            {"$inc": {"credits": -1}}
-        )
+            await insert_strategy(email, strategy_doc)
 
         return {
             "status": "success"
         }
 
     except HTTPException:
+        if credit:
+            await credit.refund()
         raise
 
     except Exception as e:
+        if credit:
+            await credit.refund()
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -280,11 +228,21 @@ async def autocomplete(
     prompt: str = Form(...), 
     email: str = Form(...)
 ):
+    credit = None
     try:
-        user = users_collection.find_one({"email": email})
+        user = await get_credits(email)
         if not user or user.get("copilot", 0) < 1:
             raise HTTPException(status_code=403, detail="Credits exhausted or user not found")
 
+        # Same (or a typed-ahead) prompt answered recently: no model call, no charge
+        cached = await completion_cache.get(prompt)
+        if cached is not None:
+            return {"suggestion": cached.strip(), "cached": True}
+
+        # Wait out the debounce window; a newer keystroke from this user wins
+        token = await autocomplete_gate.enter(email)
+        credit = await charge(email, "copilot", missing_status=403)
+
         # System prompt with clear "Before/After" logic
         system_instruction = (
             "You are a Crypto Trading Algo Autocomplete engine. "
@@ -306,27 +264,37 @@ async def autocomplete(
             {"role": "user", "content": prompt} # The actual user input
         ]
 
-        response = openai_client.chat.completions.create(
+        response = await autocomplete_gate.run(email, token, async_openai.chat.completions.create(
             model="gpt-4o-mini",
             messages=messages,
             temperature=0.2, # Lower temperature for more predictable completions
             max_tokens=50,
             presence_penalty=0.0,
             frequency_penalty=0.0
-        )
-    
-        suggestion = response.choices[0].message.content.strip()
-
-        # Only deduct credit if a suggestion was actually provided
-        if suggestion:
-            users_collection.update_one(
-                {"email": email},
-                {"$inc": {"copilot": -1}}
-            )
+        ))
+
+        # Cache the raw continuation so its leading space survives prefix reuse
+        completion = response.choices[0].message.content or ""
+        await completion_cache.put(prompt, completion)
+        suggestion = completion.strip()
+
+        # Only keep the credit if a suggestion was actually provided
+        if not suggestion:
+            await credit.refund()
         
         return {"suggestion": suggestion}
 
+    except Superseded:
+        if credit:
+            await credit.refund()
+        return {"suggestion": "", "superseded": True}
+
+    except HTTPException:
+        raise
+
     except Exception as e:
+        if credit:
+            await credit.refund()
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
@@ -337,18 +305,14 @@ async def llmupdate(
     llm: str = Form(...), 
 ):
     try:
-        user = users_collection.find_one({"email": email})
-        if not user:
+        if not await user_exists(email):
             raise HTTPException(status_code=403, detail="user not found")
 
-        users_collection.update_one(
-        {"email": email, "strategies.id": strategyId},
-        {
+        await update_strategy(email, strategyId, {
             "$set": {
-                "strategies.$.llm": llm,
+                "llm": llm,
             },
-        }
-        )
+        })
         
         return {"status": "llm updated"}
 
@@ -363,11 +327,11 @@ async def duplicate(
 ):
     try:
         # 1. Find the user
-        user = users_collection.find_one({"email": email})
+        user = await get_plan(email)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
 
-        strategies = user.get("strategies", [])
+        strategies = await list_strategies(email)
         user_plan = user.get("plan", "FREE").upper() # Normalize to uppercase
         
         # Define limits
@@ -406,10 +370,7 @@ async def duplicate(
         })
 
         # 5. Save to Database
-        result = users_collection.update_one(
-            {"email": email},
-            {"$push": {"strategies": new_strategy}}
-        )
+        await insert_strategy(email, new_strategy)
 
         return {"status": "success"}
 
@@ -1,14 +1,23 @@
+import os
 import docker
 import uuid
+import asyncio
 import traceback
 from fastapi import APIRouter, HTTPException, Form
 from pydantic import BaseModel
-import ccxt
-from db import users_collection
+from db import USER_FIELDS
+from db_async import find_strategy, count_strategies, update_strategy, get_user, get_binance
+from strategy_loader import load_strategy, StrategyError, ENTRY_POINTS
+from exchange_pool import exchange_pool
 from datetime import datetime
 
 
 router = APIRouter()
+MARKET_HUB_SOCKET = os.getenv("MARKET_HUB_SOCKET")
+# "container" runs each strategy in its own container, "runner" hands it to
+# a multi-strategy runner process (runner.py) identified by RUNNER_ID
+DEPLOY_MODE = os.getenv("DEPLOY_MODE", "container")
+RUNNER_ID = os.getenv("RUNNER_ID", "default")
 # Initialize docker client once
 try:
     client = docker.from_env()
@@ -26,8 +35,8 @@ async def deploy(request: DeployRequest):
 
     email = request.email
     strategyId = request.strategyId
-    # 1. Find user and specific strategy in one go
-    user = users_collection.find_one({"email": email})
+    # 1. Find user (plan and keys only) and the specific strategy
+    user = await get_user(email, USER_FIELDS["plan"] + USER_FIELDS["binance"])
     
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -47,8 +56,7 @@ async def deploy(request: DeployRequest):
         raise HTTPException(status_code=403, detail="Engine is OFF")
 
     # 2. Count currently running strategies
-    # This assumes your strategies list items have a "status" field
-    running_count = sum(1 for s in user.get("strategies", []) if s.get("status") == "running")
+    running_count = await count_strategies(email, {"status": "running"})
 
     # 3. Apply Limits
     limits = {"PRO": 3, "PREMIUM": 24}
@@ -61,15 +69,20 @@ async def deploy(request: DeployRequest):
         )
     # --- PLAN VALIDATION END ---
 
-    strategy = next((s for s in user.get("strategies", []) if s.get("id") == strategyId), None)
+    strategy = await find_strategy(email, strategyId)
+
+    if not strategy or not strategy.get("code"):
+        raise HTTPException(status_code=400, detail="Strategy not found or code is empty")
+
+    try:
+        load_strategy(strategy["code"], tuple(ENTRY_POINTS))
+    except StrategyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     # Prevent duplicate deployment of the same strategy
     if strategy.get("status") == "running":
         raise HTTPException(status_code=400, detail="This strategy is already running.")
 
-    if not strategy or not strategy.get("code"):
-        raise HTTPException(status_code=400, detail="Strategy not found or code is empty")
-
     binance = user.get("binance", {})
     api_key = binance.get("apiKey")
     api_secret = binance.get("apiSecret")
@@ -78,6 +91,16 @@ async def deploy(request: DeployRequest):
     if not api_key or not api_secret:
         raise HTTPException(status_code=403, detail="Binance API keys missing in profile")
 
+    if DEPLOY_MODE == "runner":
+        # The runner picks the strategy up on its next sync
+        await update_strategy(email, strategyId, {"$set": {
+            "deploy_mode": "runner",
+            "runner_id": RUNNER_ID,
+            "demo": demo,
+            "status": "running",
+        }})
+        return {"status": "success", "runner_id": RUNNER_ID}
+
     if not client:
         print("Docker engine is not available")
         raise HTTPException(status_code=500, detail="Docker engine is not available")
@@ -85,6 +108,13 @@ async def deploy(request: DeployRequest):
     try:
         # 3. Docker Deployment
         unique_name = f"bot_{strategyId[:8]}_{uuid.uuid4().hex[:4]}"
+
+        # Bots read candles from the shared market hub when one is configured
+        feed_env, volumes = {}, {}
+        if MARKET_HUB_SOCKET:
+            hub_dir = os.path.dirname(MARKET_HUB_SOCKET)
+            feed_env = {"MARKET_FEED": "hub", "MARKET_HUB_SOCKET": MARKET_HUB_SOCKET}
+            volumes = {hub_dir: {"bind": hub_dir, "mode": "rw"}}
         
         container = client.containers.run(
             image="trading-bot-runner:latest",
@@ -95,7 +125,9 @@ async def deploy(request: DeployRequest):
             cpu_period=100000,
             cpu_quota=10000,         # Limit to 10% of a CPU core
             restart_policy={"Name": "on-failure", "MaximumRetryCount": 5},
+            volumes=volumes,
             environment={
+                **feed_env,
                 "PYTHONUNBUFFERED": "1",
                 "EMAIL": email,
                 "BINANCE_API_KEY": api_key,
@@ -113,14 +145,12 @@ async def deploy(request: DeployRequest):
         )
 
         # 4. Update Database
-        users_collection.update_one(
-            {"email": email, "strategies.id": strategyId},
-            {"$set": {
-                "strategies.$.container_id": container.id,
-                "strategies.$.demo": demo,
-                "strategies.$.status": "running",
-            }}
-        )
+        await update_strategy(email, strategyId, {"$set": {
+            "container_id": container.id,
+            "deploy_mode": "container",
+            "demo": demo,
+            "status": "running",
+        }})
         
         return {"status": "success", "container_id": container.id}
 
@@ -131,93 +161,84 @@ async def deploy(request: DeployRequest):
 
 @router.post("/api/stop")
 async def stop_bot(email: str = Form(...), strategyId: str = Form(...)):
-    user = users_collection.find_one(
-        {"email": email, "strategies.id": strategyId},
-    )
-    
-    if not user or "container_id" not in user["strategies"][0]:
+    strategy = await find_strategy(email, strategyId, ["container_id", "deploy_mode"])
+    if not strategy or ("container_id" not in strategy and strategy.get("deploy_mode") != "runner"):
         raise HTTPException(status_code=404, detail="No active container found for this strategy")
 
-    container_id = user["strategies"][0]["container_id"]
-
-    try:
-        # Get and stop container
-        container = client.containers.get(container_id)
-        container.stop(timeout=5)
-        container.remove()
-    except docker.errors.NotFound:
-        pass # Already gone
-    except Exception as e:
-        print(f"Stop error: {e}")
+    # Runner-hosted strategies stop once their status leaves "running": the
+    # bot checks it before each order, the runner removes it within seconds
+    container_id = strategy.get("container_id")
+    if container_id:
+        try:
+            # Get and stop container
+            container = client.containers.get(container_id)
+            container.stop(timeout=5)
+            container.remove()
+        except docker.errors.NotFound:
+            pass # Already gone
+        except Exception as e:
+            print(f"Stop error: {e}")
 
     # Update DB regardless of whether container existed (to keep UI in sync)
-    users_collection.update_one(
-        {"email": email, "strategies.id": strategyId},
-        {
-            "$set": {"strategies.$.status": "stopped"},
-            "$unset": {
-            "strategies.$.container_id": "",
-            "strategies.$.error_at": "",
-            "strategies.$.last_error": ""
+    await update_strategy(email, strategyId, {
+        "$set": {"status": "stopped"},
+        "$unset": {
+            "container_id": "",
+            "error_at": "",
+            "last_error": ""
         }
-        }
-    )
+    })
     
     return {"status": "stopped"}
 
 
+def square_off(api_key, api_secret, demo, symbol):
+    """Closes the open position on `symbol` with a reduce-only market order, on the pooled client."""
+    with exchange_pool.client(api_key, api_secret, demo) as exchange:
+        # --- FIX: Only fetch and close the target symbol ---
+        positions = exchange.fetch_positions([symbol])
+
+        for pos in positions:
+            # CCXT unified 'contracts' is the size.
+            # On Binance, positionAmt can be negative (short) or positive (long).
+            size = float(pos['info']['positionAmt'])
+
+            if size != 0:
+                side = 'sell' if size > 0 else 'buy'
+                print(f"Closing {size} of {symbol}")
+
+                exchange.create_market_order(
+                    symbol=symbol,
+                    side=side,
+                    amount=abs(size),
+                    params={'reduceOnly': True}
+                )
+
+
 @router.post("/api/squareoff")
 async def stop_and_square_off(email: str = Form(...), strategyId: str = Form(...)):
-    user = users_collection.find_one({"email": email})
-    if not user:
+    binance = await get_binance(email)
+    if binance is None:
         raise HTTPException(status_code=404, detail="User not found")
 
-    strategy = next((s for s in user.get("strategies", []) if s["id"] == strategyId), None)
+    strategy = await find_strategy(email, strategyId, ["symbol", "demo", "container_id"])
     if not strategy:
         raise HTTPException(status_code=404, detail="Strategy not found")
 
     # Get the specific symbol this strategy was trading
     target_symbol = strategy.get("symbol", "BTC/USDT") # Ensure this is stored in your DB
 
-    # 1. SQUARE OFF LOGIC
-    binance = user.get("binance", {})
-    api_key = binance.get("apiKey")
-    api_secret = binance.get("apiSecret")
-
-    if api_key and api_secret:
-        try:
-            exchange = ccxt.binance({
-                'apiKey': api_key,
-                'secret': api_secret,
-                'enableRateLimit': True,
-                'options': {'defaultType': 'future'}
-            })
-
-            if strategy.get("demo"):
-                exchange.enable_demo_trading(True)
-
-            # --- FIX: Only fetch and close the target symbol ---
-            positions = exchange.fetch_positions([target_symbol])
-            
-            for pos in positions:
-                # CCXT unified 'contracts' is the size. 
-                # On Binance, positionAmt can be negative (short) or positive (long).
-                size = float(pos['info']['positionAmt']) 
-                
-                if size != 0:
-                    side = 'sell' if size > 0 else 'buy'
-                    print(f"Closing {size} of {target_symbol}")
-                    
-                    exchange.create_market_order(
-                        symbol=target_symbol,
-                        side=side,
-                        amount=abs(size),
-                        params={'reduceOnly': True}
-                    )
-        except Exception as e:
-            print(f"Square off error: {e}")
+    # 1. STOP THE BOT FIRST, so it cannot reopen the position being closed.
+    # Runner-hosted bots re-read this status before every order.
+    await update_strategy(email, strategyId, {
+        "$set": {"status": "stopped"},
+        "$unset": {
+            "container_id": "",
+            "error_at": "",
+            "last_error": ""
+        }
+    })
 
-    # 2. DOCKER STOP LOGIC (unchanged)
     container_id = strategy.get("container_id")
     if container_id:
         try:
@@ -227,25 +248,26 @@ async def stop_and_square_off(email: str = Form(...), strategyId: str = Form(...
         except Exception as e:
             print(f"Docker stop error: {e}")
 
+    # 2. SQUARE OFF LOGIC
+    api_key = binance.get("apiKey")
+    api_secret = binance.get("apiSecret")
+
+    if api_key and api_secret:
+        try:
+            await asyncio.to_thread(square_off, api_key, api_secret, strategy.get("demo"), target_symbol)
+        except Exception as e:
+            print(f"Square off error: {e}")
+
     # 3. DATABASE UPDATE
     # Dynamically determine which prefix to reset
     prefix = "live" if not strategy.get("demo") else "demo"
-    
-    users_collection.update_one(
-        {"email": email, "strategies.id": strategyId},
-        {
-            "$set": {
-                "strategies.$.status": "stopped",
-                f"strategies.$.{prefix}_pos": 0,
-                f"strategies.$.{prefix}_entry": 0,
-                "strategies.$.last_update": datetime.now()
-            },
-            "$unset": {
-                "strategies.$.container_id": "",
-                "strategies.$.error_at": "",
-                "strategies.$.last_error": ""
-            }
+
+    await update_strategy(email, strategyId, {
+        "$set": {
+            f"{prefix}_pos": 0,
+            f"{prefix}_entry": 0,
+            "last_update": datetime.now()
         }
-    )
+    })
     
     return {"status": "success", "message": f"Squared off {target_symbol} and stopped bot."}
\ No newline at end of file
@@ -1,138 +1,177 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-import pandas as pd
-import numpy as np
-import ccxt
 import traceback
-from db import users_collection
+from db_async import update_strategy
+from quota import charge, give_back
+from candle_store import candle_store
+from candle_cache import candle_cache
+from metrics import aggregate, MS_PER_YEAR
+from simulator import TAKER_FEE, SLIPPAGE, FUNDING_RATE
+from backtest_pool import backtest_pool, BacktestError, BACKTEST_WORKERS
+from backtest_tasks import evaluate_strategy
+from backtest_jobs import JobQueue, make_backend
+from strategy_loader import load_strategy, StrategyError
+from datetime import datetime, timezone
+from typing import Optional, List
+import asyncio
+import os
 
 router = APIRouter()
+MAX_GRID_CELLS = int(os.getenv("MAX_GRID_CELLS", 24))
+
+
+async def refund_failed(job):
+    """The unit reserved at submit time goes back once the job has failed or was abandoned."""
+    await give_back(job["email"], "backtest")
+
+
+async def store_last_backtest(job, result):
+    """Keeps the latest result next to the strategy it was run for, once the job is done."""
+    if not job.get("strategy_id"):
+        return
+    await update_strategy(
+        job["email"],
+        job["strategy_id"],
+        {"$set": {
+            "last_backtest": {
+                "job_id": job["id"],
+                "code_hash": job["code_hash"],
+                "metrics": result["metrics"],
+                "cells": [
+                    {"symbol": r["symbol"], "timeframe": r["timeframe"], "metrics": r["metrics"]}
+                    for r in result["cells"]
+                ],
+                "at": datetime.now(timezone.utc),
+            }
+        }}
+    )
+
+
+backtest_queue = JobQueue(
+    make_backend(), workers=BACKTEST_WORKERS, on_failed=refund_failed, on_done=store_last_backtest
+)
+
+class SimulationParams(BaseModel):
+    amount: float = 100.0
+    leverage: int = 1
+    stop_loss: float = 0.02
+    take_profit: float = 0.05
+    fee_rate: float = TAKER_FEE
+    slippage: float = SLIPPAGE
+    funding_rate: float = FUNDING_RATE
 
 class BacktestRequest(BaseModel):
     strategy: str
     email: str
+    strategyId: Optional[str] = None
+    symbols: Optional[List[str]] = None
+    timeframes: Optional[List[str]] = None
+    simulation: Optional[SimulationParams] = None
+    # Exit plain (non-simulated) backtest trades at these SL/TP levels
+    stop_loss: Optional[float] = None
+    take_profit: Optional[float] = None
 
 def fetch_max_ohlcv(symbol="BTC/USDT", timeframe="1h"):
-    exchange = ccxt.kraken({
-        "enableRateLimit": True
-    })
-
-    since = exchange.milliseconds() - (2 * 365 * 24 * 60 * 60 * 1000)
-    limit = 1000
-    all_ohlcv = []
-
-    while True:
-        ohlcv = exchange.fetch_ohlcv(
-            symbol=symbol,
-            timeframe=timeframe,
-            since=since,
-            limit=limit
-        )
-
-        if not ohlcv:
-            break
-
-        all_ohlcv.extend(ohlcv)
-        since = ohlcv[-1][0] + 1
-
-    return all_ohlcv
+    # Served from the local candle store; only the missing tail hits Kraken
+    return candle_store.get("kraken", symbol, timeframe)
+
+
+async def run_backtest_job(queue, job):
+    """
+    Queue handler: runs the strategy over every (symbol, timeframe) cell in
+    parallel through the pool and returns per-cell and aggregate results.
+    The queue stores them, or refunds the job if this raises.
+    """
+    params = job["params"]
+    cells = [(symbol, timeframe) for symbol in params["symbols"] for timeframe in params["timeframes"]]
+
+    # Validated here so bad code fails before any fetch
+    load_strategy(job["code"])
+
+    # Each cell's candles are loaded once and shared by every job in the batch
+    await queue.progress(job["id"], 5)
+    frames = await asyncio.gather(*[
+        backtest_pool.offload(candle_cache.get, "kraken", symbol, timeframe)
+        for symbol, timeframe in cells
+    ])
+
+    done = 0
+
+    async def run_cell(cell, df):
+        nonlocal done
+        symbol, timeframe = cell
+        try:
+            result = await backtest_pool.run(
+                evaluate_strategy, job["code"], df, params.get("simulation"), params.get("exits")
+            )
+        except BacktestError as e:
+            raise Exception(f"Backtest failed on {symbol} {timeframe}: {str(e)}")
+        done += 1
+        await queue.progress(job["id"], 10 + int(85 * done / len(cells)))
+        timestamps = df["timestamp"].to_numpy()
+        years = (timestamps[-1] - timestamps[0]) / MS_PER_YEAR if len(df) else 0
+        result.update(symbol=symbol, timeframe=timeframe, data_info={
+            "candles": len(df),
+            "years": round(float(years), 2)
+        })
+        return result
+
+    results = await asyncio.gather(*[run_cell(cell, df) for cell, df in zip(cells, frames)])
+    result = {
+        "cells": results,
+        "metrics": aggregate([r["metrics"] for r in results]),
+        # Single-cell runs keep the original response shape
+        "trade_history": results[0]["trade_history"] if len(results) == 1 else [],
+        "data_info": results[0]["data_info"] if len(results) == 1 else {
+            "candles": sum(r["data_info"]["candles"] for r in results),
+            "cells": len(results)
+        },
+    }
+    return result
+
+
+@router.on_event("startup")
+async def start_backtest_workers():
+    backtest_queue.start(run_backtest_job)
 
 
 @router.post("/api/backtest")
 async def backtest_crypto(req: BacktestRequest):
-    strategy = req.strategy
-    email = req.email
-
     try:
-        user = users_collection.find_one({"email": email})
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-
-        if user.get("backtest", 0) < 1:
-            raise HTTPException(status_code=403, detail="Insufficient backtest")
-        
-        ohlcv = fetch_max_ohlcv()
-
-        df = pd.DataFrame(
-            ohlcv,
-            columns=["timestamp", "open", "high", "low", "close", "volume"]
-        )
-
-        df[["open","high","low","close","volume"]] = df[
-            ["open","high","low","close","volume"]
-        ].astype(float)
-
-        exec_globals = {"pd": pd, "np": np}
-        local_env = {}
-        exec(strategy, exec_globals, local_env)
-
-        if "run_strategy" not in local_env:
-            raise Exception("Strategy must define run_strategy(df)")
-
-        trades, _ = local_env["run_strategy"](df)
-
-        if not isinstance(trades, list):
-            raise Exception("run_strategy must return a list")
+        symbols = list(dict.fromkeys(req.symbols or ["BTC/USDT"]))
+        timeframes = list(dict.fromkeys(req.timeframes or ["1h"]))
+        if len(symbols) * len(timeframes) > MAX_GRID_CELLS:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_GRID_CELLS} symbol/timeframe combinations per backtest")
+
+        try:
+            load_strategy(req.strategy)
+        except StrategyError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        # Reserved now, refunded by the queue if the job fails
+        credit = await charge(req.email, "backtest")
+        try:
+            job, created = await backtest_queue.submit(
+                req.email,
+                req.strategy,
+                {
+                    "symbols": symbols,
+                    "timeframes": timeframes,
+                    "simulation": req.simulation.dict() if req.simulation else None,
+                    "exits": {"stop_loss": req.stop_loss, "take_profit": req.take_profit}
+                    if req.stop_loss or req.take_profit else None,
+                },
+                strategy_id=req.strategyId,
+            )
+        except Exception:
+            await credit.refund()
+            raise
+        if not created:
+            # A duplicate reuses the existing job's result and costs nothing
+            await credit.refund()
+
+        return {"status": job["status"], "job_id": job["id"], "duplicate": not created}
 
-        equity = 0
-        equity_curve = [0]
-        wins = losses = 0
-        total_pnl = 0
-
-        for trade in trades:
-            entry = trade["entry_price"]
-            exit = trade["exit_price"]
-            qty = trade.get("qty", 1)
-
-            pnl = (exit - entry) * qty
-            total_pnl += pnl
-            equity += pnl
-            equity_curve.append(equity)
-
-            if pnl > 0:
-                wins += 1
-            else:
-                losses += 1
-
-        total_trades = len(trades)
-        win_rate = (wins / total_trades * 100) if total_trades else 0
-
-        equity_series = pd.Series(equity_curve)
-        rolling_max = equity_series.cummax()
-        max_drawdown = (rolling_max - equity_series).max()
-
-        initial_capital = 10000
-        return_pct = (total_pnl / initial_capital) * 100
-
-         # Deduct 1 credit
-        users_collection.update_one(
-            {"email": email},
-            {"$inc": {"backtest": -1}}
-        )
-
-        trade_history = []
-        for trade in trades:
-            pnl = (trade["exit_price"] - trade["entry_price"]) * trade.get("qty", 1)
-            trade_history.append(round(pnl, 2))
-
-        return {
-            "status": "success",
-            "trade_history": trade_history,
-            "data_info": {
-                "candles": len(df),
-                "years": round(len(df) / 8760, 2)
-            },
-            "metrics": {
-                "total_pnl": round(total_pnl, 2),
-                "return_percent": round(return_pct, 2),
-                "max_drawdown": round(float(max_drawdown), 2),
-                "total_trades": total_trades,
-                "wins": wins,
-                "losses": losses,
-                "win_rate_percent": round(win_rate, 2)
-            }
-        }
-    
     except HTTPException as he:
         raise he
 
@@ -141,3 +180,19 @@ async def backtest_crypto(req: BacktestRequest):
             status_code=500,
             detail=f"Backtest failed: {str(e)}\n{traceback.format_exc()}"
         )
+
+
+@router.get("/api/backtest/{job_id}")
+async def backtest_status(job_id: str, email: str):
+    job = await backtest_queue.get(job_id)
+    # Other users' jobs are indistinguishable from missing ones
+    if not job or job.get("email") != email:
+        raise HTTPException(status_code=404, detail="Backtest job not found")
+
+    if job["status"] == "done":
+        return {"status": "success", "job_id": job_id, "progress": 100, **job["result"]}
+
+    if job["status"] == "failed":
+        return {"status": "failed", "job_id": job_id, "error": job["error"]}
+
+    return {"status": job["status"], "job_id": job_id, "progress": job["progress"]}
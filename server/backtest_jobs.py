@@ -0,0 +1,313 @@
+import os
+import asyncio
+import hashlib
+import traceback
+from uuid import uuid4
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime, timedelta, timezone
+
+# Backtest job queue. POST /api/backtest enqueues a job and returns its id;
+# worker tasks claim jobs, run them and store progress and results on the job
+# record, which GET /api/backtest/{id} reads. Submissions identical to a job
+# that is still queued/running (or finished recently) return that job.
+#
+# Running jobs hold a lease: the worker touches updated_at every third of
+# BACKTEST_LEASE_SECONDS. A job whose lease ran out (its worker crashed or
+# was restarted) is marked failed and no longer counts as a duplicate.
+#
+# Outcomes are only stored while the job is still running, so each job ends
+# exactly once: `on_failed` (e.g. a refund) runs for the one call that moved
+# it to failed, whether the handler raised or the lease ran out, and
+# `on_done` for the one that stored its result. A reaped job that finishes
+# late is dropped. Finished jobs expire after BACKTEST_RESULT_SECONDS.
+
+BACKTEST_QUEUE = os.getenv("BACKTEST_QUEUE", "mongo")
+BACKTEST_DEDUPE_SECONDS = int(os.getenv("BACKTEST_DEDUPE_SECONDS", 300))
+BACKTEST_POLL_SECONDS = float(os.getenv("BACKTEST_POLL_SECONDS", 0.5))
+BACKTEST_LEASE_SECONDS = float(os.getenv("BACKTEST_LEASE_SECONDS", 120))
+BACKTEST_RETRY_SECONDS = float(os.getenv("BACKTEST_RETRY_SECONDS", 5))
+BACKTEST_RESULT_SECONDS = int(os.getenv("BACKTEST_RESULT_SECONDS", 24 * 60 * 60))
+
+ACTIVE = ("queued", "running")
+ABANDONED = "Backtest worker stopped before finishing"
+
+
+def code_hash(code):
+    return hashlib.sha256(code.encode()).hexdigest()
+
+
+def dedupe_key(email, code, *params):
+    return hashlib.sha256("|".join([email, code_hash(code), *map(str, params)]).encode()).hexdigest()
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _lease_cutoff():
+    return _now() - timedelta(seconds=BACKTEST_LEASE_SECONDS)
+
+
+def _expires_at():
+    return _now() + timedelta(seconds=BACKTEST_RESULT_SECONDS)
+
+
+def _is_duplicate(job, now):
+    age = (now - job["updated_at"]).total_seconds()
+    if job["status"] == "queued":
+        return True
+    if job["status"] == "running":
+        return age < BACKTEST_LEASE_SECONDS
+    return job["status"] == "done" and age < BACKTEST_DEDUPE_SECONDS
+
+
+class InMemoryJobBackend:
+    """Process-local stand-in for local testing and single-worker deployments."""
+
+    def __init__(self):
+        self.jobs = {}
+        self._queue = asyncio.Queue()
+
+    async def submit(self, job):
+        now = _now()
+        for job_id in [i for i, j in self.jobs.items() if j.get("expires_at") and j["expires_at"] < now]:
+            del self.jobs[job_id]
+        for existing in self.jobs.values():
+            if existing["dedupe_key"] == job["dedupe_key"] and _is_duplicate(existing, now):
+                return existing, False
+        self.jobs[job["id"]] = job
+        await self._queue.put(job["id"])
+        return job, True
+
+    async def claim(self):
+        try:
+            job_id = await asyncio.wait_for(self._queue.get(), BACKTEST_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            return None
+        return await self.update(job_id, status="running")
+
+    async def update(self, job_id, **fields):
+        job = self.jobs[job_id]
+        job.update(fields, updated_at=_now())
+        return job
+
+    async def heartbeat(self, job_id):
+        if self.jobs[job_id]["status"] == "running":
+            await self.update(job_id)
+
+    async def finish(self, job_id, **fields):
+        if self.jobs[job_id]["status"] == "running":
+            return await self.update(job_id, expires_at=_expires_at(), **fields)
+
+    async def reap(self, cutoff):
+        stale = [job for job in self.jobs.values() if job["status"] == "running" and job["updated_at"] < cutoff]
+        for job in stale:
+            await self.update(job["id"], status="failed", error=ABANDONED, expires_at=_expires_at())
+        return stale
+
+    async def get(self, job_id):
+        return self.jobs.get(job_id)
+
+
+class MongoJobBackend:
+    """
+    Shared queue in the `backtest_jobs` collection, safe across API workers.
+    Queued and running jobs carry `active_key` (their dedupe key) under a
+    unique index, so racing identical submissions insert one job.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self._indexed = False
+
+    async def _ensure_indexes(self):
+        if not self._indexed:
+            await self.collection.create_index("id", unique=True)
+            await self.collection.create_index([("dedupe_key", 1), ("updated_at", -1)])
+            await self.collection.create_index([("status", 1), ("created_at", 1)])
+            await self.collection.create_index([("status", 1), ("updated_at", 1)])
+            await self.collection.create_index(
+                "active_key", unique=True, partialFilterExpression={"active_key": {"$exists": True}}
+            )
+            # Only finished jobs carry expires_at
+            await self.collection.create_index("expires_at", expireAfterSeconds=0)
+            self._indexed = True
+
+    async def _modify(self, query, update, **kwargs):
+        # Projection-free: mongomock (local mode) returns None for an _id-excluding
+        # projection combined with return_document
+        job = await self.collection.find_one_and_update(query, update, return_document=ReturnDocument.AFTER, **kwargs)
+        if job is not None:
+            job.pop("_id", None)
+        return job
+
+    async def submit(self, job):
+        await self._ensure_indexes()
+        existing = await self.collection.find_one(
+            {"dedupe_key": job["dedupe_key"]},
+            {"_id": 0},
+            sort=[("updated_at", -1)],
+        )
+        if existing:
+            existing["updated_at"] = existing["updated_at"].replace(tzinfo=timezone.utc)
+            if _is_duplicate(existing, _now()):
+                return existing, False
+        try:
+            await self.collection.insert_one({**job, "active_key": job["dedupe_key"]})
+        except DuplicateKeyError:
+            # Another worker inserted the same job first
+            existing = await self.collection.find_one({"active_key": job["dedupe_key"]}, {"_id": 0})
+            if existing is None:
+                raise
+            return existing, False
+        return job, True
+
+    async def claim(self):
+        await self._ensure_indexes()
+        return await self._modify(
+            {"status": "queued"},
+            {"$set": {"status": "running", "updated_at": _now()}},
+            sort=[("created_at", 1)],
+        )
+
+    async def update(self, job_id, **fields):
+        fields["updated_at"] = _now()
+        return await self._modify({"id": job_id}, {"$set": fields})
+
+    async def heartbeat(self, job_id):
+        await self.collection.update_one({"id": job_id, "status": "running"}, {"$set": {"updated_at": _now()}})
+
+    async def finish(self, job_id, **fields):
+        """Stores the outcome unless the job was reaped meanwhile; frees its dedupe key."""
+        fields.update(updated_at=_now(), expires_at=_expires_at())
+        return await self._modify(
+            {"id": job_id, "status": "running"},
+            {"$set": fields, "$unset": {"active_key": ""}},
+        )
+
+    async def reap(self, cutoff):
+        """Fails running jobs whose lease ran out; each is returned to exactly one caller."""
+        await self._ensure_indexes()
+        stale = []
+        while True:
+            job = await self._modify(
+                {"status": "running", "updated_at": {"$lt": cutoff}},
+                {"$set": {"status": "failed", "error": ABANDONED, "updated_at": _now(), "expires_at": _expires_at()},
+                 "$unset": {"active_key": ""}},
+            )
+            if job is None:
+                return stale
+            stale.append(job)
+
+    async def get(self, job_id):
+        return await self.collection.find_one({"id": job_id}, {"_id": 0})
+
+
+class JobQueue:
+    def __init__(self, backend, workers, on_failed=None, on_done=None):
+        self.backend = backend
+        self.workers = workers
+        # `await on_failed(job)` once per job that failed or was abandoned, e.g. to refund it
+        self.on_failed = on_failed
+        # `await on_done(job, result)` once per job whose result was stored
+        self.on_done = on_done
+        self._tasks = []
+        self._reaped_at = 0.0
+
+    async def submit(self, email, code, params, strategy_id=None):
+        """Enqueues a job; returns (job, created). Duplicates return the existing job."""
+        # A dead duplicate must not swallow the resubmission
+        await self.reap(force=True)
+        now = _now()
+        job = {
+            "id": str(uuid4()),
+            "email": email,
+            "strategy_id": strategy_id,
+            "code": code,
+            "code_hash": code_hash(code),
+            "params": params,
+            "dedupe_key": dedupe_key(email, code, *sorted(params.items())),
+            "status": "queued",
+            "progress": 0,
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        return await self.backend.submit(job)
+
+    async def get(self, job_id):
+        return await self.backend.get(job_id)
+
+    async def progress(self, job_id, progress):
+        await self.backend.update(job_id, progress=progress)
+
+    async def reap(self, force=False):
+        """Fails jobs with an expired lease, at most once per lease third unless forced."""
+        loop_time = asyncio.get_running_loop().time()
+        if not force and loop_time - self._reaped_at < BACKTEST_LEASE_SECONDS / 3:
+            return
+        self._reaped_at = loop_time
+        for job in await self.backend.reap(_lease_cutoff()):
+            print(f"Backtest job {job['id']} abandoned by its worker")
+            await self._notify(self.on_failed, job)
+
+    @staticmethod
+    async def _notify(callback, *args):
+        if callback is None:
+            return
+        try:
+            await callback(*args)
+        except Exception:
+            traceback.print_exc()
+
+    def start(self, handler):
+        """Starts worker tasks calling `await handler(queue, job)` for each job."""
+        for _ in range(self.workers - len(self._tasks)):
+            self._tasks.append(asyncio.create_task(self._work(handler)))
+
+    async def _heartbeat(self, job_id):
+        while True:
+            await asyncio.sleep(BACKTEST_LEASE_SECONDS / 3)
+            try:
+                await self.backend.heartbeat(job_id)
+            except Exception:
+                traceback.print_exc()
+
+    async def _work(self, handler):
+        while True:
+            try:
+                await self.reap()
+                job = await self.backend.claim()
+            except Exception:
+                # The queue store is unreachable; keep the worker alive and retry
+                traceback.print_exc()
+                await asyncio.sleep(BACKTEST_RETRY_SECONDS)
+                continue
+            if job is None:
+                await asyncio.sleep(BACKTEST_POLL_SECONDS)
+                continue
+
+            heartbeat = asyncio.create_task(self._heartbeat(job["id"]))
+            try:
+                result = await handler(self, job)
+                # None when the job was reaped meanwhile: it was already failed and refunded
+                if await self.backend.finish(job["id"], status="done", progress=100, result=result):
+                    await self._notify(self.on_done, job, result)
+            except Exception as e:
+                traceback.print_exc()
+                try:
+                    if await self.backend.finish(job["id"], status="failed", error=str(e)):
+                        await self._notify(self.on_failed, job)
+                except Exception:
+                    traceback.print_exc()
+            finally:
+                heartbeat.cancel()
+
+
+def make_backend(kind=BACKTEST_QUEUE):
+    if kind == "memory":
+        return InMemoryJobBackend()
+    from db_async import collection
+    return MongoJobBackend(collection("backtest_jobs"))
@@ -0,0 +1,127 @@
+import os
+import asyncio
+import traceback
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Non-POSIX dev machines: run without rlimits
+    resource = None
+
+# Bounded pool that runs user strategy code off the event loop. Each job runs
+# in its own short-lived process with CPU-time and memory rlimits and a
+# wall-clock timeout. At most BACKTEST_WORKERS jobs run at once; the rest
+# wait their turn.
+#
+# Job processes are forked from a fork server, never from the API process:
+# forking a multithreaded process with live pymongo/Motor clients can leave
+# the child stuck on a lock another thread held. The server is a fresh
+# interpreter that preloads BACKTEST_PRELOAD (the job functions with pandas,
+# NumPy and the compiled kernels), so jobs still start in milliseconds; their
+# arguments, the candle DataFrame included, are pickled.
+
+BACKTEST_WORKERS = int(os.getenv("BACKTEST_WORKERS", os.cpu_count() or 2))
+BACKTEST_CPU_SECONDS = int(os.getenv("BACKTEST_CPU_SECONDS", 60))
+BACKTEST_WALL_SECONDS = float(os.getenv("BACKTEST_WALL_SECONDS", 120))
+BACKTEST_MEMORY_MB = int(os.getenv("BACKTEST_MEMORY_MB", 1024))
+BACKTEST_PRELOAD = [m for m in os.getenv("BACKTEST_PRELOAD", "backtest_pool,backtest_tasks").split(",") if m]
+
+
+class BacktestError(Exception):
+    pass
+
+
+class BacktestTimeout(BacktestError):
+    pass
+
+
+def _vm_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def _apply_limits(cpu_seconds, memory_mb):
+    if resource is None:
+        return
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+    if memory_mb:
+        # The child already maps the fork server's preloaded modules, so the
+        # cap is on top of what it inherited.
+        limit = _vm_bytes() + memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _child(conn, fn, args, cpu_seconds, memory_mb):
+    try:
+        _apply_limits(cpu_seconds, memory_mb)
+        conn.send(("ok", fn(*args)))
+    except MemoryError:
+        conn.send(("error", "Strategy exceeded memory limit"))
+    except BaseException as e:
+        conn.send(("error", f"{e}\n{traceback.format_exc()}"))
+    finally:
+        conn.close()
+
+
+class BacktestPool:
+    def __init__(
+        self,
+        workers=BACKTEST_WORKERS,
+        cpu_seconds=BACKTEST_CPU_SECONDS,
+        wall_seconds=BACKTEST_WALL_SECONDS,
+        memory_mb=BACKTEST_MEMORY_MB,
+    ):
+        self.cpu_seconds = cpu_seconds
+        self.wall_seconds = wall_seconds
+        self.memory_mb = memory_mb
+        self._threads = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="backtest")
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            self._ctx = multiprocessing.get_context("forkserver")
+            self._ctx.set_forkserver_preload(BACKTEST_PRELOAD)
+        else:
+            self._ctx = multiprocessing.get_context("spawn")
+
+    def run_sync(self, fn, *args):
+        """Runs fn(*args) in a limited child process and returns its result."""
+        recv, send = self._ctx.Pipe(duplex=False)
+        proc = self._ctx.Process(
+            target=_child,
+            args=(send, fn, args, self.cpu_seconds, self.memory_mb),
+            daemon=True,
+        )
+        proc.start()
+        send.close()
+        try:
+            if not recv.poll(self.wall_seconds):
+                raise BacktestTimeout(f"Strategy exceeded {self.wall_seconds:g}s wall-clock limit")
+            try:
+                status, payload = recv.recv()
+            except EOFError:
+                # Killed before replying: SIGXCPU from RLIMIT_CPU or the OOM killer
+                raise BacktestTimeout(f"Strategy was killed (limit: {self.cpu_seconds}s CPU, {self.memory_mb} MB)")
+        finally:
+            if proc.is_alive():
+                proc.kill()
+            proc.join()
+            recv.close()
+
+        if status != "ok":
+            raise BacktestError(payload)
+        return payload
+
+    async def run(self, fn, *args):
+        """Awaits fn(*args) without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._threads, self.run_sync, fn, *args)
+
+    async def offload(self, fn, *args):
+        """Runs trusted blocking work (fetches, DB calls) on the loop's default executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, fn, *args)
+
+
+backtest_pool = BacktestPool()
@@ -0,0 +1,129 @@
+import numpy as np
+from metrics import score_trades, summarize
+from simulator import simulate, simulation_metrics, signals_from_trades
+from strategy_loader import load_strategy
+
+# Work the backtest pool runs in its child processes (backtest.py, sweep.py).
+# Kept free of FastAPI and database imports: the pool's fork server preloads
+# this module (see backtest_pool.py), and children must never hold a Mongo
+# client.
+
+MAINTENANCE_MARGIN = 0.004  # Binance's lowest USDT-M tier
+
+
+def evaluate_strategy(strategy, df, simulation=None, exits=None):
+    """
+    Runs user strategy code against df and scores it. Executed in a pool worker.
+    With `simulation` parameters the trades are replayed bar by bar with
+    bot.py semantics, fees, slippage and funding instead of summed as-is.
+    Otherwise `exits` (stop_loss/take_profit) cut trades short via the trade kernel.
+    """
+    exits = {} if simulation else (exits or {})
+    entry, exit, qty, entry_idx, exit_idx = load_strategy(strategy).trade_arrays(
+        df, exits.get("stop_loss") or 0.0, exits.get("take_profit") or 0.0
+    )
+
+    timestamps = df["timestamp"].to_numpy()
+    close = df["close"].to_numpy(dtype=np.float64)
+
+    if simulation:
+        # Replay the strategy's entries/exits through the live bot's decision logic
+        signals = signals_from_trades(entry_idx, exit_idx, len(df))
+        result = simulate(timestamps, close, signals, **simulation)
+        trades = result["trades"]
+        net_pnl = (trades["exit_price"] - trades["entry_price"]) * trades["qty"] - trades["fees"] - trades["funding"]
+        return {
+            "trade_history": np.round(net_pnl, 2).tolist(),
+            "metrics": simulation_metrics(result, timestamps),
+        }
+
+    metrics = score_trades(entry, exit, qty, timestamps, close, bars=(entry_idx, exit_idx))
+    return {
+        "trade_history": np.round(metrics["pnl"], 2).tolist(),
+        "metrics": summarize(metrics),
+    }
+
+
+def extract_trades(strategy, df):
+    """Runs the strategy once and returns its trades located on the bar grid."""
+    entry, exit, _, entry_idx, exit_idx = load_strategy(strategy).trade_arrays(df)
+    located = (entry_idx >= 0) & (exit_idx > entry_idx)
+    return entry_idx[located], exit_idx[located], entry[located], exit[located]
+
+
+def prepare_overlay(entry_idx, exit_idx, entry, high, low):
+    """
+    Precomputes, for every bar a trade is held after entry, the running
+    adverse (from lows) and favourable (from highs) excursion relative to the
+    entry price. Excursions are monotone within each trade, so they are
+    offset per trade into globally sorted keys searchable in one call.
+    """
+    lengths = exit_idx - entry_idx
+    seg = np.repeat(np.arange(len(entry_idx)), lengths)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1])) if len(lengths) else np.empty(0, np.int64)
+    bars = np.arange(len(seg)) - np.repeat(starts, lengths) + np.repeat(entry_idx + 1, lengths)
+
+    base = np.repeat(entry, lengths)
+    adverse = np.clip(1 - low[bars] / base, -1, 1)
+    favourable = np.clip(high[bars] / base - 1, -1, 1)
+
+    # Running max per trade: add a per-trade offset so one accumulate suffices
+    adverse = np.maximum.accumulate(adverse + seg * 4)
+    favourable = np.maximum.accumulate(favourable + seg * 4)
+    return {
+        "seg_offset": np.arange(len(entry_idx)) * 4,
+        "starts": starts,
+        "lengths": lengths,
+        "adverse": adverse,
+        "favourable": favourable,
+    }
+
+
+def liquidation_move(leverage):
+    """Adverse move (fraction of entry) at which an isolated long at `leverage` is liquidated."""
+    return max(1.0 / leverage - MAINTENANCE_MARGIN, 0.0)
+
+
+def apply_overlay(overlay, entry, exit, stop_loss, take_profit, stop_fill=None):
+    """
+    Returns exit prices after applying SL/TP to every trade (SL wins ties,
+    like bot.py) and which trades were stopped. Stopped trades exit at a
+    loss of `stop_fill` (default: stop_loss).
+    """
+    starts, lengths = overlay["starts"], overlay["lengths"]
+    sl_hit = np.searchsorted(overlay["adverse"], overlay["seg_offset"] + stop_loss, side="left") - starts
+    tp_hit = np.searchsorted(overlay["favourable"], overlay["seg_offset"] + take_profit, side="left") - starts
+
+    sl_hit = np.where(sl_hit < lengths, sl_hit, np.iinfo(np.int64).max)
+    tp_hit = np.where(tp_hit < lengths, tp_hit, np.iinfo(np.int64).max)
+
+    exit_price = exit.copy()
+    by_tp = tp_hit < sl_hit
+    by_sl = (sl_hit <= tp_hit) & (sl_hit < np.iinfo(np.int64).max)
+    exit_price[by_tp] = entry[by_tp] * (1 + take_profit)
+    exit_price[by_sl] = entry[by_sl] * (1 - (stop_loss if stop_fill is None else stop_fill))
+    return exit_price, by_sl
+
+
+def evaluate_combinations(overlay, entry, exit, combinations, amount):
+    """Scores (stop_loss, take_profit, leverage) combinations. Runs in a pool worker."""
+    rows = []
+    for stop_loss, take_profit, leverage in combinations:
+        liquidation = liquidation_move(leverage)
+        if liquidation < stop_loss:
+            # Liquidated before the stop is reached: the margin is gone
+            exit_price, liquidated = apply_overlay(
+                overlay, entry, exit, liquidation, take_profit, stop_fill=1.0 / leverage
+            )
+        else:
+            exit_price, _ = apply_overlay(overlay, entry, exit, stop_loss, take_profit)
+            liquidated = ()
+        qty = amount * leverage / entry
+        rows.append({
+            "stop_loss": stop_loss,
+            "take_profit": take_profit,
+            "leverage": leverage,
+            "liquidations": int(np.count_nonzero(liquidated)),
+            **summarize(score_trades(entry, exit_price, qty)),
+        })
+    return rows
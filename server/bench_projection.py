@@ -0,0 +1,86 @@
+import os
+import time
+import uuid
+import argparse
+import bson
+from db import client, MONGO_DB, USER_FIELDS
+
+# Compares what the API used to read (whole user document with every
+# strategy embedded) against projected reads and the strategies collection.
+# Works on a throwaway database next to MONGO_DB, which is dropped afterwards.
+#
+#   python bench_projection.py --users 50 --strategies 40 --reads 500
+
+
+def make_strategy(i, code_size, loss_reasons):
+    return {
+        "id": str(uuid.uuid4()),
+        "name": f"Strategy {i}",
+        "input": "Buy BTC when EMA 20 crosses above EMA 50 on 15m with 10x leverage and $500",
+        "code": "x" * code_size,
+        "symbol": "BTC/USDT",
+        "timeframe": "15m",
+        "amount": 500,
+        "leverage": 10,
+        "stop_loss": 0.02,
+        "take_profit": 0.05,
+        "status": "running" if i % 3 == 0 else "stopped",
+        "loss_reasons": [{"reason": "r" * 200, "pnl": -1.5} for _ in range(loss_reasons)],
+    }
+
+
+def bench(name, fn, reads):
+    transferred = 0
+    start = time.perf_counter()
+    for i in range(reads):
+        doc = fn(i)
+        transferred += len(bson.encode(doc)) if doc else 0
+    elapsed = time.perf_counter() - start
+    print(f"{name:<34} {transferred / reads / 1024:>10.1f} KB/read {elapsed / reads * 1000:>8.2f} ms/read")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--strategies", type=int, default=40)
+    parser.add_argument("--code-size", type=int, default=4000)
+    parser.add_argument("--loss-reasons", type=int, default=20)
+    parser.add_argument("--reads", type=int, default=500)
+    args = parser.parse_args()
+
+    bench_db = client[f"{MONGO_DB}_bench_{os.getpid()}"]
+    users, strategies = bench_db["user"], bench_db["strategies"]
+    try:
+        emails = [f"user{u}@bench.local" for u in range(args.users)]
+        picks = []
+        for email in emails:
+            strats = [make_strategy(i, args.code_size, args.loss_reasons) for i in range(args.strategies)]
+            users.insert_one({"email": email, "credits": 10, "backtest": 10, "copilot": 100,
+                              "plan": "PRO", "engine": True, "binance": {"apiKey": "k", "apiSecret": "s"},
+                              "strategies": strats})
+            strategies.insert_many([{**s, "_id": s["id"], "email": email} for s in strats])
+            picks.append((email, strats[len(strats) // 2]["id"]))
+        users.create_index("email", unique=True)
+        users.create_index("strategies.id")
+        strategies.create_index("email")
+
+        print(f"{args.users} users x {args.strategies} strategies, {args.reads} reads each\n")
+        bench("full user document", lambda i: users.find_one({"email": emails[i % len(emails)]}), args.reads)
+        bench("credits projection", lambda i: users.find_one(
+            {"email": emails[i % len(emails)]}, dict.fromkeys(USER_FIELDS["credits"], 1)), args.reads)
+        bench("user without strategies", lambda i: users.find_one(
+            {"email": emails[i % len(emails)]}, {"strategies": 0}), args.reads)
+        bench("one strategy, embedded ($)", lambda i: users.find_one(
+            {"email": picks[i % len(picks)][0], "strategies.id": picks[i % len(picks)][1]},
+            {"strategies.$": 1}), args.reads)
+        bench("one strategy, collection", lambda i: strategies.find_one(
+            {"_id": picks[i % len(picks)][1], "email": picks[i % len(picks)][0]}, {"_id": 0}), args.reads)
+        bench("bot state fields, collection", lambda i: strategies.find_one(
+            {"_id": picks[i % len(picks)][1], "email": picks[i % len(picks)][0]},
+            {"_id": 0, "demo_pos": 1, "demo_entry": 1, "demo_pnl": 1, "status": 1}), args.reads)
+    finally:
+        client.drop_database(bench_db.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+import ast
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from strategy_loader import LoadedStrategy
+from vectorized import rewrite_row_access
+from trade_kernel import generate_trades, _walk_jit
+
+# Runs the same strategies three ways on synthetic candles and checks they
+# produce identical trades:
+#   loop      generated row-loop run_strategy as the model writes it
+#   numpy     the same loop with df[col].iloc[i] reads rewritten to arrays
+#   signals   the equivalent signals(df) form, trades built by the engine
+# then times the trade kernel with SL/TP exits, compiled (Numba, if
+# installed) against the plain Python bar walk.
+#
+#   python bench_strategies.py --rows 20000 --repeat 3 --stop-loss 0.01 --take-profit 0.02
+
+EMA_LOOP = """
+def run_strategy(df):
+    df['ema'] = df['close'].ewm(span=20).mean()
+    trades = []
+    open_trade = None
+    latest_signal = "HOLD"
+    for i in range(len(df)):
+        price = df['close'].iloc[i]
+        if open_trade is None:
+            if price > df['ema'].iloc[i]:
+                open_trade = {'entry_price': price, 'qty': 1}
+                if i == len(df)-1: latest_signal = "BUY"
+        else:
+            if price < df['ema'].iloc[i]:
+                trades.append({'entry_price': open_trade['entry_price'], 'exit_price': price, 'qty': 1})
+                open_trade = None
+                if i == len(df)-1: latest_signal = "SELL"
+    if open_trade:
+        trades.append({'entry_price': open_trade['entry_price'], 'exit_price': df['close'].iloc[-1], 'qty': 1})
+    return trades, latest_signal
+"""
+
+EMA_SIGNALS = """
+def signals(df):
+    ema = df['close'].ewm(span=20).mean()
+    return df['close'] > ema, df['close'] < ema
+"""
+
+CROSS_RSI_LOOP = """
+def run_strategy(df):
+    df['fast'] = df['close'].ewm(span=20).mean()
+    df['slow'] = df['close'].ewm(span=50).mean()
+    delta = df['close'].diff()
+    gain = delta.clip(lower=0).rolling(14).mean()
+    loss = (-delta.clip(upper=0)).rolling(14).mean()
+    df['rsi'] = 100 - 100 / (1 + gain / loss)
+    trades = []
+    open_trade = None
+    latest_signal = "HOLD"
+    for i in range(1, len(df)):
+        price = df['close'].iloc[i]
+        if open_trade is None:
+            if df['fast'].iloc[i] > df['slow'].iloc[i] and df['fast'].iloc[i-1] <= df['slow'].iloc[i-1] and df['rsi'].iloc[i] < 70:
+                open_trade = {'entry_price': price, 'qty': 1}
+                if i == len(df)-1: latest_signal = "BUY"
+        else:
+            if df['fast'].iloc[i] < df['slow'].iloc[i] or df['rsi'].iloc[i] > 80:
+                trades.append({'entry_price': open_trade['entry_price'], 'exit_price': price, 'qty': 1})
+                open_trade = None
+                if i == len(df)-1: latest_signal = "SELL"
+    if open_trade:
+        trades.append({'entry_price': open_trade['entry_price'], 'exit_price': df['close'].iloc[-1], 'qty': 1})
+    return trades, latest_signal
+"""
+
+CROSS_RSI_SIGNALS = """
+def signals(df):
+    fast = df['close'].ewm(span=20).mean()
+    slow = df['close'].ewm(span=50).mean()
+    delta = df['close'].diff()
+    gain = delta.clip(lower=0).rolling(14).mean()
+    loss = (-delta.clip(upper=0)).rolling(14).mean()
+    rsi = 100 - 100 / (1 + gain / loss)
+    cross_up = (fast > slow) & (fast.shift(1) <= slow.shift(1))
+    return cross_up & (rsi < 70), (fast < slow) | (rsi > 80)
+"""
+
+BOLLINGER_LOOP = """
+def run_strategy(df):
+    df['mid'] = df['close'].rolling(20).mean()
+    df['lower'] = df['mid'] - 2 * df['close'].rolling(20).std()
+    trades = []
+    open_trade = None
+    latest_signal = "HOLD"
+    for i in range(len(df)):
+        price = df['close'].iloc[i]
+        if open_trade is None:
+            if price < df['lower'].iloc[i]:
+                open_trade = {'entry_price': price, 'qty': 1}
+                if i == len(df)-1: latest_signal = "BUY"
+        else:
+            if price > df['mid'].iloc[i]:
+                trades.append({'entry_price': open_trade['entry_price'], 'exit_price': price, 'qty': 1})
+                open_trade = None
+                if i == len(df)-1: latest_signal = "SELL"
+    if open_trade:
+        trades.append({'entry_price': open_trade['entry_price'], 'exit_price': df['close'].iloc[-1], 'qty': 1})
+    return trades, latest_signal
+"""
+
+BOLLINGER_SIGNALS = """
+def signals(df):
+    mid = df['close'].rolling(20).mean()
+    lower = mid - 2 * df['close'].rolling(20).std()
+    return df['close'] < lower, df['close'] > mid
+"""
+
+STRATEGIES = {
+    "ema": (EMA_LOOP, EMA_SIGNALS),
+    "ema cross + rsi": (CROSS_RSI_LOOP, CROSS_RSI_SIGNALS),
+    "bollinger reversion": (BOLLINGER_LOOP, BOLLINGER_SIGNALS),
+}
+
+
+def make_candles(rows, seed=7):
+    rng = np.random.default_rng(seed)
+    close = 30000 * np.exp(np.cumsum(rng.normal(0, 0.002, rows)))
+    spread = close * rng.uniform(0, 0.003, rows)
+    return pd.DataFrame({
+        "timestamp": np.arange(rows, dtype=np.int64) * 60_000,
+        "open": np.roll(close, 1),
+        "high": close + spread,
+        "low": close - spread,
+        "close": close,
+        "volume": rng.uniform(1, 100, rows),
+    })
+
+
+def loaded(tree, defined):
+    return LoadedStrategy("bench", compile(tree, "<strategy>", "exec"), defined)
+
+
+def bench(strategy, df, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        frame = df.copy()
+        start = time.perf_counter()
+        entry, exit, _, _, _ = strategy.trade_arrays(frame)
+        best = min(best, time.perf_counter() - start)
+    return best, entry, exit
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--stop-loss", type=float, default=0.01)
+    parser.add_argument("--take-profit", type=float, default=0.02)
+    args = parser.parse_args()
+
+    df = make_candles(args.rows)
+    print(f"{args.rows} candles, best of {args.repeat}\n")
+    print(f"{'strategy':<22} {'loop':>10} {'numpy':>10} {'signals':>10} {'trades':>8}  match")
+    for name, (loop_source, signals_source) in STRATEGIES.items():
+        tree = ast.parse(loop_source)
+        fast_tree = rewrite_row_access(tree)
+        loop_time, entry, exit = bench(loaded(tree, {"run_strategy"}), df, args.repeat)
+        fast_time, fast_entry, fast_exit = bench(loaded(fast_tree, {"run_strategy"}), df, args.repeat)
+        sig_time, sig_entry, sig_exit = bench(loaded(ast.parse(signals_source), {"signals"}), df, args.repeat)
+        match = all(
+            np.array_equal(a, b)
+            for a, b in ((entry, fast_entry), (exit, fast_exit), (entry, sig_entry), (exit, sig_exit))
+        )
+        print(f"{name:<22} {loop_time * 1000:>8.1f}ms {fast_time * 1000:>8.1f}ms {sig_time * 1000:>8.1f}ms "
+              f"{len(entry):>8}  {'yes' if match else 'NO'}")
+
+    print(f"\ntrade kernel, SL {args.stop_loss:.1%} TP {args.take_profit:.1%}"
+          f"{'' if _walk_jit else ' (numba not installed)'}\n")
+    print(f"{'strategy':<22} {'jit':>10} {'python':>10} {'trades':>8}  match")
+    close, high, low = (df[col].to_numpy() for col in ("close", "high", "low"))
+    for name, (_, signals_source) in STRATEGIES.items():
+        namespace = loaded(ast.parse(signals_source), {"signals"}).namespace()
+        entry, exit = (np.asarray(s, dtype=bool) for s in namespace["signals"](df.copy()))
+        timings, results = [], []
+        for jit in (True, False):
+            best = float("inf")
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                trades = generate_trades(entry, exit, close, high, low, args.stop_loss, args.take_profit, jit=jit)
+                best = min(best, time.perf_counter() - start)
+            timings.append(best)
+            results.append(trades)
+        match = all(np.array_equal(results[0][key], results[1][key]) for key in results[0])
+        print(f"{name:<22} {timings[0] * 1000:>8.1f}ms {timings[1] * 1000:>8.1f}ms "
+              f"{len(results[0]['entry_idx']):>8}  {'yes' if match else 'NO'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,49 +1,58 @@
 from fastapi import APIRouter, HTTPException, Form
-from pydantic import BaseModel
-import pandas as pd
 import ccxt
+import asyncio
 import traceback
-from db import users_collection
+from db_async import update_user, get_user, get_binance, user_exists
+from exchange_pool import exchange_pool
 
 router = APIRouter()
 
+def fetch_futures_balance(exchange):
+    """
+    (wallet, available, unrealized PnL) in USDT. Futures fetch_balance() reads
+    the account endpoint, whose response already lists open positions with
+    their unrealized PnL, so positions are only fetched when it lacks them.
+    """
+    balance = exchange.fetch_balance()
+    usdt_data = balance.get('USDT', {})
+    wallet_cash = usdt_data.get('total') or 0.0
+    available_cash = usdt_data.get('free') or 0.0
+
+    positions = (balance.get('info') or {}).get('positions')
+    if isinstance(positions, list):
+        total_unrealized_pnl = sum(float(pos.get('unrealizedProfit') or 0.0) for pos in positions)
+    else:
+        # Live PnL from active positions
+        total_unrealized_pnl = sum(float(pos.get('unrealizedPnl') or 0.0) for pos in exchange.fetch_positions())
+    return wallet_cash, available_cash, total_unrealized_pnl
+
+
+def _balance(binance_creds):
+    with exchange_pool.client(
+        binance_creds.get("apiKey"), binance_creds.get("apiSecret"), binance_creds.get("demo")
+    ) as exchange:
+        return fetch_futures_balance(exchange)
+
+
+def _validate_keys(api_key, api_secret, demo):
+    # fetch_balance() requires a valid signature; the client stays pooled for the dashboard
+    with exchange_pool.client(api_key, api_secret, demo) as exchange:
+        exchange.fetch_balance()
+
+
 @router.post("/api/balance")
 async def get_balance(email: str = Form(...)):
-    user = users_collection.find_one({"email": email})
-    if not user:
+    binance_creds = await get_binance(email)
+    if binance_creds is None:
         raise HTTPException(status_code=404, detail="User not found")
 
-    binance_creds = user.get("binance")
     if not binance_creds or not binance_creds.get("apiKey"):
         raise HTTPException(status_code=400, detail="Binance API keys not configured")
 
     try:
-        exchange = ccxt.binance({
-            'apiKey': binance_creds.get("apiKey"),
-            'secret': binance_creds.get("apiSecret"),
-            'enableRateLimit': True,
-            'options': {'defaultType': 'future'},
-        })
-
-        if binance_creds.get("demo"):
-            exchange.enable_demo_trading(True)
-
-        # 1. Fetch General Balance
-        balance = exchange.fetch_balance()
-        usdt_data = balance.get('USDT', {})
-        wallet_cash = usdt_data.get('total', 0.0)
-        available_cash = usdt_data.get('free', 0.0)
-
-        # 2. Fetch Unrealized PnL from active positions (THE FIX)
-        # This gets the live PnL for your -0.005 BTC short
-        positions = exchange.fetch_positions()
-        total_unrealized_pnl = 0.0
-        
-        for pos in positions:
-            pnl = float(pos.get('unrealizedPnl', 0.0))
-            total_unrealized_pnl += pnl
+        # Pooled client with cached markets: one signed request per poll
+        wallet_cash, available_cash, total_unrealized_pnl = await asyncio.to_thread(_balance, binance_creds)
 
-        # 3. Calculate Real Equity
         # Equity = Your Cash + Your Live Profit/Loss
         equity = wallet_cash + total_unrealized_pnl
 
@@ -52,7 +61,7 @@ async def get_balance(email: str = Form(...)):
             "wallet_balance": round(wallet_cash, 2),
             "available_balance": round(available_cash, 2),
             "equity": round(equity, 2),
-            "unrealized_pnl": round(total_unrealized_pnl, 2), # This will now show -0.78
+            "unrealized_pnl": round(total_unrealized_pnl, 2),
             "currency": "USDT"
         }
 
@@ -67,35 +76,22 @@ async def autocomplete(
     apiSecret: str = Form(...), 
     isDemo: bool = Form(...), 
 ):
-    # 1. Initialize the Binance client
-    exchange = ccxt.binance({
-        'apiKey': apiKey,
-        'secret': apiSecret,
-        'enableRateLimit': True,
-        'options': {'defaultType': 'future'},
-    })
-
-    if isDemo:
-        exchange.enable_demo_trading(True)
-
+    # 1. Validate credentials by calling a private endpoint
     try:
-        # 2. Validate credentials by calling a private endpoint
-        # fetch_balance() requires a valid signature
-        exchange.fetch_balance()
-        
+        await asyncio.to_thread(_validate_keys, apiKey, apiSecret, isDemo)
+
     except ccxt.AuthenticationError:
         raise HTTPException(status_code=401, detail="Invalid Binance API Key or Secret")
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Could not connect to Binance: {str(e)}")
 
-    # 3. If validation passes, proceed to database update
+    # 2. If validation passes, proceed to database update
     try:
-        user = users_collection.find_one({"email": email})
-        if not user:
+        if not await user_exists(email):
             raise HTTPException(status_code=404, detail="User not found")
 
-        users_collection.update_one(
-            {"email": email},
+        await update_user(
+            email,
             {
                 "$set": {
                     "binance": {
@@ -118,7 +114,7 @@ async def set_engine(
     toggle: bool = Form(...)
 ):
     try:
-        user = users_collection.find_one({"email": email})
+        user = await get_user(email, ["terminal"])
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
 
@@ -128,8 +124,8 @@ async def set_engine(
         if toggle is True and terminal is not True:
             raise HTTPException(status_code=403, detail="Terminal must be ON before enabling engine")
 
-        users_collection.update_one(
-            {"email": email},
+        await update_user(
+            email,
             {"$set": {"engine": toggle}}
         )
 
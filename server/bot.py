@@ -1,13 +1,20 @@
 import os
 import time
+import threading
 import traceback
-import ccxt
-import pandas as pd
-import numpy as np
 import json
 from datetime import datetime
-from db import users_collection
+from db import find_strategy, update_strategy
+from quota import reserve_sync, refund_sync
 from openai import OpenAI
+from decision import check_sl_tp, signal_actions, SIGNALS, HOLD
+from incremental import CandleBuffer, IncrementalRunner
+from scheduler import CandleScheduler
+from market_feed import MarketFeed
+from market_hub import HubFeed
+from strategy_state import StateStore
+from strategy_loader import load_strategy, ENTRY_POINTS
+from exchange_pool import create_exchange, exchange_pool
 
 # --- Configuration ---
 EMAIL = os.getenv("EMAIL")
@@ -18,8 +25,12 @@ STRATEGY_ID = os.getenv("STRATEGY_ID")
 STRATEGY_CODE = os.getenv("STRATEGY_CODE")
 SYMBOL = os.getenv("SYMBOL", "BTC/USDT")
 TIMEFRAME = os.getenv("TIMEFRAME", "1m")
-AMOUNT = float(os.getenv("AMOUNT", 100)) 
+AMOUNT = float(os.getenv("AMOUNT", 100))
 LEVERAGE = int(os.getenv("LEVERAGE", 5))
+CANDLE_BUFFER = int(os.getenv("CANDLE_BUFFER", 500))
+CANDLE_CLOSE_DELAY = float(os.getenv("CANDLE_CLOSE_DELAY", 2))
+SLTP_INTERVAL = float(os.getenv("SLTP_INTERVAL", 60))
+MARKET_FEED = os.getenv("MARKET_FEED", "rest")
 
 # Stop Loss / Take Profit
 STOP_LOSS = float(os.getenv("STOP_LOSS", 0.02))
@@ -27,327 +38,464 @@ TAKE_PROFIT = float(os.getenv("TAKE_PROFIT", 0.05))
 
 openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-# --- Exchange Initialization (Live Futures) ---
-exchange = ccxt.binance({
-    'apiKey': API_KEY,
-    'secret': API_SECRET,
-    'enableRateLimit': True,
-    'options': {'defaultType': 'future'}
-})
 
-if DEMO:
-    exchange.enable_demo_trading(True)
-
-DB_PREFIX = "live" if DEMO else "demo"
-
-# --- Helper Functions ---
-
-def analyze_and_optimize_loss(trade_data, strategy_df):
+class StrategyBot:
     """
-    Analyzes the loss using gpt-4o-mini and updates the strategy in the DB.
-    Triggered only on trade completion if result is a loss.
+    One deployed strategy. Runs either as the whole process (python bot.py,
+    one container per strategy) or as one of many bots hosted by runner.py,
+    which shares the exchange client and market feed between them.
     """
-    try:
-        user = users_collection.find_one({"email": EMAIL})
-        if user.get("credits", 0) < 1:
-            log_error_to_db("Insufficient credits")
-            return
-
-        # Prepare a small data snapshot for context (last 10 candles)
-        recent_market_context = strategy_df.tail(10).to_dict(orient='records')
-        
-        prompt = f"""
-        Analyze this losing trade and optimize the FULL strategy including risk parameters (if needed).
-
-        Current Parameters:
-        - Leverage: {LEVERAGE}x
-        - Stop Loss: {STOP_LOSS*100}%
-        - Take Profit: {TAKE_PROFIT*100}%
-        - Symbol: {SYMBOL} | Timeframe: {TIMEFRAME}
-        
-        Trade Details:
-        - Side: {trade_data['side']}
-        - Entry: {trade_data['entry']} | Exit: {trade_data['exit']}
-        - Calculated PnL: {trade_data['pnl']}
-        - Market Snapshot: {json.dumps(recent_market_context)}
-
-        Current Strategy Code:
-        {STRATEGY_CODE}
-
-        STRICT RULES:
-        1. Output ONLY the function `def run_strategy(df):`. No markdown, no backticks, no comments.
-        2. Use 'pd' for pandas and 'np' for numpy.
-        3. The function MUST return: `trades` (a list of dicts) and `latest_signal` (a string).
-        4. Trade Dictionary Format: 
-        - Each trade MUST be: {{'entry_price': float, 'exit_price': float, 'qty': 1}}
-        5. latest_signal: "BUY" (if current candle meets entry), "SELL" (if in trade and exit met), or "HOLD".
-
-        ENVIRONMENT:
-        - df columns: ['timestamp', 'open', 'high', 'low', 'close', 'volume']
-        - All price columns are already floats.
-
-        EXAMPLE STRUCTURE:
-        def run_strategy(df):
-            df['ema'] = df['close'].ewm(span=20).mean()
-            trades = []
-            open_trade = None
-            latest_signal = "HOLD"
-            for i in range(len(df)):
-                price = df['close'].iloc[i]
-                if open_trade is None:
-                    if price > df['ema'].iloc[i]: # Entry Logic
-                        open_trade = {{'entry_price': price, 'qty': 1}}
-                        if i == len(df)-1: latest_signal = "BUY"
-                else:
-                    if price < df['ema'].iloc[i]: # Exit Logic
-                        trades.append({{'entry_price': open_trade['entry_price'], 'exit_price': price, 'qty': 1}})
-                        open_trade = None
-                        if i == len(df)-1: latest_signal = "SELL"
-            if open_trade:
-                trades.append({{'entry_price': open_trade['entry_price'], 'exit_price': df['close'].iloc[-1], 'qty': 1}})
-            return trades, latest_signal
-
-                Instructions:
-                1. Identify the likely reason for the loss in one short sentence.
-                2. Rewrite the 'def run_strategy(df)' function to be more robust against this specific scenario.
-                3. Suggest better Stop Loss ex. (0.02, 0.05), Take Profit ex. (0.05, 0.10), and Leverage values ex. (1, 125).
-                NOTE: strategy will be apply in binance using ccxt.
-
-                Respond ONLY with a JSON object in this format:
-                {{
-                "reason": "short explanation",
-                "optimized_code": "full updated STRATEGY_CODE here",
-                "new_stop_loss": float, 
-                "new_take_profit": float,
-                "new_leverage": int
-                }}
-                """
-
-        response = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a quantitative trading auditor."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"}
-        )
-        
-        analysis = json.loads(response.choices[0].message.content)
 
-        users_collection.update_one(
-            {"email": EMAIL},
-            {"$inc": {"credits": -1}}
-        )
+    def __init__(self, email, strategy_id, code, symbol, timeframe, amount, leverage,
+                 stop_loss, take_profit, demo, exchange, market_feed=None, log_prefix="", state_store=None):
+        self.email = email
+        self.strategy_id = strategy_id
+        self.code = code
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.amount = float(amount)
+        self.leverage = int(leverage)
+        self.stop_loss = float(stop_loss)
+        self.take_profit = float(take_profit)
+        self.demo = demo
+        self.db_prefix = "live" if demo else "demo"
+        self.exchange = exchange
+        # Optional streamed (ws) or hub-shared candles instead of REST polling
+        self.market_feed = market_feed
+        self.log_prefix = log_prefix
+        # Position state lives in memory; the owner of the store flushes it
+        self.state_store = state_store or StateStore()
+        self.state = None
+
+        self.buffer = CandleBuffer(CANDLE_BUFFER)
+        self.runner = None
+        self.run_strategy = None
+        self.scheduler = CandleScheduler(timeframe, close_delay=CANDLE_CLOSE_DELAY, sltp_interval=SLTP_INTERVAL)
+        self.in_position = True
+        # Set by stop() or once /api/stop or /api/squareoff is seen; no order is placed after it
+        self.stopped = threading.Event()
+
+    def log(self, message):
+        print(f"{self.log_prefix}{message}")
+
+    # --- Helper Functions ---
+
+    def analyze_and_optimize_loss(self, trade_data, strategy_df):
+        """
+        Analyzes the loss using gpt-4o-mini and updates the strategy in the DB.
+        Triggered only on trade completion if result is a loss.
+        """
+        reserved = False
+        try:
+            # Reserve the credit atomically; refunded below if the analysis fails
+            if reserve_sync(self.email, "credits") is None:
+                self.log_error_to_db("Insufficient credits")
+                return
+            reserved = True
+
+            # Prepare a small data snapshot for context (last 10 candles)
+            recent_market_context = strategy_df.tail(10).to_dict(orient='records')
+
+            prompt = f"""
+            Analyze this losing trade and optimize the FULL strategy including risk parameters (if needed).
+
+            Current Parameters:
+            - Leverage: {self.leverage}x
+            - Stop Loss: {self.stop_loss*100}%
+            - Take Profit: {self.take_profit*100}%
+            - Symbol: {self.symbol} | Timeframe: {self.timeframe}
         
-        # Save loss reason to array and update strategy code in DB
-        users_collection.update_one(
-            {"email": EMAIL, "strategies.id": STRATEGY_ID},
-            {
+            Trade Details:
+            - Side: {trade_data['side']}
+            - Entry: {trade_data['entry']} | Exit: {trade_data['exit']}
+            - Calculated PnL: {trade_data['pnl']}
+            - Market Snapshot: {json.dumps(recent_market_context)}
+
+            Current Strategy Code:
+            {self.code}
+
+            STRICT RULES:
+            1. Output ONLY the function `def signals(df):`. No markdown, no backticks, no comments.
+            2. Use 'pd' for pandas, 'np' for numpy and 'ind' for indicators (shared and cached, prefer them):
+               ind.ema(df, span), ind.sma(df, window), ind.std(df, window), ind.rsi(df, period),
+               ind.atr(df, period), ind.highest(df, window), ind.lowest(df, window),
+               ind.macd(df, fast, slow, signal) -> (macd, signal, hist), ind.bollinger(df, window, k) -> (mid, upper, lower).
+            3. The function MUST return two boolean Series aligned with df: `entry` and `exit`.
+            - entry: True on candles where a long position should be opened.
+            - exit: True on candles where an open position should be closed.
+            4. Use vectorized pandas/numpy operations only. No loops over rows, no `.iloc[i]`.
+            5. The engine opens and closes the trades from these signals; do not build trade lists.
+
+            ENVIRONMENT:
+            - df columns: ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+            - All price columns are already floats.
+
+            EXAMPLE STRUCTURE:
+            def signals(df):
+                ema = ind.ema(df, 20)
+                entry = df['close'] > ema # Entry Logic
+                exit = df['close'] < ema # Exit Logic
+                return entry, exit
+
+                    Instructions:
+                    1. Identify the likely reason for the loss in one short sentence.
+                    2. Rewrite the strategy as a 'def signals(df)' function that is more robust against this specific scenario.
+                    3. Suggest better Stop Loss ex. (0.02, 0.05), Take Profit ex. (0.05, 0.10), and Leverage values ex. (1, 125).
+                    NOTE: strategy will be apply in binance using ccxt.
+
+                    Respond ONLY with a JSON object in this format:
+                    {{
+                    "reason": "short explanation",
+                    "optimized_code": "full updated STRATEGY_CODE here",
+                    "new_stop_loss": float, 
+                    "new_take_profit": float,
+                    "new_leverage": int
+                    }}
+                    """
+
+            response = openai_client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": "You are a quantitative trading auditor."},
+                    {"role": "user", "content": prompt}
+                ],
+                response_format={"type": "json_object"}
+            )
+
+            analysis = json.loads(response.choices[0].message.content)
+
+            # Save loss reason to array and update strategy code in DB
+            update_strategy(self.email, self.strategy_id, {
                 "$push": {
-                    "strategies.$.loss_reasons": {
+                    "loss_reasons": {
                         "reason": analysis.get("reason"),
                         "pnl": trade_data['pnl'],
                         "timestamp": datetime.now()
                     }
                 },
                 "$set": {
-                    "strategies.$.strategy_code": analysis.get("optimized_code"),
-                    "strategies.$.last_optimization": datetime.now()
-                }
-            }
-        )
-        print(f"✅ AI Analysis: {analysis.get('reason')}")
-        print("🛠️ Strategy code updated in DB to prevent recurring loss.")
-        
-    except Exception as e:
-        print(f"⚠️ GPT Optimization Error: {e}")
-
-def sync_exchange_data():
-    """Fetches the REAL truth from the exchange."""
-    try:
-        positions = exchange.fetch_positions([SYMBOL])
-        raw_symbol = SYMBOL.replace("/", "")
-        symbol_pos = next((p for p in positions if p['symbol'] == raw_symbol), None)
-        
-        if symbol_pos:
-            signed_pos = float(symbol_pos['info']['positionAmt'])
-            entry_price = float(symbol_pos['entryPrice'] or 0.0)
-            unrealized_pnl = float(symbol_pos['unrealizedPnl'] or 0.0)
-            
-            return {
-                "pos": signed_pos,
-                "entry": entry_price,
-                "unpnl": unrealized_pnl
-            }
-    except Exception as e:
-        print(f"⚠️ Exchange Sync Error: {e}")
-    return None
-
-def get_strategy_state():
-    user = users_collection.find_one({"email": EMAIL, "strategies.id": STRATEGY_ID})
-    if user:
-        for strat in user.get('strategies', []):
-            if strat['id'] == STRATEGY_ID:
-                return {
-                    "pos": float(strat.get(f'{DB_PREFIX}_pos', 0.0)),
-                    "entry": float(strat.get(f'{DB_PREFIX}_entry', 0.0)),
-                    "total_pnl": float(strat.get(f'{DB_PREFIX}_pnl', 0.0))
+                    "strategy_code": analysis.get("optimized_code"),
+                    "last_optimization": datetime.now()
                 }
-    return {"pos": 0.0, "entry": 0.0, "total_pnl": 0.0}
-
-def update_strategy_state(pos, entry=0.0, pnl_inc=0.0, unpnl=0.0):
-    """Updates DB with both realized (inc) and unrealized (set) PnL."""
-    users_collection.update_one(
-        {"email": EMAIL, "strategies.id": STRATEGY_ID},
-        {
-            "$set": {
-                f"strategies.$.{DB_PREFIX}_pos": pos,
-                f"strategies.$.{DB_PREFIX}_entry": entry,
-                f"strategies.$.{DB_PREFIX}_unrealized_pnl": unpnl,
-                "strategies.$.status": "running",
-                "strategies.$.last_update": datetime.now(),
-            },
-            "$inc": {f"strategies.$.{DB_PREFIX}_pnl": pnl_inc}
-        }
-    )
-
-def calculate_dynamic_qty(price):
-    try:
-        raw_qty = (AMOUNT * LEVERAGE) / price
-        return float(exchange.amount_to_precision(SYMBOL, raw_qty))
-    except Exception as e:
-        print(f"⚠️ Qty Calculation Error: {e}")
-        return 0.0
-
-def fetch_data():
-    bars = exchange.fetch_ohlcv(SYMBOL, TIMEFRAME)
-    df = pd.DataFrame(bars, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-    df[["open", "high", "low", "close", "volume"]] = df[["open", "high", "low", "close", "volume"]].astype(float)
-    return df
-
-def log_error_to_db(error_msg):
-    try:
-        users_collection.update_one(
-            {"email": EMAIL, "strategies.id": STRATEGY_ID},
-            { "$set": {"strategies.$.status": "error", "strategies.$.last_error": str(error_msg), "strategies.$.error_at": datetime.now()}}
-        )
-    except Exception as db_e:
-        print(f"🔥 Database Error: {db_e}")
+            })
+            self.log(f"✅ AI Analysis: {analysis.get('reason')}")
+            self.log("🛠️ Strategy code updated in DB to prevent recurring loss.")
 
-def main():
-    if not STRATEGY_CODE: 
-        print("❌ No Strategy Code found.")
-        return
+        except Exception as e:
+            self.log(f"⚠️ GPT Optimization Error: {e}")
+            if reserved:
+                refund_sync(self.email, "credits")
+
+    def sync_exchange_data(self):
+        """Fetches the REAL truth from the exchange."""
+        try:
+            positions = self.exchange.fetch_positions([self.symbol])
+            raw_symbol = self.symbol.replace("/", "")
+            symbol_pos = next((p for p in positions if p['symbol'] == raw_symbol), None)
 
-    print(f"🚀 Bot starting | {DEMO and 'DEMO' or 'LIVE'} FUTURES | Symbol: {SYMBOL} | Leverage: {LEVERAGE}x")
-    exchange.load_markets()
+            if symbol_pos:
+                signed_pos = float(symbol_pos['info']['positionAmt'])
+                entry_price = float(symbol_pos['entryPrice'] or 0.0)
+                unrealized_pnl = float(symbol_pos['unrealizedPnl'] or 0.0)
 
-    try:
-        exchange.set_leverage(LEVERAGE, SYMBOL)
-        exchange.set_margin_mode('ISOLATED', SYMBOL)
-    except Exception as e:
-        print(f"⚠️ Leverage Config Warning: {e}")
+                return {
+                    "pos": signed_pos,
+                    "entry": entry_price,
+                    "unpnl": unrealized_pnl
+                }
+        except Exception as e:
+            self.log(f"⚠️ Exchange Sync Error: {e}")
+        return None
 
-    # Inject strategy code
-    local_env = {"pd": pd, "np": np}
-    exec(STRATEGY_CODE, local_env)
-    run_strategy = local_env.get("run_strategy")
+    def get_strategy_state(self):
+        return self.state.snapshot()
 
-    while True:
+    def update_strategy_state(self, pos, entry=0.0, pnl_inc=0.0, unpnl=0.0):
+        """Records realized (inc) and unrealized (set) PnL; written on the next flush."""
+        self.state.update(pos, entry=entry, pnl_inc=pnl_inc, unpnl=unpnl)
+
+    def calculate_dynamic_qty(self, price):
+        try:
+            raw_qty = (self.amount * self.leverage) / price
+            return float(self.exchange.amount_to_precision(self.symbol, raw_qty))
+        except Exception as e:
+            self.log(f"⚠️ Qty Calculation Error: {e}")
+            return 0.0
+
+    def sync_candles(self):
+        """
+        Appends only bars newer than the buffer's last (still forming) bar.
+        Every bar that closes is fed to the incremental runner; returns the
+        signal of the newest closed bar, or HOLD if none closed. Bars come
+        from REST while the market feed is disconnected or behind.
+        """
+        buffer, runner = self.buffer, self.runner
+        since = buffer.last_timestamp()
+        if self.market_feed is not None and self.market_feed.fresh():
+            bars = self.market_feed.bars_since(since)
+        elif since is None:
+            bars = self.exchange.fetch_ohlcv(self.symbol, self.timeframe, limit=CANDLE_BUFFER)
+        else:
+            bars = self.exchange.fetch_ohlcv(self.symbol, self.timeframe, since=since)
+
+        signal = "HOLD"
+        for bar in bars:
+            if since is not None and bar[0] < since:
+                continue
+            if since is not None and bar[0] == since:
+                buffer.replace_last(bar)
+            else:
+                if runner and len(buffer):
+                    signal = runner.step(buffer.last())
+                buffer.append(bar)
+            since = bar[0]
+        return signal
+
+    def closed_frame(self, now_ms=None):
+        """The buffered bars whose candle has closed by `now_ms`, as a DataFrame."""
+        if now_ms is None:
+            now_ms = time.time() * 1000
+        df = self.buffer.frame()
+        return df[df["timestamp"] + self.scheduler.tf_ms <= now_ms].reset_index(drop=True)
+
+    def current_price(self):
+        """Latest trade price: from the market feed while it is fresh, else one ticker request."""
+        if self.market_feed is not None and self.market_feed.fresh():
+            price = self.market_feed.last_price()
+            if price is not None:
+                return price
+        return float(self.exchange.fetch_ticker(self.symbol)["last"])
+
+    def log_error_to_db(self, error_msg):
         try:
-            # --- 0. SYNC REAL STATE ---
-            real_exchange = sync_exchange_data()
-            if real_exchange is not None:
-                update_strategy_state(
-                    pos=real_exchange['pos'], 
-                    entry=real_exchange['entry'], 
-                    unpnl=real_exchange['unpnl']
-                )
-
-            state = get_strategy_state()
-            df = fetch_data()
-            current_price = float(df['close'].iloc[-1])
-            _, signal = run_strategy(df)
-            
-            print(f"🕒 {datetime.now().strftime('%H:%M:%S')} | Total PnL: ${state['total_pnl']:.2f} | Real Pos: {state['pos']} | Signal: {signal}")
-
-            # --- 1. EXIT LOGIC (SL/TP) ---
-            if state['pos'] != 0:
-                entry_price = state['entry']
-                is_long = state['pos'] > 0
-                price_change_pct = (current_price - entry_price) / entry_price if is_long else (entry_price - current_price) / entry_price
-                
-                exit_reason = ""
-                trade_status = "" # Track if it's a loss or profit
-                
-                if price_change_pct <= -STOP_LOSS:
-                    exit_reason = f"STOP LOSS hit at {current_price}"
-                    trade_status = "loss"
-                elif price_change_pct >= TAKE_PROFIT:
-                    exit_reason = f"TAKE PROFIT hit at {current_price}"
-                    trade_status = "profit"
-
-                if exit_reason:
-                    trade_pnl = price_change_pct * (abs(state['pos']) * entry_price)
-                    side = "sell" if is_long else "buy"
-                    
-                    print(f"🛑 {exit_reason} | Closing Real Pos: {state['pos']}")
-                    exchange.create_order(SYMBOL, 'market', side, abs(state['pos']))
-                    update_strategy_state(pos=0.0, entry=0.0, pnl_inc=trade_pnl, unpnl=0.0)
-                    
-                    # TRIGGER GPT LOGIC ONLY ON LOSS
-                    if trade_status == "loss":
-                        print("📉 Trade lost. Analyzing with AI...")
-                        trade_summary = {
-                            "side": "LONG" if is_long else "SHORT",
-                            "entry": entry_price,
-                            "exit": current_price,
-                            "pnl": trade_pnl
-                        }
-                        analyze_and_optimize_loss(trade_summary, df)
-                    
-                    continue 
-
-            # --- 2. EXECUTION LOGIC ---
-            if signal == "BUY":
-                if state['pos'] < 0: # Close Short
-                    trade_pnl = (state['entry'] - current_price) * abs(state['pos'])
-                    exchange.create_market_buy_order(SYMBOL, abs(state['pos']))
-                    update_strategy_state(pos=0.0, entry=0.0, pnl_inc=trade_pnl)
-                    print(f"🔄 Closed SHORT at {current_price}")
-                    time.sleep(1)
-                    state = get_strategy_state() 
-
-                if state['pos'] == 0: # Open Long
-                    qty = calculate_dynamic_qty(current_price)
-                    if qty > 0:
-                        exchange.create_market_buy_order(SYMBOL, qty)
-                        update_strategy_state(pos=qty, entry=current_price)
-                        print(f"📈 Opened LIVE LONG: {qty} at {current_price}")
-
-            elif signal == "SELL":
-                if state['pos'] > 0: # Close Long
-                    trade_pnl = (current_price - state['entry']) * state['pos']
-                    exchange.create_market_sell_order(SYMBOL, abs(state['pos']))
-                    update_strategy_state(pos=0.0, entry=0.0, pnl_inc=trade_pnl)
-                    print(f"🔄 Closed LONG at {current_price}")
-                    time.sleep(1)
-                    state = get_strategy_state()
-
-                if state['pos'] == 0: # Open Short
-                    qty = calculate_dynamic_qty(current_price)
-                    if qty > 0:
-                        exchange.create_market_sell_order(SYMBOL, qty)
-                        update_strategy_state(pos=-qty, entry=current_price) 
-                        print(f"📉 Opened LIVE SHORT: {qty} at {current_price}")
-
-            time.sleep(60)
+            update_strategy(self.email, self.strategy_id,
+                { "$set": {"status": "error", "last_error": str(error_msg), "error_at": datetime.now()}}
+            )
+            if self.state:
+                self.state.status = "error"  # the next update flips it back to running
+        except Exception as db_e:
+            self.log(f"🔥 Database Error: {db_e}")
+
+    def stop(self):
+        """Keeps the bot from placing any further order, even in a tick already running."""
+        self.stopped.set()
+
+    def may_trade(self):
+        """
+        Checked right before placing orders: False once stopped, either by
+        stop() or by /api/stop and /api/squareoff, which only change the
+        status in Mongo until the runner or Docker removes the bot.
+        """
+        if self.stopped.is_set():
+            return False
+        strategy = find_strategy(self.email, self.strategy_id, ["status"])
+        status = strategy.get("status") if strategy else "deleted"
+        if status not in ("running", "error"):
+            self.log(f"⏹️ Strategy is {status}, not placing orders")
+            self.stopped.set()
+            return False
+        return True
+
+    # --- Lifecycle ---
+
+    def setup(self):
+        self.log(f"🚀 Bot starting | {self.demo and 'DEMO' or 'LIVE'} FUTURES | Symbol: {self.symbol} | Leverage: {self.leverage}x")
+        # Validated before touching the exchange; parsed once per distinct code
+        strategy = load_strategy(self.code, tuple(ENTRY_POINTS))
+        if not self.exchange.markets:
+            # Shared with the other bots of a runner process
+            exchange_pool.markets.ensure(self.exchange, self.demo)
 
+        try:
+            self.exchange.set_leverage(self.leverage, self.symbol)
+            self.exchange.set_margin_mode('ISOLATED', self.symbol)
         except Exception as e:
-            print(f"❌ Loop Error: {e}")
-            traceback.print_exc()
-            log_error_to_db(e)
-            time.sleep(15)
+            self.log(f"⚠️ Leverage Config Warning: {e}")
+
+        self.state = self.state_store.get(self.email, self.strategy_id, self.db_prefix)
+
+        # Inject strategy code (own namespace per bot)
+        local_env = strategy.namespace()
+        self.run_strategy = strategy.entry(local_env, self.stop_loss, self.take_profit)
+
+        # Strategies with on_bar/INDICATORS run incrementally on closed bars only
+        if local_env.get("on_bar"):
+            self.runner = IncrementalRunner(local_env["on_bar"], local_env.get("INDICATORS"))
+            self.log(f"⚡ Incremental mode | Indicators: {list(self.runner.indicators)}")
+        self.sync_candles()
+
+    def tick(self, tick):
+        """
+        One pass of the trading loop. `tick` is "candle" right after a candle
+        close or "sltp" for an intra-candle SL/TP check. Returns True when the
+        loop should run again immediately (after an SL/TP exit).
+
+        SL/TP ticks only read the price and check the position the last
+        candle tick synced (and this bot's own orders updated); the exchange
+        position and the candles are re-synced on candle ticks.
+        """
+        if tick == "sltp":
+            if not self.in_position:
+                return False
+            state = self.get_strategy_state()
+            self.in_position = state['pos'] != 0
+            if not self.in_position:
+                return False
+            return bool(self.exit_on_sl_tp(state, self.current_price()))
+
+        # --- 0. SYNC REAL STATE ---
+        real_exchange = self.sync_exchange_data()
+        if real_exchange is not None:
+            self.update_strategy_state(
+                pos=real_exchange['pos'],
+                entry=real_exchange['entry'],
+                unpnl=real_exchange['unpnl']
+            )
+
+        state = self.get_strategy_state()
+        if self.runner:
+            signal = self.sync_candles()
+        else:
+            self.sync_candles()
+            # Decide on closed candles only, whatever bars the feed or REST returned
+            _, signal = self.run_strategy(self.closed_frame())
+        current_price = float(self.buffer.last()[4])
+
+        self.log(f"🕒 {datetime.now().strftime('%H:%M:%S')} | Total PnL: ${state['total_pnl']:.2f} | Real Pos: {state['pos']} | Signal: {signal}")
+
+        # --- 1. EXIT LOGIC (SL/TP) ---
+        if state['pos'] != 0:
+            exited = self.exit_on_sl_tp(state, current_price)
+            if exited is not None:
+                return exited
+
+        # --- 2. EXECUTION LOGIC ---
+        close_existing, open_direction = signal_actions(state['pos'], SIGNALS.get(signal, HOLD))
+        if (close_existing or open_direction) and not self.may_trade():
+            return False
+
+        if close_existing:
+            if state['pos'] < 0: # Close Short
+                trade_pnl = (state['entry'] - current_price) * abs(state['pos'])
+                self.exchange.create_market_buy_order(self.symbol, abs(state['pos']))
+                self.update_strategy_state(pos=0.0, entry=0.0, pnl_inc=trade_pnl)
+                self.log(f"🔄 Closed SHORT at {current_price}")
+            else: # Close Long
+                trade_pnl = (current_price - state['entry']) * state['pos']
+                self.exchange.create_market_sell_order(self.symbol, abs(state['pos']))
+                self.update_strategy_state(pos=0.0, entry=0.0, pnl_inc=trade_pnl)
+                self.log(f"🔄 Closed LONG at {current_price}")
+            state = self.get_strategy_state()
+
+        if open_direction and state['pos'] == 0:
+            qty = self.calculate_dynamic_qty(current_price)
+            if qty > 0 and open_direction > 0: # Open Long
+                self.exchange.create_market_buy_order(self.symbol, qty)
+                self.update_strategy_state(pos=qty, entry=current_price)
+                self.log(f"📈 Opened LIVE LONG: {qty} at {current_price}")
+            elif qty > 0: # Open Short
+                self.exchange.create_market_sell_order(self.symbol, qty)
+                self.update_strategy_state(pos=-qty, entry=current_price)
+                self.log(f"📉 Opened LIVE SHORT: {qty} at {current_price}")
+
+        self.in_position = state['pos'] != 0 or open_direction != 0
+        return False
+
+    def exit_on_sl_tp(self, state, current_price):
+        """
+        Closes the position if current_price hits its SL or TP. Returns None
+        when neither is hit, else what tick() returns: True after the exit,
+        False when the bot may no longer trade.
+        """
+        entry_price = state['entry']
+        is_long = state['pos'] > 0
+        # Track if it's a loss or profit
+        trade_status, price_change_pct = check_sl_tp(state['pos'], entry_price, current_price, self.stop_loss, self.take_profit)
+
+        if trade_status == "loss":
+            exit_reason = f"STOP LOSS hit at {current_price}"
+        elif trade_status == "profit":
+            exit_reason = f"TAKE PROFIT hit at {current_price}"
+        else:
+            return None
+
+        if not self.may_trade():
+            return False
+        trade_pnl = price_change_pct * (abs(state['pos']) * entry_price)
+        side = "sell" if is_long else "buy"
+
+        self.log(f"🛑 {exit_reason} | Closing Real Pos: {state['pos']}")
+        self.exchange.create_order(self.symbol, 'market', side, abs(state['pos']))
+        self.update_strategy_state(pos=0.0, entry=0.0, pnl_inc=trade_pnl, unpnl=0.0)
+
+        # TRIGGER GPT LOGIC ONLY ON LOSS
+        if trade_status == "loss":
+            self.log("📉 Trade lost. Analyzing with AI...")
+            trade_summary = {
+                "side": "LONG" if is_long else "SHORT",
+                "entry": entry_price,
+                "exit": current_price,
+                "pnl": trade_pnl
+            }
+            self.analyze_and_optimize_loss(trade_summary, self.buffer.frame())
+
+        return True
+
+    def run(self):
+        """Blocking loop used when the bot owns the whole process."""
+        self.setup()
+
+        # Wake on candle close; in between only to check SL/TP of an open position
+        tick = "candle"
+        while not self.stopped.is_set():
+            try:
+                rerun = self.tick(tick)
+                self.state_store.flush()
+                if rerun:
+                    continue
+                tick = self.scheduler.wait()
+
+            except Exception as e:
+                self.log(f"❌ Loop Error: {e}")
+                traceback.print_exc()
+                self.log_error_to_db(e)
+                time.sleep(15)
+
+        # Stopped from the API: keep the trades, not a "running" over its status
+        self.state_store.release(self.strategy_id)
+        self.state_store.flush(True)
+
+
+def main():
+    if not STRATEGY_CODE:
+        print("❌ No Strategy Code found.")
+        return
+
+    # --- Exchange Initialization (Live Futures) ---
+    exchange = create_exchange(API_KEY, API_SECRET, DEMO)
+
+    market_feed = None
+    if MARKET_FEED == "ws":
+        market_feed = MarketFeed(exchange, SYMBOL, TIMEFRAME, demo=bool(DEMO), capacity=CANDLE_BUFFER).start()
+        print(f"📡 Streaming candles from {market_feed.url}")
+    elif MARKET_FEED == "hub":
+        market_feed = HubFeed(SYMBOL, TIMEFRAME, capacity=CANDLE_BUFFER).start()
+        print(f"📡 Candles from market hub {market_feed.url}")
+
+    StrategyBot(
+        email=EMAIL,
+        strategy_id=STRATEGY_ID,
+        code=STRATEGY_CODE,
+        symbol=SYMBOL,
+        timeframe=TIMEFRAME,
+        amount=AMOUNT,
+        leverage=LEVERAGE,
+        stop_loss=STOP_LOSS,
+        take_profit=TAKE_PROFIT,
+        demo=DEMO,
+        exchange=exchange,
+        market_feed=market_feed,
+    ).run()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,80 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+import pandas as pd
+from candle_store import candle_store, COLUMNS
+
+# Process-wide cache of candle DataFrames shared by concurrent backtests.
+# Entries expire after a TTL and are evicted least-recently-used. Concurrent
+# misses for the same key are coalesced into a single store/exchange fetch.
+
+CANDLE_CACHE_TTL = float(os.getenv("CANDLE_CACHE_TTL", 60))
+CANDLE_CACHE_SIZE = int(os.getenv("CANDLE_CACHE_SIZE", 32))
+
+_COW = int(pd.__version__.split(".")[0]) >= 3 or pd.options.mode.copy_on_write is True
+
+
+def candles_to_frame(ohlcv):
+    df = pd.DataFrame(ohlcv, columns=COLUMNS)
+    df[COLUMNS[1:]] = df[COLUMNS[1:]].astype(float)
+    df["timestamp"] = df["timestamp"].astype("int64")
+    return df
+
+
+class CandleCache:
+    def __init__(self, loader=None, ttl=CANDLE_CACHE_TTL, maxsize=CANDLE_CACHE_SIZE):
+        self.loader = loader or (lambda key: candles_to_frame(candle_store.get(*key)))
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # key -> (expires_at, frame)
+        self._inflight = {}  # key -> Future
+        self._lock = threading.Lock()
+
+    def _view(self, frame):
+        # Strategies mutate df (df['ema'] = ...). Under copy-on-write a shallow
+        # copy is free and isolated; otherwise fall back to a real copy.
+        return frame.copy(deep=not _COW)
+
+    def get(self, exchange_id, symbol, timeframe):
+        """Returns a private, mutable view of the cached candle DataFrame."""
+        key = (exchange_id, symbol, timeframe)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                return self._view(entry[1])
+
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+
+        if not owner:
+            return self._view(future.result())
+
+        try:
+            frame = self.loader(key)
+        except Exception as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, frame)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            self._inflight.pop(key, None)
+        future.set_result(frame)
+        return self._view(frame)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+candle_cache = CandleCache()
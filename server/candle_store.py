@@ -0,0 +1,109 @@
+import os
+import threading
+import numpy as np
+import ccxt
+
+# On-disk OHLCV store. One .npy file per (exchange, symbol, timeframe), loaded
+# memory-mapped so warm reads never touch the network. Only the tail since the
+# last stored candle is fetched from the exchange.
+
+CANDLE_STORE_DIR = os.getenv("CANDLE_STORE_DIR", os.path.join(os.path.dirname(__file__), "data", "candles"))
+HISTORY_MS = 2 * 365 * 24 * 60 * 60 * 1000
+PAGE_LIMIT = 1000
+
+COLUMNS = ["timestamp", "open", "high", "low", "close", "volume"]
+
+
+def ccxt_fetcher(exchange_id):
+    """Default fetcher: a rate-limited ccxt client for the given exchange id."""
+    return getattr(ccxt, exchange_id)({"enableRateLimit": True})
+
+
+class CandleStore:
+    """
+    Persistent candle store keyed by (exchange, symbol, timeframe).
+
+    `fetcher` is a factory taking an exchange id and returning any object with
+    ccxt's `fetch_ohlcv(symbol, timeframe, since, limit)` and `milliseconds()`,
+    so a fake exchange can be plugged in for offline use.
+    """
+
+    def __init__(self, root=CANDLE_STORE_DIR, fetcher=ccxt_fetcher, history_ms=HISTORY_MS):
+        self.root = root
+        self.fetcher = fetcher
+        self.history_ms = history_ms
+        self._exchanges = {}
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def _path(self, exchange_id, symbol, timeframe):
+        name = f"{symbol.replace('/', '_')}_{timeframe}.npy"
+        return os.path.join(self.root, exchange_id, name)
+
+    def _lock(self, key):
+        with self._guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _exchange(self, exchange_id):
+        with self._guard:
+            if exchange_id not in self._exchanges:
+                self._exchanges[exchange_id] = self.fetcher(exchange_id)
+            return self._exchanges[exchange_id]
+
+    def load(self, exchange_id, symbol, timeframe):
+        """Returns the stored candles as a read-only (N, 6) float64 array."""
+        path = self._path(exchange_id, symbol, timeframe)
+        if not os.path.exists(path):
+            return np.empty((0, len(COLUMNS)), dtype=np.float64)
+        return np.load(path, mmap_mode="r")
+
+    def _save(self, path, candles):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, candles)
+        os.replace(tmp, path)
+
+    def _fetch_tail(self, exchange, symbol, timeframe, since):
+        rows = []
+        while True:
+            page = exchange.fetch_ohlcv(symbol=symbol, timeframe=timeframe, since=since, limit=PAGE_LIMIT)
+            if not page:
+                break
+            rows.extend(page)
+            next_since = page[-1][0] + 1
+            if next_since <= since:
+                break
+            since = next_since
+        if not rows:
+            return np.empty((0, len(COLUMNS)), dtype=np.float64)
+        return np.asarray(rows, dtype=np.float64)
+
+    def get(self, exchange_id, symbol, timeframe):
+        """
+        Returns the last `history_ms` of candles, syncing only the missing tail.
+        The last stored candle is always refetched since it may have been
+        written while still open.
+        """
+        path = self._path(exchange_id, symbol, timeframe)
+        with self._lock(path):
+            exchange = self._exchange(exchange_id)
+            now = exchange.milliseconds()
+            start = now - self.history_ms
+
+            stored = self.load(exchange_id, symbol, timeframe)
+            since = int(stored[-1, 0]) if len(stored) else start
+
+            fresh = self._fetch_tail(exchange, symbol, timeframe, since)
+            if len(fresh):
+                # Keep stored rows strictly before the first fetched candle
+                keep = stored[stored[:, 0] < fresh[0, 0]] if len(stored) else stored
+                merged = np.concatenate([keep, fresh]) if len(keep) else fresh
+                self._save(path, merged)
+                stored = self.load(exchange_id, symbol, timeframe)
+
+            first = np.searchsorted(stored[:, 0], start) if len(stored) else 0
+            return stored[first:]
+
+
+candle_store = CandleStore()
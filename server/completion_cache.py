@@ -0,0 +1,213 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+# Autocomplete support for /api/autocomplete.
+#
+# CompletionCache keeps completions keyed on the normalized prompt (collapsed
+# whitespace, lower case) with a TTL and LRU eviction. A character trie over
+# the keys lets a longer prompt reuse a cached completion when the user has
+# typed further along it: "buy btc when" -> " EMA 20 crosses above EMA 50"
+# also answers "buy btc when ema 20" with " crosses above EMA 50".
+# AUTOCOMPLETE_CACHE_STORE=mongo adds a shared exact-match store so API
+# workers reuse each other's completions.
+#
+# RequestGate debounces each user's requests and cancels the one still
+# talking to the model when a newer request from the same user arrives.
+
+AUTOCOMPLETE_CACHE_TTL = float(os.getenv("AUTOCOMPLETE_CACHE_TTL", 3600))
+AUTOCOMPLETE_CACHE_SIZE = int(os.getenv("AUTOCOMPLETE_CACHE_SIZE", 5000))
+AUTOCOMPLETE_CACHE_STORE = os.getenv("AUTOCOMPLETE_CACHE_STORE", "memory")  # memory | mongo
+AUTOCOMPLETE_DEBOUNCE_MS = float(os.getenv("AUTOCOMPLETE_DEBOUNCE_MS", 150))
+
+
+def normalize(prompt):
+    return " ".join(prompt.split()).lower()
+
+
+def _collapse(text):
+    # Like normalize() but keeps case, and a leading space that separates words
+    collapsed = " ".join(text.split())
+    return " " + collapsed if text[:1].isspace() and collapsed else collapsed
+
+
+class CompletionCache:
+    def __init__(self, ttl=AUTOCOMPLETE_CACHE_TTL, maxsize=AUTOCOMPLETE_CACHE_SIZE, store=None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.store = store
+        self._entries = OrderedDict()  # key -> (expires_at, completion, full text)
+        self._trie = {}
+
+    # --- Trie ---
+
+    def _trie_add(self, key):
+        node = self._trie
+        for ch in key:
+            node = node.setdefault(ch, {})
+        node[None] = True
+
+    def _trie_remove(self, key):
+        path, node = [], self._trie
+        for ch in key:
+            path.append((node, ch))
+            node = node.get(ch)
+            if node is None:
+                return
+        node.pop(None, None)
+        for parent, ch in reversed(path):
+            if parent[ch]:
+                break
+            del parent[ch]
+
+    def _prefix_keys(self, key):
+        """Cached keys that are prefixes of `key`, longest first."""
+        found, node = [], self._trie
+        for i, ch in enumerate(key):
+            node = node.get(ch)
+            if node is None:
+                break
+            if None in node:
+                found.append(key[:i + 1])
+        return reversed(found)
+
+    # --- Local entries ---
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        self._trie_remove(key)
+
+    def _lookup(self, key, trailing_space):
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry and entry[0] > now:
+            self._entries.move_to_end(key)
+            return entry[1]
+
+        for prefix in self._prefix_keys(key):
+            entry = self._entries.get(prefix)
+            if not entry or entry[0] <= now:
+                self._drop(prefix)
+                continue
+            full = entry[2]
+            if len(full) > len(key) and full.lower().startswith(key):
+                rest = full[len(key):]
+                if not rest.strip():
+                    continue
+                self._entries.move_to_end(prefix)
+                return rest.lstrip() if trailing_space else rest
+        return None
+
+    def _store_local(self, key, prompt, completion):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        else:
+            self._trie_add(key)
+        full = normalize(prompt) if not completion else " ".join(prompt.split()) + _collapse(completion)
+        self._entries[key] = (time.monotonic() + self.ttl, completion, full)
+        while len(self._entries) > self.maxsize:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+
+    # --- Public ---
+
+    async def get(self, prompt):
+        """A cached (or derivable) completion for `prompt`, or None."""
+        key = normalize(prompt)
+        if not key:
+            return None
+        completion = self._lookup(key, prompt[-1:].isspace())
+        if completion is None and self.store is not None:
+            completion = await self.store.get(key)
+            if completion is not None:
+                self._store_local(key, prompt, completion)
+        return completion
+
+    async def put(self, prompt, completion):
+        key = normalize(prompt)
+        if not key:
+            return
+        self._store_local(key, prompt, completion)
+        if self.store is not None:
+            await self.store.put(key, completion, self.ttl)
+
+
+class MongoCompletionStore:
+    """Shared exact-match store; Mongo's TTL index removes expired entries."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self._indexed = False
+
+    async def _ensure_indexes(self):
+        if not self._indexed:
+            await self.collection.create_index("expires_at", expireAfterSeconds=0)
+            self._indexed = True
+
+    async def get(self, key):
+        doc = await self.collection.find_one(
+            {"_id": key, "expires_at": {"$gt": datetime.now(timezone.utc)}}, {"completion": 1}
+        )
+        return doc["completion"] if doc else None
+
+    async def put(self, key, completion, ttl):
+        await self._ensure_indexes()
+        await self.collection.update_one(
+            {"_id": key},
+            {"$set": {"completion": completion, "expires_at": datetime.now(timezone.utc) + timedelta(seconds=ttl)}},
+            upsert=True,
+        )
+
+
+class Superseded(Exception):
+    """A newer request from the same user replaced this one."""
+
+
+class RequestGate:
+    def __init__(self, debounce_ms=AUTOCOMPLETE_DEBOUNCE_MS):
+        self.debounce = debounce_ms / 1000
+        self._latest = {}  # email -> token of the newest request
+        self._tasks = {}  # email -> in-flight model call
+
+    async def enter(self, email):
+        """Waits out the debounce window; raises Superseded if a newer request came in."""
+        token = object()
+        self._latest[email] = token
+        task = self._tasks.pop(email, None)
+        if task:
+            task.cancel()
+        if self.debounce:
+            await asyncio.sleep(self.debounce)
+        if self._latest.get(email) is not token:
+            raise Superseded()
+        return token
+
+    async def run(self, email, token, coro):
+        """Runs the model call; a newer request for the same user cancels it."""
+        task = asyncio.ensure_future(coro)
+        self._tasks[email] = task
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if task.cancelled() and self._latest.get(email) is not token:
+                raise Superseded()
+            raise
+        finally:
+            if self._tasks.get(email) is task:
+                del self._tasks[email]
+            if self._latest.get(email) is token:
+                del self._latest[email]
+
+
+def make_completion_cache(kind=AUTOCOMPLETE_CACHE_STORE):
+    store = None
+    if kind == "mongo":
+        from db_async import collection
+        store = MongoCompletionStore(collection("autocomplete_cache"))
+    return CompletionCache(store=store)
+
+
+completion_cache = make_completion_cache()
+autocomplete_gate = RequestGate()
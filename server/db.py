@@ -1,5 +1,7 @@
 import os
-from pymongo import MongoClient
+from typing import Optional
+from pymongo import MongoClient, UpdateOne, ASCENDING
+from pymongo.errors import PyMongoError, BulkWriteError
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -13,6 +15,208 @@ if not MONGO_URI or not MONGO_DB:
         "Please add these in the Replit Secrets panel."
     )
 
-client = MongoClient(MONGO_URI)
+# Connection pool settings, shared with the async client in db_async.py
+POOL_OPTIONS = {
+    "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", 50)),
+    "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", 5)),
+    "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_MS", 60000)),
+    "waitQueueTimeoutMS": int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 5000)),
+    "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)),
+}
+# MONGO_URI=mongomock:// runs everything against an in-memory stand-in
+# (pip install mongomock mongomock-motor) for local testing
+IN_MEMORY = MONGO_URI.startswith("mongomock://")
+
+if IN_MEMORY:
+    import mongomock
+    client = mongomock.MongoClient()
+else:
+    client = MongoClient(MONGO_URI, **POOL_OPTIONS)
 db = client[MONGO_DB] 
-users_collection = db["user"]
\ No newline at end of file
+users_collection = db["user"]
+
+# --- Strategies ---
+# Strategies live in their own collection, one document per strategy with
+# `_id` = strategy id plus the owner's email, once migrate_strategies.py has
+# copied them there and STRATEGY_STORE=collection is set. Until then the
+# default (embedded) keeps serving the legacy `user.strategies` array, so
+# deploying this code before the migration hides nobody's strategies.
+# Callers use the helpers below with field names relative to the strategy
+# ({"$set": {"status": "stopped"}}) and never touch the array directly.
+strategies_collection = db["strategies"]
+STRATEGY_STORE = os.getenv("STRATEGY_STORE", "embedded")
+
+
+def _embedded(update):
+    return {op: {f"strategies.$.{k}": v for k, v in fields.items()} for op, fields in update.items()}
+
+
+def _strategy_filter(email, strategy_id):
+    if STRATEGY_STORE == "embedded":
+        return {"email": email, "strategies.id": strategy_id}
+    return {"_id": strategy_id, "email": email}
+
+
+def find_strategy(email, strategy_id, projection=None):
+    """One strategy of a user, or None."""
+    if STRATEGY_STORE == "embedded":
+        user = users_collection.find_one(
+            _strategy_filter(email, strategy_id), {"strategies": {"$elemMatch": {"id": strategy_id}}}
+        )
+        if not user or not user.get("strategies"):
+            return None
+        strategy = user["strategies"][0]
+        return {k: strategy[k] for k in projection if k in strategy} if projection else strategy
+    return strategies_collection.find_one(
+        _strategy_filter(email, strategy_id),
+        {**dict.fromkeys(projection or [], 1), "_id": 0}
+    )
+
+
+def list_strategies(email, projection=None):
+    if STRATEGY_STORE == "embedded":
+        user = users_collection.find_one({"email": email}, {"strategies": 1})
+        return (user or {}).get("strategies", [])
+    return list(strategies_collection.find({"email": email}, {**dict.fromkeys(projection or [], 1), "_id": 0}))
+
+
+def count_strategies(email, query=None):
+    if STRATEGY_STORE == "embedded":
+        return sum(1 for s in list_strategies(email) if all(s.get(k) == v for k, v in (query or {}).items()))
+    return strategies_collection.count_documents({"email": email, **(query or {})})
+
+
+def find_strategies(query, projection=None):
+    """Strategies of any user matching `query`; each carries its owner's `email`."""
+    if STRATEGY_STORE == "embedded":
+        return list(users_collection.aggregate([
+            {"$match": {"strategies": {"$elemMatch": query}}},
+            {"$unwind": "$strategies"},
+            {"$match": {f"strategies.{k}": v for k, v in query.items()}},
+            {"$addFields": {"strategies.email": "$email"}},
+            {"$replaceRoot": {"newRoot": "$strategies"}},
+        ]))
+    return list(strategies_collection.find(query, {**dict.fromkeys(projection or [], 1), "_id": 0}))
+
+
+def insert_strategy(email, strategy):
+    if STRATEGY_STORE == "embedded":
+        users_collection.update_one({"email": email}, {"$push": {"strategies": strategy}})
+    else:
+        strategies_collection.insert_one({**strategy, "_id": strategy["id"], "email": email})
+
+
+def update_strategy(email, strategy_id, update):
+    """Applies a strategy-relative update ($set/$inc/$unset/$push); True if it matched."""
+    if STRATEGY_STORE == "embedded":
+        result = users_collection.update_one(_strategy_filter(email, strategy_id), _embedded(update))
+    else:
+        result = strategies_collection.update_one(_strategy_filter(email, strategy_id), update)
+    return result.matched_count > 0
+
+
+def strategy_update_op(email, strategy_id, update):
+    """update_strategy as a pymongo UpdateOne for strategy_bulk_write."""
+    if STRATEGY_STORE == "embedded":
+        update = _embedded(update)
+    if IN_MEMORY:
+        # mongomock's bulk API rejects the `sort` argument pymongo's UpdateOne
+        # passes, so in-memory mode applies (filter, update) pairs one by one
+        return _strategy_filter(email, strategy_id), update
+    return UpdateOne(_strategy_filter(email, strategy_id), update)
+
+
+def strategy_bulk_write(operations, ordered=True):
+    collection = users_collection if STRATEGY_STORE == "embedded" else strategies_collection
+    if not IN_MEMORY:
+        return collection.bulk_write(operations, ordered=ordered)
+
+    errors = []
+    for index, (query, update) in enumerate(operations):
+        try:
+            collection.update_one(query, update)
+        except Exception as e:
+            errors.append({"index": index, "errmsg": str(e)})
+            if ordered:
+                break
+    if errors:
+        # Same shape as a real bulk failure, so callers handle both alike
+        raise BulkWriteError({"writeErrors": errors, "writeConcernErrors": []})
+
+
+def attach_strategies(users):
+    """Fills `strategies` on user documents so API responses keep their shape."""
+    if STRATEGY_STORE == "embedded" or not users:
+        return users
+    by_email = {user["email"]: user for user in users if user.get("email")}
+    for user in by_email.values():
+        user["strategies"] = []
+    for strategy in strategies_collection.find({"email": {"$in": list(by_email)}}, {"_id": 0}):
+        by_email[strategy["email"]]["strategies"].append(strategy)
+    return users
+
+
+# --- Indexes ---
+# Declared once here and created at startup (main.py, runner.py).
+# create_index is a no-op when the index already exists.
+INDEXES = {
+    "user": [
+        ([("email", ASCENDING)], {"unique": True}),
+    ],
+    "strategies": [
+        ([("email", ASCENDING)], {}),
+        ([("status", ASCENDING)], {}),
+        ([("deploy_mode", ASCENDING), ("runner_id", ASCENDING), ("status", ASCENDING)], {}),
+    ],
+}
+EMBEDDED_INDEXES = [
+    ([("strategies.id", ASCENDING)], {}),
+    ([("strategies.status", ASCENDING)], {}),
+]
+
+
+def ensure_indexes():
+    """Creates the declared indexes; failures (e.g. duplicate emails) are logged, not raised."""
+    declared = {name: list(specs) for name, specs in INDEXES.items()}
+    if STRATEGY_STORE == "embedded":
+        declared["user"] += EMBEDDED_INDEXES
+    for name, specs in declared.items():
+        for keys, options in specs:
+            try:
+                db[name].create_index(keys, **options)
+            except PyMongoError as e:
+                print(f"⚠️ Could not create index {keys} on {name}: {e}")
+
+
+# --- Projected user reads ---
+# Endpoints fetch only the fields they use instead of the whole user document.
+USER_FIELDS = {
+    "credits": ["credits", "backtest", "copilot"],
+    "plan": ["plan", "engine", "terminal", "active"],
+    "binance": ["binance"],
+}
+
+
+def get_user(email, fields=None) -> Optional[dict]:
+    """User document with only `fields` (never the legacy strategies array by default)."""
+    projection = dict.fromkeys(fields, 1) if fields else {"strategies": 0}
+    return users_collection.find_one({"email": email}, projection)
+
+
+def user_exists(email) -> bool:
+    return users_collection.find_one({"email": email}, {"_id": 1}) is not None
+
+
+def get_credits(email) -> Optional[dict]:
+    """{"credits", "backtest", "copilot"} counters, or None for unknown users."""
+    return get_user(email, USER_FIELDS["credits"])
+
+
+def get_plan(email) -> Optional[dict]:
+    return get_user(email, USER_FIELDS["plan"])
+
+
+def get_binance(email) -> Optional[dict]:
+    """The user's saved Binance credentials ({} if none), or None for unknown users."""
+    user = get_user(email, USER_FIELDS["binance"])
+    return None if user is None else user.get("binance") or {}
@@ -0,0 +1,140 @@
+from typing import Optional
+from db import (
+    MONGO_URI, MONGO_DB, POOL_OPTIONS, IN_MEMORY, STRATEGY_STORE, USER_FIELDS,
+    _embedded, _strategy_filter,
+)
+
+# Async counterpart of db.py for the FastAPI routers, so a Mongo round trip
+# no longer blocks the event loop. Same helpers and field conventions as
+# db.py; the sync module stays in use by bot.py, runner.py and scripts.
+# Handlers go through these functions rather than the collections, so
+# `use_database()` can point everything at another database in tests.
+
+
+def _connect():
+    if IN_MEMORY:
+        from mongomock_motor import AsyncMongoMockClient
+        return AsyncMongoMockClient()
+    from pymongo import AsyncMongoClient
+    return AsyncMongoClient(MONGO_URI, **POOL_OPTIONS)
+
+
+client = _connect()
+db = client[MONGO_DB]
+users_collection = db["user"]
+strategies_collection = db["strategies"]
+
+
+def use_database(database):
+    """Points the helpers at another (e.g. test or in-memory) async database."""
+    global db, users_collection, strategies_collection
+    db = database
+    users_collection = database["user"]
+    strategies_collection = database["strategies"]
+
+
+def collection(name):
+    return db[name]
+
+
+# --- Users ---
+
+async def get_user(email, fields=None) -> Optional[dict]:
+    projection = dict.fromkeys(fields, 1) if fields else {"strategies": 0}
+    return await users_collection.find_one({"email": email}, projection)
+
+
+async def user_exists(email) -> bool:
+    return await users_collection.find_one({"email": email}, {"_id": 1}) is not None
+
+
+async def get_credits(email) -> Optional[dict]:
+    return await get_user(email, USER_FIELDS["credits"])
+
+
+async def get_plan(email) -> Optional[dict]:
+    return await get_user(email, USER_FIELDS["plan"])
+
+
+async def get_binance(email) -> Optional[dict]:
+    user = await get_user(email, USER_FIELDS["binance"])
+    return None if user is None else user.get("binance") or {}
+
+
+async def get_profile(email) -> Optional[dict]:
+    """The whole user document with its strategies, as the client expects it."""
+    user = await users_collection.find_one({"email": email})
+    return (await attach_strategies([user]))[0] if user else None
+
+
+async def list_users():
+    return await users_collection.find({}).to_list(None)
+
+
+async def insert_user(user):
+    await users_collection.insert_one(user)
+
+
+async def update_user(email, update):
+    """True if a user matched."""
+    result = await users_collection.update_one({"email": email}, update)
+    return result.matched_count > 0
+
+
+# --- Strategies ---
+
+async def find_strategy(email, strategy_id, projection=None):
+    if STRATEGY_STORE == "embedded":
+        user = await users_collection.find_one(
+            _strategy_filter(email, strategy_id), {"strategies": {"$elemMatch": {"id": strategy_id}}}
+        )
+        if not user or not user.get("strategies"):
+            return None
+        strategy = user["strategies"][0]
+        return {k: strategy[k] for k in projection if k in strategy} if projection else strategy
+    return await strategies_collection.find_one(
+        _strategy_filter(email, strategy_id),
+        {**dict.fromkeys(projection or [], 1), "_id": 0}
+    )
+
+
+async def list_strategies(email, projection=None):
+    if STRATEGY_STORE == "embedded":
+        user = await users_collection.find_one({"email": email}, {"strategies": 1})
+        return (user or {}).get("strategies", [])
+    cursor = strategies_collection.find({"email": email}, {**dict.fromkeys(projection or [], 1), "_id": 0})
+    return await cursor.to_list(None)
+
+
+async def count_strategies(email, query=None):
+    if STRATEGY_STORE == "embedded":
+        strategies = await list_strategies(email)
+        return sum(1 for s in strategies if all(s.get(k) == v for k, v in (query or {}).items()))
+    return await strategies_collection.count_documents({"email": email, **(query or {})})
+
+
+async def insert_strategy(email, strategy):
+    if STRATEGY_STORE == "embedded":
+        await users_collection.update_one({"email": email}, {"$push": {"strategies": strategy}})
+    else:
+        await strategies_collection.insert_one({**strategy, "_id": strategy["id"], "email": email})
+
+
+async def update_strategy(email, strategy_id, update):
+    if STRATEGY_STORE == "embedded":
+        result = await users_collection.update_one(_strategy_filter(email, strategy_id), _embedded(update))
+    else:
+        result = await strategies_collection.update_one(_strategy_filter(email, strategy_id), update)
+    return result.matched_count > 0
+
+
+async def attach_strategies(users):
+    if STRATEGY_STORE == "embedded" or not users:
+        return users
+    by_email = {user["email"]: user for user in users if user.get("email")}
+    for user in by_email.values():
+        user["strategies"] = []
+    cursor = strategies_collection.find({"email": {"$in": list(by_email)}}, {"_id": 0})
+    async for strategy in cursor:
+        by_email[strategy["email"]]["strategies"].append(strategy)
+    return users
@@ -0,0 +1,34 @@
+# Pure trading decisions shared by the live loop (bot.py) and the simulator
+# (simulator.py), so backtests replay exactly what the bot would do.
+
+HOLD, BUY, SELL = 0, 1, -1
+SIGNALS = {"HOLD": HOLD, "BUY": BUY, "SELL": SELL}
+
+
+def check_sl_tp(pos, entry, price, stop_loss, take_profit):
+    """
+    Returns (status, price_change_pct) for an open position, where status is
+    "loss" when the stop loss is hit, "profit" for take profit, else "".
+    """
+    if pos == 0 or entry == 0:
+        return "", 0.0
+    is_long = pos > 0
+    price_change_pct = (price - entry) / entry if is_long else (entry - price) / entry
+    if price_change_pct <= -stop_loss:
+        return "loss", price_change_pct
+    if price_change_pct >= take_profit:
+        return "profit", price_change_pct
+    return "", price_change_pct
+
+
+def signal_actions(pos, signal):
+    """
+    Returns (close_existing, open_direction) for a signal: BUY closes a short
+    and opens a long when flat afterwards; SELL closes a long and opens a
+    short. open_direction is 1 (long), -1 (short) or 0.
+    """
+    if signal == BUY:
+        return pos < 0, (1 if pos <= 0 else 0)
+    if signal == SELL:
+        return pos > 0, (-1 if pos >= 0 else 0)
+    return False, 0
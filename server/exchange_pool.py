@@ -0,0 +1,176 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+import ccxt
+
+# Process-wide pool of authenticated Binance futures clients for the API
+# handlers (balance polling, key validation, square-off). Clients are keyed
+# by (hash of the API credentials, demo), so each user's client, and with it
+# its HTTP session and open keep-alive connections, is reused across
+# requests. Clients idle longer than EXCHANGE_IDLE_SECONDS are closed.
+#
+# Market metadata (load_markets() downloads every Binance market) is shared
+# by all clients through one cache per (exchange, demo) with a TTL, so only
+# the first client after expiry pays for the download.
+#
+#   with exchange_pool.client(api_key, api_secret, demo) as exchange:
+#       exchange.fetch_balance()
+#
+# Calls on one client are serialized; ccxt's sync clients are not meant to be
+# shared between threads.
+
+EXCHANGE_POOL_SIZE = int(os.getenv("EXCHANGE_POOL_SIZE", 512))
+EXCHANGE_IDLE_SECONDS = float(os.getenv("EXCHANGE_IDLE_SECONDS", 600))
+EXCHANGE_MARKETS_TTL = float(os.getenv("EXCHANGE_MARKETS_TTL", 3600))
+
+
+def create_exchange(api_key, api_secret, demo):
+    """Live futures client; demo keys are switched to Binance demo trading."""
+    exchange = ccxt.binance({
+        'apiKey': api_key,
+        'secret': api_secret,
+        'enableRateLimit': True,
+        'options': {'defaultType': 'future'}
+    })
+
+    if demo:
+        exchange.enable_demo_trading(True)
+    return exchange
+
+
+# Attributes load_markets() derives from the download; shared read-only between clients
+MARKET_ATTRIBUTES = (
+    "markets", "markets_by_id", "symbols", "ids",
+    "currencies", "currencies_by_id", "codes", "baseCurrencies", "quoteCurrencies",
+)
+
+
+class MarketCache:
+    def __init__(self, ttl=EXCHANGE_MARKETS_TTL):
+        self.ttl = ttl
+        self._entries = {}  # (exchange id, demo) -> (expires_at, {attribute: value})
+        self._loading = {}  # (exchange id, demo) -> Lock, so concurrent misses download once
+        self._lock = threading.Lock()
+
+    def ensure(self, exchange, demo=False):
+        """Gives `exchange` the shared market metadata, loading it when missing or expired."""
+        key = (exchange.id, bool(demo))
+        entry = self._fresh(key)
+        if entry is None:
+            with self._lock:
+                loading = self._loading.setdefault(key, threading.Lock())
+            with loading:
+                entry = self._fresh(key)
+                if entry is None:
+                    exchange.load_markets(reload=True)
+                    snapshot = {name: getattr(exchange, name, None) for name in MARKET_ATTRIBUTES}
+                    entry = (time.monotonic() + self.ttl, snapshot)
+                    with self._lock:
+                        self._entries[key] = entry
+        if exchange.markets is not entry[1]["markets"]:
+            # Assigning the indexes skips set_markets() re-processing every market per client
+            for name, value in entry[1].items():
+                setattr(exchange, name, value)
+        return exchange
+
+    def _fresh(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry if entry and entry[0] > time.monotonic() else None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class _Pooled:
+    __slots__ = ("exchange", "lock", "last_used")
+
+    def __init__(self, exchange):
+        self.exchange = exchange
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+
+
+class ExchangePool:
+    def __init__(self, factory=create_exchange, maxsize=EXCHANGE_POOL_SIZE,
+                 idle_seconds=EXCHANGE_IDLE_SECONDS, markets=None):
+        self.factory = factory
+        self.maxsize = maxsize
+        self.idle_seconds = idle_seconds
+        self.markets = markets or MarketCache()
+        self._clients = OrderedDict()  # key -> _Pooled, least recently used first
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(api_key, api_secret, demo):
+        # Credentials never sit in the pool's keys; a changed secret gets a new client
+        digest = hashlib.sha256(f"{api_key}\0{api_secret}".encode()).hexdigest()
+        return digest, bool(demo)
+
+    def _get(self, key, api_key, api_secret, demo):
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            # Least recently used first, so idle clients are at the front
+            while self._clients:
+                oldest = next(iter(self._clients.values()))
+                full = len(self._clients) >= self.maxsize and key not in self._clients
+                if not full and now - oldest.last_used <= self.idle_seconds:
+                    break
+                evicted.append(self._clients.popitem(last=False)[1])
+            pooled = self._clients.get(key)
+            if pooled is None:
+                pooled = self._clients[key] = _Pooled(self.factory(api_key, api_secret, demo))
+            self._clients.move_to_end(key)
+            pooled.last_used = now
+        for stale in evicted:
+            self._close(stale)
+        return pooled
+
+    @staticmethod
+    def _close(pooled):
+        # Waits for a call still running on it
+        with pooled.lock:
+            try:
+                pooled.exchange.close()
+            except Exception:
+                pass
+
+    @contextmanager
+    def client(self, api_key, api_secret, demo=False, markets=True):
+        """
+        Borrows the pooled client for these credentials, with market metadata
+        loaded unless `markets` is False. A client whose credentials are
+        rejected is dropped from the pool.
+        """
+        key = self.key(api_key, api_secret, demo)
+        pooled = self._get(key, api_key, api_secret, demo)
+        with pooled.lock:
+            try:
+                if markets:
+                    self.markets.ensure(pooled.exchange, demo)
+                yield pooled.exchange
+            except ccxt.AuthenticationError:
+                self.discard(api_key, api_secret, demo)
+                raise
+            finally:
+                pooled.last_used = time.monotonic()
+
+    def discard(self, api_key, api_secret, demo=False):
+        with self._lock:
+            pooled = self._clients.pop(self.key(api_key, api_secret, demo), None)
+        if pooled is not None:
+            try:
+                pooled.exchange.close()
+            except Exception:
+                pass
+
+    def __len__(self):
+        return len(self._clients)
+
+
+exchange_pool = ExchangePool()
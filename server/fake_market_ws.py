@@ -0,0 +1,45 @@
+import sys
+import json
+import time
+import random
+import asyncio
+import websockets
+
+# Local stand-in for the Binance futures market streams used by market_feed.py.
+# Emits a random-walk kline for the requested timeframe.
+#
+#   python fake_market_ws.py [port] [seconds_per_candle]
+#   MARKET_WS_URL=ws://localhost:8765 python bot.py
+
+
+async def stream(ws, candle_seconds):
+    price = 30000.0
+    start = int(time.time() // candle_seconds * candle_seconds * 1000)
+    candle = {"t": start, "o": price, "h": price, "l": price, "c": price, "v": 0.0}
+    while True:
+        now = int(time.time() * 1000)
+        if now >= candle["t"] + candle_seconds * 1000:
+            candle = {"t": candle["t"] + candle_seconds * 1000, "o": price, "h": price, "l": price, "c": price, "v": 0.0}
+        price *= 1 + random.gauss(0, 0.0005)
+        candle.update(h=max(candle["h"], price), l=min(candle["l"], price), c=price, v=candle["v"] + random.random())
+        kline = {"e": "kline", "k": {key: str(value) if key != "t" else value for key, value in candle.items()}}
+        await ws.send(json.dumps({"stream": "kline", "data": kline}))
+        await asyncio.sleep(0.5)
+
+
+async def main(port, candle_seconds):
+    async def handler(ws, *args):
+        try:
+            await stream(ws, candle_seconds)
+        except websockets.ConnectionClosed:
+            pass
+
+    async with websockets.serve(handler, "localhost", port):
+        print(f"Fake market stream on ws://localhost:{port}")
+        await asyncio.Future()
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    candle_seconds = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+    asyncio.run(main(port, candle_seconds))
@@ -0,0 +1,123 @@
+import re
+import sys
+import json
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the OpenAI endpoints used by ai_assistent.py and bot.py
+# (responses and chat completions), so strategy creation and autocomplete can
+# be exercised offline. Structured-output requests get parameters pulled from
+# the prompt with regexes, everything else a fixed EMA strategy.
+#
+#   python fake_openai.py [port] [latency_seconds]
+#   OPENAI_BASE_URL=http://localhost:8100/v1 OPENAI_API_KEY=x uvicorn main:app
+
+FAKE_STRATEGY = """def signals(df):
+    ema = ind.ema(df, 20)
+    entry = df['close'] > ema
+    exit = df['close'] < ema
+    return entry, exit"""
+
+
+def fake_params(text):
+    def find(pattern, default, cast=float):
+        match = re.search(pattern, text, re.IGNORECASE)
+        return cast(match.group(1)) if match else default
+
+    coins = [c for c in re.findall(r"\b([A-Z]{2,6})(?:/USDT)?\b", text) if c not in ("EMA", "SMA", "RSI", "TP", "SL", "USDT")]
+    return {
+        "name": " ".join(text.split()[:3]).title() or "Strategy",
+        "symbol": f"{coins[0] if coins else 'BTC'}/USDT",
+        "amount": find(r"\$\s*(\d+(?:\.\d+)?)", 100.0),
+        "leverage": find(r"(\d+)\s*x", 1, int),
+        "take_profit": find(r"(?:tp|take profit)\D*(\d+(?:\.\d+)?)\s*%", 5.0) / 100,
+        "stop_loss": find(r"(?:sl|stop loss)\D*(\d+(?:\.\d+)?)\s*%", 3.0) / 100,
+        "timeframe": find(r"\b(1m|5m|15m|30m|1h|4h|1d)\b", "1m", str),
+    }
+
+
+def last_user_text(messages):
+    for message in reversed(messages if isinstance(messages, list) else [{"role": "user", "content": messages}]):
+        if message.get("role") == "user":
+            content = message.get("content")
+            return content if isinstance(content, str) else " ".join(part.get("text", "") for part in content)
+    return ""
+
+
+def response_body(model, text):
+    return {
+        "id": f"resp_{uuid.uuid4().hex}",
+        "object": "response",
+        "created_at": int(time.time()),
+        "model": model,
+        "status": "completed",
+        "output": [{
+            "type": "message",
+            "id": f"msg_{uuid.uuid4().hex}",
+            "role": "assistant",
+            "status": "completed",
+            "content": [{"type": "output_text", "text": text, "annotations": []}],
+        }],
+        "parallel_tool_calls": False,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0},
+    }
+
+
+def chat_body(model, text):
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+class Handler(BaseHTTPRequestHandler):
+    latency = 0.0
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        model = request.get("model", "gpt-4o-mini")
+        time.sleep(self.latency)
+
+        if self.path.endswith("/responses"):
+            text_format = (request.get("text") or {}).get("format") or {}
+            user_text = last_user_text(request.get("input", []))
+            if text_format.get("type") == "json_schema":
+                text = json.dumps(fake_params(user_text))
+            else:
+                text = FAKE_STRATEGY
+            body = response_body(model, text)
+        elif self.path.endswith("/chat/completions"):
+            messages = request.get("messages", [])
+            if (request.get("response_format") or {}).get("type") == "json_object":
+                text = json.dumps({"reason": "Entered against the trend.", "optimized_code": FAKE_STRATEGY,
+                                   "new_stop_loss": 0.02, "new_take_profit": 0.05, "new_leverage": 5})
+            else:
+                text = " on 15m timeframe with 10x leverage and $500 amount." if last_user_text(messages) else ""
+            body = chat_body(model, text)
+        else:
+            self.send_error(404)
+            return
+
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8100
+    Handler.latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    print(f"Fake OpenAI API on http://localhost:{port}/v1")
+    ThreadingHTTPServer(("localhost", port), Handler).serve_forever()
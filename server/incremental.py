@@ -0,0 +1,163 @@
+import math
+from collections import deque
+import numpy as np
+import pandas as pd
+
+# Incremental strategy evaluation for the live loop. Candles live in a fixed
+# size ring buffer that only receives newly closed bars, and strategies can
+# declare stateful indicators that update in O(1) per bar:
+#
+#   INDICATORS = {"fast": ("ema", 20), "slow": ("sma", 50), "rsi": ("rsi", 14)}
+#
+#   def on_bar(bar, ind, state):
+#       if ind["fast"] > ind["slow"] and not state.get("in_trade"):
+#           state["in_trade"] = True
+#           return "BUY"
+#       ...
+#       return "HOLD"
+#
+# `bar` is a dict of the closed candle, `ind` the indicator values after it,
+# `state` a dict kept between calls. Strategies without `on_bar` keep using
+# run_strategy(df) on the buffered window.
+
+COLUMNS = ["timestamp", "open", "high", "low", "close", "volume"]
+
+
+class CandleBuffer:
+    """Fixed-capacity ring buffer of OHLCV rows."""
+
+    def __init__(self, capacity=500):
+        self.capacity = capacity
+        self._data = np.zeros((capacity, len(COLUMNS)), dtype=np.float64)
+        self._start = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, row):
+        end = (self._start + self._size) % self.capacity
+        self._data[end] = row
+        if self._size < self.capacity:
+            self._size += 1
+        else:
+            self._start = (self._start + 1) % self.capacity
+
+    def replace_last(self, row):
+        self._data[(self._start + self._size - 1) % self.capacity] = row
+
+    def last(self):
+        return self._data[(self._start + self._size - 1) % self.capacity] if self._size else None
+
+    def last_timestamp(self):
+        return int(self.last()[0]) if self._size else None
+
+    def to_array(self):
+        idx = (self._start + np.arange(self._size)) % self.capacity
+        return self._data[idx]
+
+    def frame(self):
+        df = pd.DataFrame(self.to_array(), columns=COLUMNS)
+        df["timestamp"] = df["timestamp"].astype("int64")
+        # A new frame every tick: caching indicators on it would only fill the cache
+        df.attrs["memoize"] = False
+        return df
+
+
+class EMA:
+    """Matches pandas `ewm(span=n).mean()` (adjust=True)."""
+
+    def __init__(self, span):
+        self.decay = 1 - 2 / (span + 1)
+        self._num = self._den = 0.0
+        self.value = math.nan
+
+    def update(self, x):
+        self._num = x + self.decay * self._num
+        self._den = 1 + self.decay * self._den
+        self.value = self._num / self._den
+        return self.value
+
+
+class SMA:
+    """Matches pandas `rolling(n).mean()` (NaN until n values)."""
+
+    def __init__(self, window):
+        self.window = window
+        self._values = deque()
+        self._sum = 0.0
+        self.value = math.nan
+
+    def update(self, x):
+        self._values.append(x)
+        self._sum += x
+        if len(self._values) > self.window:
+            self._sum -= self._values.popleft()
+        self.value = self._sum / self.window if len(self._values) == self.window else math.nan
+        return self.value
+
+
+class RSI:
+    """Wilder's RSI: simple average seed over `period` changes, then smoothing."""
+
+    def __init__(self, period=14):
+        self.period = period
+        self._prev = None
+        self._count = 0
+        self._gain = self._loss = 0.0
+        self.value = math.nan
+
+    def update(self, x):
+        if self._prev is not None:
+            change = x - self._prev
+            gain, loss = max(change, 0.0), max(-change, 0.0)
+            self._count += 1
+            if self._count <= self.period:
+                self._gain += gain / self.period
+                self._loss += loss / self.period
+            else:
+                self._gain = (self._gain * (self.period - 1) + gain) / self.period
+                self._loss = (self._loss * (self.period - 1) + loss) / self.period
+            if self._count >= self.period:
+                self.value = 100.0 if self._loss == 0 else 100 - 100 / (1 + self._gain / self._loss)
+        self._prev = x
+        return self.value
+
+
+INDICATOR_TYPES = {"ema": EMA, "sma": SMA, "rsi": RSI}
+
+
+def build_indicators(spec):
+    """Builds indicator objects from a strategy's INDICATORS declaration."""
+    indicators = {}
+    for name, (kind, *params) in spec.items():
+        if kind not in INDICATOR_TYPES:
+            raise ValueError(f"Unknown indicator '{kind}' for '{name}'")
+        indicators[name] = INDICATOR_TYPES[kind](*params)
+    return indicators
+
+
+class IncrementalRunner:
+    """
+    Feeds closed candles through a strategy's on_bar hook, keeping indicator
+    and strategy state between ticks.
+    """
+
+    def __init__(self, on_bar, indicator_spec, source="close"):
+        self.on_bar = on_bar
+        self.indicators = build_indicators(indicator_spec or {})
+        self.source = COLUMNS.index(source)
+        self.state = {}
+        self.values = {}
+
+    def step(self, row):
+        x = float(row[self.source])
+        self.values = {name: ind.update(x) for name, ind in self.indicators.items()}
+        bar = dict(zip(COLUMNS, (float(v) for v in row)))
+        return self.on_bar(bar, self.values, self.state) or "HOLD"
+
+    def warm_up(self, rows):
+        signal = "HOLD"
+        for row in rows:
+            signal = self.step(row)
+        return signal
@@ -0,0 +1,191 @@
+import os
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+# Indicator library injected into strategy code as `ind`, next to pd and np:
+#
+#   def signals(df):
+#       fast, slow = ind.ema(df, 20), ind.ema(df, 50)
+#       return (fast > slow) & (ind.rsi(df, 14) < 70), fast < slow
+#
+# Results are memoized per (dataset fingerprint, indicator, params), where the
+# fingerprint is the length and a 128-bit BLAKE2b digest of the input
+# columns, so every backtest, sweep or bot running on the same candles
+# computes each indicator once per process. The digest is cryptographic
+# because a collision would silently serve another frame's values.
+#
+# A column is hashed once per frame: under copy-on-write, a write to df
+# copies any column the cache still references, so an unchanged data
+# pointer means unchanged values (writes through raw NumPy views such as
+# df.values bypass this). Frames with attrs["memoize"] = False, like the
+# bot's rolling candle buffer, are new every tick and are never memoized.
+#
+# Each call returns a fresh Series on df's index; strategies may mutate it.
+# EMA/SMA/RSI match the incremental versions in incremental.py.
+
+INDICATOR_CACHE_MB = float(os.getenv("INDICATOR_CACHE_MB", 256))
+
+_COW = int(pd.__version__.split(".")[0]) >= 3 or pd.options.mode.copy_on_write is True
+
+
+def _wilder(values, period):
+    """Wilder smoothing: simple average of the first `period` values (from index 1), then recursive."""
+    seeded = values.copy()
+    seeded.iloc[:period] = np.nan
+    if len(values) > period:
+        seeded.iloc[period] = values.iloc[1:period + 1].mean()
+    return seeded.ewm(alpha=1 / period, adjust=False).mean()
+
+
+class Indicators:
+    def __init__(self, max_mb=INDICATOR_CACHE_MB):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._entries = OrderedDict()  # key -> tuple of read-only arrays
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._frames = {}  # id(df) -> (weakref to df, {column: (series, digest)})
+        self.hits = self.misses = 0
+
+    # --- Memoization ---
+
+    @staticmethod
+    def digest(series):
+        values = np.ascontiguousarray(series.to_numpy(dtype=np.float64))
+        return len(values), hashlib.blake2b(memoryview(values).cast("B"), digest_size=16).digest()
+
+    @classmethod
+    def fingerprint(cls, df, columns):
+        return tuple(cls.digest(df[column]) for column in columns)
+
+    @staticmethod
+    def _same_data(a, b):
+        return len(a) == len(b) and a.dtype == b.dtype and (
+            a.to_numpy().__array_interface__["data"][0] == b.to_numpy().__array_interface__["data"][0]
+        )
+
+    def _frame_fingerprint(self, df, columns):
+        """fingerprint(), reusing the digests of columns this frame already hashed."""
+        if not _COW:
+            return self.fingerprint(df, columns)
+        frame_id = id(df)
+        with self._lock:
+            entry = self._frames.get(frame_id)
+        if entry is None or entry[0]() is not df:
+            def forget(ref):
+                with self._lock:
+                    if self._frames.get(frame_id, (None,))[0] is ref:
+                        del self._frames[frame_id]
+            entry = (weakref.ref(df, forget), {})
+            with self._lock:
+                self._frames[frame_id] = entry
+        digests = entry[1]
+        parts = []
+        for column in columns:
+            # Holding the Series makes a later write to df copy the column first
+            series = df[column]
+            known = digests.get(column)
+            if known is None or not self._same_data(known[0], series):
+                known = digests[column] = (series, self.digest(series))
+            parts.append(known[1])
+        return tuple(parts)
+
+    def _memo(self, df, key, columns, compute):
+        arrays = None
+        if df.attrs.get("memoize") is False:
+            key = None
+        else:
+            key = (self._frame_fingerprint(df, columns), *key)
+            with self._lock:
+                arrays = self._entries.get(key)
+                if arrays is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+        if arrays is None:
+            result = compute()
+            arrays = tuple(
+                np.array(series.to_numpy(dtype=np.float64))
+                for series in (result if isinstance(result, tuple) else (result,))
+            )
+            for array in arrays:
+                array.setflags(write=False)
+            size = sum(array.nbytes for array in arrays)
+            with self._lock:
+                if key is not None:
+                    self.misses += 1
+                if key is not None and key not in self._entries and size <= self.max_bytes:
+                    self._entries[key] = arrays
+                    self._bytes += size
+                    while self._bytes > self.max_bytes:
+                        _, evicted = self._entries.popitem(last=False)
+                        self._bytes -= sum(array.nbytes for array in evicted)
+
+        series = tuple(pd.Series(array, index=df.index, copy=True) for array in arrays)
+        return series if len(series) > 1 else series[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._frames.clear()
+            self._bytes = 0
+
+    # --- Indicators ---
+
+    def ema(self, df, span, column="close"):
+        """pandas `ewm(span=span).mean()` (adjust=True)."""
+        return self._memo(df, ("ema", span, column), [column], lambda: df[column].ewm(span=span).mean())
+
+    def sma(self, df, window, column="close"):
+        return self._memo(df, ("sma", window, column), [column], lambda: df[column].rolling(window).mean())
+
+    def std(self, df, window, column="close"):
+        return self._memo(df, ("std", window, column), [column], lambda: df[column].rolling(window).std())
+
+    def highest(self, df, window, column="high"):
+        return self._memo(df, ("highest", window, column), [column], lambda: df[column].rolling(window).max())
+
+    def lowest(self, df, window, column="low"):
+        return self._memo(df, ("lowest", window, column), [column], lambda: df[column].rolling(window).min())
+
+    def rsi(self, df, period=14, column="close"):
+        """Wilder's RSI, 100 when there were no losses."""
+        def compute():
+            delta = df[column].diff()
+            gain = _wilder(delta.clip(lower=0), period)
+            loss = _wilder(-delta.clip(upper=0), period)
+            return (100 - 100 / (1 + gain / loss)).where(loss != 0, 100.0).where(gain.notna())
+        return self._memo(df, ("rsi", period, column), [column], compute)
+
+    def atr(self, df, period=14):
+        """Wilder's average true range."""
+        def compute():
+            prev_close = df["close"].shift(1)
+            true_range = pd.concat([
+                df["high"] - df["low"], (df["high"] - prev_close).abs(), (df["low"] - prev_close).abs()
+            ], axis=1).max(axis=1)
+            return _wilder(true_range, period)
+        return self._memo(df, ("atr", period), ["high", "low", "close"], compute)
+
+    def macd(self, df, fast=12, slow=26, signal=9, column="close"):
+        """(macd, signal, histogram) from ewm(adjust=False), the usual MACD convention."""
+        def compute():
+            line = df[column].ewm(span=fast, adjust=False).mean() - df[column].ewm(span=slow, adjust=False).mean()
+            signal_line = line.ewm(span=signal, adjust=False).mean()
+            return line, signal_line, line - signal_line
+        return self._memo(df, ("macd", fast, slow, signal, column), [column], compute)
+
+    def bollinger(self, df, window=20, k=2.0, column="close"):
+        """(middle, upper, lower) bands: rolling mean +/- k sample standard deviations."""
+        def compute():
+            middle = df[column].rolling(window).mean()
+            spread = k * df[column].rolling(window).std()
+            return middle, middle + spread, middle - spread
+        return self._memo(df, ("bollinger", window, k, column), [column], compute)
+
+
+INDICATORS = ("ema", "sma", "std", "highest", "lowest", "rsi", "atr", "macd", "bollinger")
+
+ind = Indicators()
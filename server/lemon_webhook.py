@@ -4,7 +4,7 @@ import json
 from datetime import datetime, timezone
 from fastapi import APIRouter, Request, HTTPException, Header
 import os
-from db import users_collection
+from db_async import update_user, user_exists
 
 router = APIRouter()
 
@@ -73,8 +73,7 @@ async def lemon_webhook(request: Request, x_signature: str = Header(None)):
             "message": "User email not found in webhook payload.",
         }
 
-    user = users_collection.find_one({"email": email})
-    if not user:
+    if not await user_exists(email):
         # A user should be registered in your system before they can subscribe.
         return {"status": "error", "message": f"User with email {email} not found."}
 
@@ -86,8 +85,8 @@ async def lemon_webhook(request: Request, x_signature: str = Header(None)):
         if not plan:
             return {"status": "error", "message": "Invalid plan variant ID: {variant_id}"}
 
-        users_collection.update_one(
-            {"email": email},
+        await update_user(
+            email,
             {
                 "$set": {
                     "subscription_status": "active",
@@ -110,8 +109,8 @@ async def lemon_webhook(request: Request, x_signature: str = Header(None)):
     # Event: A subscription is updated
     elif event == "subscription_updated":
         plan = PLANS.get(variant_id)
-        users_collection.update_one(
-            {"email": email},
+        await update_user(
+            email,
             {
                 "$set": {
                     "credits": plan["credits"],
@@ -127,8 +126,8 @@ async def lemon_webhook(request: Request, x_signature: str = Header(None)):
     # Event: Subscription is cancelled by the user or admin
     elif event == "subscription_cancelled":
 
-        users_collection.update_one(
-            {"email": email},
+        await update_user(
+            email,
             {
                 "$set": {
                     "subscription_status": "cancelled",
@@ -148,8 +147,8 @@ async def lemon_webhook(request: Request, x_signature: str = Header(None)):
     # Event: Subscription expires (e.g., payment fails)
     elif event == "subscription_expired":
 
-        users_collection.update_one(
-            {"email": email},
+        await update_user(
+            email,
             {
                 "$set": {
                     "subscription_status": "expired",
@@ -1,12 +1,15 @@
-from fastapi import FastAPI, Body, Form
+from fastapi import FastAPI, Body, Form, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, EmailStr
-from db import users_collection
+from db import ensure_indexes
+from quota import lease_cache
+from db_async import get_profile, user_exists, insert_user, list_users, attach_strategies
 from lemon_webhook import router as lemon_webhook_router
 from ai_assistent import router as ai_assistent_router
 from backtest import router as backtest_router
 from binance import router as binance_router
 from algo import router as algo_router
+from sweep import router as sweep_router
 from datetime import datetime
 
 app = FastAPI()
@@ -26,6 +29,15 @@ app.include_router(ai_assistent_router)
 app.include_router(backtest_router)
 app.include_router(algo_router)
 app.include_router(binance_router)
+app.include_router(sweep_router)
+
+@app.on_event("startup")
+def create_indexes():
+    ensure_indexes()
+
+@app.on_event("shutdown")
+async def release_quota_leases():
+    await lease_cache.release_all()
 
 @app.api_route("/health", methods=["GET", "HEAD"])
 async def health_check():
@@ -33,20 +45,18 @@ async def health_check():
 
 # Get user by email
 @app.get("/user/{email}")
-def get_user(email: str):
-    user = users_collection.find_one({"email": email})
+async def get_user(email: str):
+    user = await get_profile(email)
     if user:
         user["_id"] = str(user["_id"])
         return user
     raise HTTPException(status_code=404, detail="User not found")
 
 @app.post("/add-user")
-def save_referral(email: str = Form(...)):
+async def save_referral(email: str = Form(...)):
 
     # 1. Check if user exists with email
-    user = users_collection.find_one({"email": email})
-    
-    if user:
+    if await user_exists(email):
         return {"message": "User already exists"}
 
     # 3. If user doesn't exist, insert as new user and give 3 aura
@@ -59,15 +69,15 @@ def save_referral(email: str = Form(...)):
         "active": False,
     }
 
-    users_collection.insert_one(user_data)
+    await insert_user(user_data)
     return {"message": "User added successfully"}
 
 @app.get("/users-full")
-def get_users_full():
+async def get_users_full():
 
     try:
         # Fetch all users with all fields
-        users = list(users_collection.find({}))
+        users = await attach_strategies(await list_users())
 
         # Convert ObjectId to string for JSON serialization
         for user in users:
@@ -0,0 +1,123 @@
+import os
+import json
+import asyncio
+import threading
+import websockets
+from incremental import CandleBuffer
+from scheduler import timeframe_ms, is_stale
+
+# Streaming market data for bots. Subscribes to the Binance futures kline
+# stream for one symbol/timeframe and maintains the live candle buffer in a
+# background thread. Drops are reconnected with backoff and any missed
+# candles are backfilled over REST before streaming resumes. While the stream
+# is down or behind, `fresh()` is False and the bot polls REST itself.
+# MARKET_WS_URL points the feed at another server (e.g. fake_market_ws.py).
+
+BINANCE_FUTURES_WS = "wss://fstream.binance.com"
+BINANCE_DEMO_WS = "wss://fstream.binancefuture.com"
+MARKET_WS_URL = os.getenv("MARKET_WS_URL")
+
+
+def stream_name(symbol):
+    return symbol.replace("/", "").split(":")[0].lower()
+
+
+class MarketFeed:
+    def __init__(self, exchange, symbol, timeframe, demo=False, capacity=500, url=None):
+        self.exchange = exchange  # REST client used for the initial load and backfills
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.tf_ms = timeframe_ms(timeframe)
+        self.buffer = CandleBuffer(capacity)
+        self.connected = threading.Event()
+        self._lock = threading.Lock()
+        self._stop = False
+        name = stream_name(symbol)
+        base = url or MARKET_WS_URL or (BINANCE_DEMO_WS if demo else BINANCE_FUTURES_WS)
+        # Klines only: SL/TP are checked on the last close, as in backtests
+        self.url = f"{base}/stream?streams={name}@kline_{timeframe}"
+
+    # --- Buffer access (bot thread) ---
+
+    def bars_since(self, since=None):
+        """Same shape as exchange.fetch_ohlcv: rows with timestamp >= since."""
+        with self._lock:
+            rows = self.buffer.to_array()
+        if since is not None:
+            rows = rows[rows[:, 0] >= since]
+        return [[int(r[0]), *map(float, r[1:])] for r in rows]
+
+    def fresh(self, now_ms=None):
+        """False while disconnected or when the current candle has not arrived."""
+        with self._lock:
+            last = self.buffer.last_timestamp()
+        return self.connected.is_set() and not is_stale(last, self.tf_ms, now_ms)
+
+    def last_price(self):
+        with self._lock:
+            last = self.buffer.last()
+            return float(last[4]) if last is not None else None
+
+    # --- Feed thread ---
+
+    def start(self):
+        self._backfill()
+        threading.Thread(target=lambda: asyncio.run(self._run()), daemon=True, name="market-feed").start()
+        return self
+
+    def stop(self):
+        self._stop = True
+
+    def _apply(self, row):
+        with self._lock:
+            last = self.buffer.last_timestamp()
+            if last is None or row[0] > last:
+                self.buffer.append(row)
+            elif row[0] == last:
+                self.buffer.replace_last(row)
+
+    def _backfill(self):
+        since = self.buffer.last_timestamp()
+        if since is None:
+            bars = self.exchange.fetch_ohlcv(self.symbol, self.timeframe, limit=self.buffer.capacity)
+        else:
+            bars = self.exchange.fetch_ohlcv(self.symbol, self.timeframe, since=since)
+        for bar in bars:
+            self._apply(bar)
+
+    def _on_message(self, raw):
+        """Handles one stream message; returns a kline row that still needs applying."""
+        msg = json.loads(raw)
+        data = msg.get("data", msg)
+        event = data.get("e")
+        if event == "kline":
+            k = data["k"]
+            return [k["t"], float(k["o"]), float(k["h"]), float(k["l"]), float(k["c"]), float(k["v"])]
+        return None
+
+    async def _run(self):
+        delay = 1
+        while not self._stop:
+            try:
+                async with websockets.connect(self.url, ping_interval=20) as ws:
+                    self.connected.set()
+                    delay = 1
+                    # Anything that closed while we were disconnected
+                    await asyncio.to_thread(self._backfill)
+                    async for raw in ws:
+                        if self._stop:
+                            return
+                        row = self._on_message(raw)
+                        if row is None:
+                            continue
+                        last = self.buffer.last_timestamp()
+                        if last is not None and row[0] > last + self.tf_ms:
+                            print(f"⚠️ Market feed gap after {last}, backfilling")
+                            await asyncio.to_thread(self._backfill)
+                        self._apply(row)
+            except Exception as e:
+                print(f"⚠️ Market feed disconnected: {e}")
+            self.connected.clear()
+            if not self._stop:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60)
@@ -0,0 +1,202 @@
+import os
+import json
+import asyncio
+import threading
+import socket
+import time
+import ccxt
+from incremental import CandleBuffer
+from scheduler import timeframe_ms, is_stale
+
+# Shared market-data hub. One process fetches each (symbol, timeframe) once
+# and publishes candles to every subscribed bot over a Unix socket, so
+# exchange calls scale with distinct symbols instead of deployed bots.
+#
+# Protocol (newline-delimited JSON):
+#   bot -> hub: {"subscribe": ["BTC/USDT", "1m"]}
+#   hub -> bot: {"symbol": ..., "timeframe": ..., "candles": [[ts, o, h, l, c, v], ...]}
+# The first message after subscribing is a full snapshot, later ones carry
+# only new or updated candles.
+#
+#   python market_hub.py            # run the hub
+#   MARKET_FEED=hub python bot.py   # bot side, via HubFeed
+
+MARKET_HUB_SOCKET = os.getenv("MARKET_HUB_SOCKET", "/var/run/richacle/market.sock")
+HUB_POLL_SECONDS = float(os.getenv("HUB_POLL_SECONDS", 5))
+HUB_BUFFER = int(os.getenv("HUB_BUFFER", 500))
+
+
+class Topic:
+    """One (symbol, timeframe) stream: a candle buffer and its subscribers."""
+
+    def __init__(self, symbol, timeframe):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.buffer = CandleBuffer(HUB_BUFFER)
+        self.subscribers = set()
+        self.task = None
+
+    def message(self, rows):
+        return (json.dumps({"symbol": self.symbol, "timeframe": self.timeframe, "candles": rows}) + "\n").encode()
+
+
+class MarketHub:
+    def __init__(self, exchange=None, path=MARKET_HUB_SOCKET, poll_seconds=HUB_POLL_SECONDS):
+        self.exchange = exchange or ccxt.binance({"enableRateLimit": True, "options": {"defaultType": "future"}})
+        self.path = path
+        self.poll_seconds = poll_seconds
+        self.topics = {}
+
+    async def _poll(self, topic):
+        """Fetches only candles at/after the last buffered one and fans them out."""
+        while topic.subscribers:
+            try:
+                since = topic.buffer.last_timestamp()
+                if since is None:
+                    bars = await asyncio.to_thread(self.exchange.fetch_ohlcv, topic.symbol, topic.timeframe, limit=HUB_BUFFER)
+                else:
+                    bars = await asyncio.to_thread(self.exchange.fetch_ohlcv, topic.symbol, topic.timeframe, since=since)
+                changed = []
+                for bar in bars:
+                    last = topic.buffer.last_timestamp()
+                    if last is None or bar[0] > last:
+                        topic.buffer.append(bar)
+                        changed.append(bar)
+                    elif bar[0] == last:
+                        topic.buffer.replace_last(bar)
+                        changed.append(bar)
+                if changed:
+                    await self._publish(topic, topic.message(changed))
+            except Exception as e:
+                print(f"⚠️ Hub fetch error {topic.symbol} {topic.timeframe}: {e}")
+            await asyncio.sleep(self.poll_seconds)
+        if self.topics.get((topic.symbol, topic.timeframe)) is topic:
+            del self.topics[(topic.symbol, topic.timeframe)]
+
+    async def _publish(self, topic, payload):
+        for writer in list(topic.subscribers):
+            try:
+                writer.write(payload)
+                await writer.drain()
+            except Exception:
+                topic.subscribers.discard(writer)
+
+    async def _handle(self, reader, writer):
+        subscribed = []
+        try:
+            async for line in reader:
+                request = json.loads(line)
+                if "subscribe" not in request:
+                    continue
+                symbol, timeframe = request["subscribe"]
+                key = (symbol, timeframe)
+                topic = self.topics.get(key)
+                if topic is None:
+                    topic = self.topics[key] = Topic(symbol, timeframe)
+                topic.subscribers.add(writer)
+                subscribed.append(topic)
+                if len(topic.buffer):
+                    rows = [[int(r[0]), *map(float, r[1:])] for r in topic.buffer.to_array()]
+                    writer.write(topic.message(rows))
+                    await writer.drain()
+                if topic.task is None or topic.task.done():
+                    topic.task = asyncio.create_task(self._poll(topic))
+        except Exception as e:
+            print(f"⚠️ Hub client error: {e}")
+        finally:
+            for topic in subscribed:
+                topic.subscribers.discard(writer)
+            writer.close()
+
+    async def serve(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        server = await asyncio.start_unix_server(self._handle, path=self.path)
+        os.chmod(self.path, 0o666)
+        print(f"🛰️ Market hub listening on {self.path}")
+        async with server:
+            await server.serve_forever()
+
+
+class HubFeed:
+    """
+    Bot-side subscriber with the same interface as market_feed.MarketFeed:
+    keeps a local candle buffer fed by the hub and reconnects on failure.
+    Like MarketFeed, it is not `fresh()` while disconnected, empty or behind
+    the current candle, and the bot then fetches candles over REST.
+    """
+
+    def __init__(self, symbol, timeframe, capacity=500, path=MARKET_HUB_SOCKET):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.tf_ms = timeframe_ms(timeframe)
+        self.path = path
+        self.url = f"unix://{path}"
+        self.buffer = CandleBuffer(capacity)
+        self.connected = threading.Event()
+        self._lock = threading.Lock()
+        self._stop = False
+
+    def bars_since(self, since=None):
+        with self._lock:
+            rows = self.buffer.to_array()
+        if since is not None:
+            rows = rows[rows[:, 0] >= since]
+        return [[int(r[0]), *map(float, r[1:])] for r in rows]
+
+    def fresh(self, now_ms=None):
+        with self._lock:
+            last = self.buffer.last_timestamp()
+        return self.connected.is_set() and not is_stale(last, self.tf_ms, now_ms)
+
+    def last_price(self):
+        with self._lock:
+            last = self.buffer.last()
+            return float(last[4]) if last is not None else None
+
+    def start(self, timeout=30):
+        threading.Thread(target=self._run, daemon=True, name="hub-feed").start()
+        # Usually the first snapshot arrives here; if not, the bot polls REST until it does
+        deadline = time.time() + timeout
+        while not len(self.buffer) and time.time() < deadline:
+            time.sleep(0.1)
+        if not len(self.buffer):
+            print(f"⚠️ No candles from market hub {self.url} after {timeout}s, using REST until it answers")
+        return self
+
+    def stop(self):
+        self._stop = True
+
+    def _apply(self, rows):
+        with self._lock:
+            for row in rows:
+                last = self.buffer.last_timestamp()
+                if last is None or row[0] > last:
+                    self.buffer.append(row)
+                elif row[0] == last:
+                    self.buffer.replace_last(row)
+
+    def _run(self):
+        delay = 1
+        while not self._stop:
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                    sock.connect(self.path)
+                    sock.sendall((json.dumps({"subscribe": [self.symbol, self.timeframe]}) + "\n").encode())
+                    self.connected.set()
+                    delay = 1
+                    for line in sock.makefile("r"):
+                        if self._stop:
+                            return
+                        self._apply(json.loads(line)["candles"])
+            except Exception as e:
+                print(f"⚠️ Market hub disconnected: {e}")
+            self.connected.clear()
+            if not self._stop:
+                time.sleep(delay)
+                delay = min(delay * 2, 60)
+
+
+if __name__ == "__main__":
+    asyncio.run(MarketHub().serve())
@@ -0,0 +1,189 @@
+import numpy as np
+
+# Vectorized backtest scoring. The trade list returned by run_strategy is
+# turned into NumPy arrays once; every metric is then computed column-wise,
+# so scoring stays in the millisecond range even for tens of thousands of
+# trades. Independent of FastAPI so sweeps, simulators and bots can reuse it.
+#
+# Time-based metrics need each trade's bars. The signal engine reports them
+# (`entry_idx`/`exit_idx` on each trade); only trades that carry prices alone
+# go through locate_trades(), a sequential price-matching fallback.
+
+INITIAL_CAPITAL = 10000
+MS_PER_YEAR = 365 * 24 * 60 * 60 * 1000
+LOCATE_BLOCK = 256  # bars scanned per step when matching a price against bar ranges
+
+
+def trades_to_arrays(trades):
+    """Converts a list of trade dicts to entry/exit/qty float arrays."""
+    n = len(trades)
+    entry = np.fromiter((t["entry_price"] for t in trades), dtype=np.float64, count=n)
+    exit = np.fromiter((t["exit_price"] for t in trades), dtype=np.float64, count=n)
+    qty = np.fromiter((t.get("qty", 1) for t in trades), dtype=np.float64, count=n)
+    return entry, exit, qty
+
+
+def trade_bars(trades):
+    """
+    (entry_idx, exit_idx) arrays when every trade reports its bars, as
+    trades from the signal engine do; None otherwise.
+    """
+    if not all("entry_idx" in t and "exit_idx" in t for t in trades):
+        return None
+    n = len(trades)
+    entry_idx = np.fromiter((t["entry_idx"] for t in trades), dtype=np.int64, count=n)
+    exit_idx = np.fromiter((t["exit_idx"] for t in trades), dtype=np.int64, count=n)
+    return entry_idx, exit_idx
+
+
+def _first_in_range(price, high, low, start):
+    for lo in range(start, len(high), LOCATE_BLOCK):
+        hit = np.flatnonzero((low[lo:lo + LOCATE_BLOCK] <= price) & (high[lo:lo + LOCATE_BLOCK] >= price))
+        if len(hit):
+            return lo + int(hit[0])
+    return -1
+
+
+def locate_trades(entry, exit, close, high=None, low=None):
+    """
+    Fallback for trades that only report prices (prefer trade_bars()).
+    Entries and exits are matched in order, each to the first bar at or
+    after the previous match whose close equals the price or, failing that
+    and when high/low are given, whose low-high range contains it (fills at
+    the open, a stop or a limit). Unmatched prices get index -1.
+
+    Only an approximation: a price several closes share binds to the
+    earliest of them, possibly before the real fill, and a trade that opens
+    before the previous one closed is placed after it. The walk is
+    sequential; close lookups are binary searches, range lookups scan
+    forward LOCATE_BLOCK bars at a time.
+    """
+    order = np.argsort(close, kind="stable")  # equal prices keep bar order
+    sorted_close = close[order]
+
+    # Interleave entry/exit so the bar cursor only ever moves forward
+    prices = np.empty(2 * len(entry))
+    prices[0::2] = entry
+    prices[1::2] = exit
+    lo = np.searchsorted(sorted_close, prices, side="left").tolist()
+    hi = np.searchsorted(sorted_close, prices, side="right").tolist()
+
+    found = [-1] * len(prices)
+    cursor = 0
+    for i in range(len(prices)):
+        start, stop = lo[i], hi[i]
+        if stop - start > 1:
+            start += int(np.searchsorted(order[start:stop], cursor))
+        bar = int(order[start]) if start < stop else -1
+        if bar < cursor and high is not None and low is not None:
+            bar = _first_in_range(prices[i], high, low, cursor)
+        if bar >= cursor:
+            found[i] = cursor = bar
+
+    found = np.asarray(found, dtype=np.int64)
+    return found[0::2], found[1::2]
+
+
+def compute_metrics(trades, timestamps=None, close=None, initial_capital=INITIAL_CAPITAL):
+    """
+    Scores a list of trades. When candle `timestamps` and `close` are given,
+    trades are located on the bar grid to add exposure, average duration and
+    annualized Sharpe/Sortino.
+    """
+    entry, exit, qty = trades_to_arrays(trades)
+    return score_trades(entry, exit, qty, timestamps, close, initial_capital, bars=trade_bars(trades))
+
+
+def score_trades(entry, exit, qty, timestamps=None, close=None, initial_capital=INITIAL_CAPITAL, bars=None):
+    """
+    Array form of compute_metrics for callers that already hold trade arrays.
+    `bars` are the trades' (entry_idx, exit_idx) when the caller knows them.
+    """
+    pnl = (exit - entry) * qty
+    n = len(pnl)
+
+    equity = np.concatenate(([0.0], np.cumsum(pnl)))
+    max_drawdown = float(np.max(np.maximum.accumulate(equity) - equity))
+    total_pnl = float(equity[-1])
+
+    wins = int(np.count_nonzero(pnl > 0))
+    gross_profit = float(pnl[pnl > 0].sum())
+    gross_loss = float(-pnl[pnl <= 0].sum())
+
+    notional = np.abs(entry * qty)
+    returns = np.divide(pnl, notional, out=np.zeros(n), where=notional > 0)
+
+    periods = 1
+    exposure = avg_duration_hours = None
+    if timestamps is not None and close is not None and n and len(close):
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        entry_idx, exit_idx = bars if bars is not None else locate_trades(entry, exit, np.asarray(close, dtype=np.float64))
+        located = (entry_idx >= 0) & (exit_idx >= 0)
+        if located.any():
+            bars_held = (exit_idx - entry_idx)[located]
+            exposure = float(bars_held.sum() / len(close) * 100)
+            durations = timestamps[exit_idx[located]] - timestamps[entry_idx[located]]
+            avg_duration_hours = float(durations.mean() / 3_600_000)
+        span = timestamps[-1] - timestamps[0]
+        if span > 0:
+            periods = n * MS_PER_YEAR / span
+
+    sharpe = sortino = 0.0
+    if n > 1:
+        mean = returns.mean()
+        std = returns.std(ddof=1)
+        if std > 0:
+            sharpe = float(mean / std * np.sqrt(periods))
+        downside = np.sqrt(np.mean(np.minimum(returns, 0.0) ** 2))
+        if downside > 0:
+            sortino = float(mean / downside * np.sqrt(periods))
+
+    return {
+        "pnl": pnl,
+        "equity": equity,
+        "total_pnl": total_pnl,
+        "return_percent": total_pnl / initial_capital * 100,
+        "max_drawdown": max_drawdown,
+        "total_trades": n,
+        "wins": wins,
+        "losses": n - wins,
+        "win_rate_percent": (wins / n * 100) if n else 0,
+        "profit_factor": (gross_profit / gross_loss) if gross_loss > 0 else None,
+        "sharpe": sharpe,
+        "sortino": sortino,
+        "exposure_percent": exposure,
+        "avg_trade_duration_hours": avg_duration_hours,
+    }
+
+
+def summarize(metrics):
+    """Rounds the scalar metrics for a JSON response."""
+    return {
+        key: (round(value, 2) if isinstance(value, float) else value)
+        for key, value in metrics.items()
+        if key not in ("pnl", "equity")
+    }
+
+
+def aggregate(summaries, initial_capital=INITIAL_CAPITAL):
+    """Combines summarized metrics of several backtests (one capital each)."""
+    if len(summaries) == 1:
+        return dict(summaries[0])
+
+    total_pnl = sum(m["total_pnl"] for m in summaries)
+    total_trades = sum(m["total_trades"] for m in summaries)
+    wins = sum(m["wins"] for m in summaries)
+    capital = initial_capital * len(summaries)
+    return {
+        "total_pnl": round(total_pnl, 2),
+        "return_percent": round(total_pnl / capital * 100, 2) if summaries else 0,
+        "max_drawdown": max((m["max_drawdown"] for m in summaries), default=0),
+        "total_trades": total_trades,
+        "wins": wins,
+        "losses": total_trades - wins,
+        "win_rate_percent": round(wins / total_trades * 100, 2) if total_trades else 0,
+        "sharpe": round(float(np.mean([m["sharpe"] for m in summaries])), 2) if summaries else 0,
+        "sortino": round(float(np.mean([m["sortino"] for m in summaries])), 2) if summaries else 0,
+        "cells": len(summaries),
+        "profitable_cells": sum(1 for m in summaries if m["total_pnl"] > 0),
+    }
@@ -0,0 +1,84 @@
+import argparse
+from pymongo import ReplaceOne, UpdateOne
+from db import users_collection, strategies_collection, STRATEGY_STORE
+
+# Moves strategies from the legacy `user.strategies` array into the
+# `strategies` collection (see db.py).
+#
+#   python migrate_strategies.py --dry-run
+#   python migrate_strategies.py                   # copy, keep the arrays
+#   python migrate_strategies.py --unset-embedded  # drop the arrays, no copy
+#
+# Run it while the API is on the default STRATEGY_STORE (embedded), set
+# STRATEGY_STORE=collection once it has copied everything, then run it again
+# with --unset-embedded.
+#
+# While the arrays are still authoritative (STRATEGY_STORE=embedded) a re-run
+# refreshes the copies. After the switch the collection is authoritative: a
+# copy only inserts strategies that are missing there, and --unset-embedded
+# copies nothing, so stale arrays never overwrite newer positions, PnL or
+# code, nor bring back deleted strategies.
+
+
+def copy_strategies(dry_run=False, batch_size=500):
+    strategies_collection.create_index("email")
+    refresh = STRATEGY_STORE == "embedded"
+
+    users = strategies_moved = 0
+    ops = []
+    for user in users_collection.find({"strategies.0": {"$exists": True}}, {"email": 1, "strategies": 1}):
+        users += 1
+        for strategy in user["strategies"]:
+            if not strategy.get("id"):
+                print(f"⚠️ Skipping strategy without id for {user['email']}")
+                continue
+            doc = {**strategy, "_id": strategy["id"], "email": user["email"]}
+            if refresh:
+                ops.append(ReplaceOne({"_id": strategy["id"]}, doc, upsert=True))
+            else:
+                ops.append(UpdateOne({"_id": strategy["id"]}, {"$setOnInsert": doc}, upsert=True))
+            strategies_moved += 1
+        if len(ops) >= batch_size:
+            if not dry_run:
+                strategies_collection.bulk_write(ops, ordered=False)
+            ops = []
+    if ops and not dry_run:
+        strategies_collection.bulk_write(ops, ordered=False)
+
+    mode = "" if refresh else " (missing ones only)"
+    print(f"{'Would copy' if dry_run else 'Copied'} {strategies_moved} strategies from {users} users{mode}")
+
+
+def unset_embedded(dry_run=False):
+    """Drops each user's array once every strategy id in it is in the collection."""
+    dropped = kept = 0
+    for user in users_collection.find({"strategies.0": {"$exists": True}}, {"email": 1, "strategies.id": 1}):
+        ids = {s.get("id") for s in user["strategies"]}
+        present = {doc["_id"] for doc in strategies_collection.find(
+            {"_id": {"$in": list(ids)}, "email": user["email"]}, {"_id": 1}
+        )}
+        missing = ids - present
+        if missing:
+            # Deleted since the switch, or never copied: left for a manual look
+            print(f"⚠️ Keeping embedded strategies for {user['email']}: {len(missing)} not in the collection")
+            kept += 1
+            continue
+        if not dry_run:
+            users_collection.update_one({"_id": user["_id"]}, {"$unset": {"strategies": ""}})
+        dropped += 1
+    print(f"{'Would drop' if dry_run else 'Dropped'} embedded strategies from {dropped} users, kept {kept}")
+
+
+def migrate(dry_run=False, unset=False, batch_size=500):
+    if unset:
+        unset_embedded(dry_run)
+    else:
+        copy_strategies(dry_run, batch_size)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move user.strategies into the strategies collection")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--unset-embedded", action="store_true", help="remove the legacy arrays (after the switch); copies nothing")
+    args = parser.parse_args()
+    migrate(dry_run=args.dry_run, unset=args.unset_embedded)
@@ -0,0 +1,169 @@
+import os
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+import db
+import db_async
+
+# Metered counters on the user document ("credits", "backtest", "copilot").
+# A call reserves its units up front with one conditional find_one_and_update
+# (the balance can never go negative, however many requests race) and gives
+# them back if the work fails:
+#
+#   async with metered(email, "credits") as charge:
+#       ...                      # an exception refunds automatically
+#       if nothing_to_bill:
+#           await charge.refund()
+#
+# QUOTA_LEASE_SIZE > 0 turns on in-process leasing for the counters in
+# QUOTA_LEASE_COUNTERS: a hot user's units are taken from Mongo in blocks
+# and handed out locally; what is left of a block goes back after
+# QUOTA_LEASE_SECONDS. A crashed process can keep a user's unused lease, so
+# only enable it for cheap counters such as autocomplete.
+
+QUOTA_LEASE_SIZE = int(os.getenv("QUOTA_LEASE_SIZE", 0))
+QUOTA_LEASE_SECONDS = float(os.getenv("QUOTA_LEASE_SECONDS", 30))
+QUOTA_LEASE_COUNTERS = {c for c in os.getenv("QUOTA_LEASE_COUNTERS", "copilot").split(",") if c}
+
+INSUFFICIENT = {
+    "credits": "Insufficient credits",
+    "backtest": "Insufficient backtest",
+    "copilot": "Credits exhausted or user not found",
+}
+
+
+def _reserve_query(email, counter, amount):
+    return {"email": email, counter: {"$gte": amount}}, {"$inc": {counter: -amount}}
+
+
+async def reserve(email, counter, amount=1):
+    """Takes `amount` units atomically; returns the new balance or None if short."""
+    query, update = _reserve_query(email, counter, amount)
+    user = await db_async.users_collection.find_one_and_update(
+        query, update, {counter: 1, "_id": 0}, return_document=ReturnDocument.BEFORE
+    )
+    return None if user is None else user[counter] - amount
+
+
+async def refund(email, counter, amount=1):
+    await db_async.users_collection.update_one({"email": email}, {"$inc": {counter: amount}})
+
+
+def reserve_sync(email, counter, amount=1):
+    """reserve() for the bot and other non-async callers."""
+    query, update = _reserve_query(email, counter, amount)
+    user = db.users_collection.find_one_and_update(
+        query, update, {counter: 1, "_id": 0}, return_document=ReturnDocument.BEFORE
+    )
+    return None if user is None else user[counter] - amount
+
+
+def refund_sync(email, counter, amount=1):
+    db.users_collection.update_one({"email": email}, {"$inc": {counter: amount}})
+
+
+class LeaseCache:
+    """Per-(email, counter) blocks of units reserved in Mongo, spent locally."""
+
+    def __init__(self, size=QUOTA_LEASE_SIZE, ttl=QUOTA_LEASE_SECONDS):
+        self.size = size
+        self.ttl = ttl
+        self.leases = {}  # (email, counter) -> [units, expires_at]
+        self._locks = {}
+
+    async def take(self, email, counter, amount=1):
+        key = (email, counter)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            lease = self.leases.get(key)
+            if lease and lease[1] <= time.monotonic():
+                await self._release(key)
+                lease = None
+            if lease and lease[0] >= amount:
+                lease[0] -= amount
+                return True
+            # Lease a block when the user can afford it, else fall back to one call
+            block = max(self.size, amount)
+            if await reserve(email, counter, block) is not None:
+                self.leases[key] = [block - amount, time.monotonic() + self.ttl]
+                return True
+            return await reserve(email, counter, amount) is not None
+
+    async def give_back(self, email, counter, amount=1):
+        key = (email, counter)
+        lease = self.leases.get(key)
+        if lease and lease[1] > time.monotonic():
+            lease[0] += amount
+        else:
+            await refund(email, counter, amount)
+
+    async def _release(self, key):
+        units, _ = self.leases.pop(key)
+        if units:
+            await refund(*key, units)
+
+    async def release_all(self):
+        """Returns every unused unit, e.g. at shutdown."""
+        for key in list(self.leases):
+            await self._release(key)
+
+
+lease_cache = LeaseCache()
+
+
+def _leased(counter):
+    return QUOTA_LEASE_SIZE > 0 and counter in QUOTA_LEASE_COUNTERS
+
+
+async def take(email, counter, amount=1):
+    """True if `amount` units were reserved, via the lease cache when enabled."""
+    if _leased(counter):
+        return await lease_cache.take(email, counter, amount)
+    return await reserve(email, counter, amount) is not None
+
+
+async def give_back(email, counter, amount=1):
+    if _leased(counter):
+        await lease_cache.give_back(email, counter, amount)
+    else:
+        await refund(email, counter, amount)
+
+
+class Charge:
+    def __init__(self, email, counter, amount):
+        self.email = email
+        self.counter = counter
+        self.amount = amount
+        self.refunded = False
+
+    async def refund(self):
+        if not self.refunded:
+            self.refunded = True
+            await give_back(self.email, self.counter, self.amount)
+
+
+async def charge(email, counter, amount=1, status_code=403, missing_status=404):
+    """
+    Reserves units and returns the Charge to refund them with. Raises
+    HTTPException (`missing_status` for unknown users, `status_code` when the
+    balance is short).
+    """
+    if not await take(email, counter, amount):
+        if not await db_async.user_exists(email):
+            detail = "User not found" if missing_status == 404 else INSUFFICIENT.get(counter)
+            raise HTTPException(status_code=missing_status, detail=detail)
+        raise HTTPException(status_code=status_code, detail=INSUFFICIENT.get(counter, f"Insufficient {counter}"))
+    return Charge(email, counter, amount)
+
+
+@asynccontextmanager
+async def metered(email, counter, amount=1, status_code=403, missing_status=404):
+    """charge() for the body of the block; refunds if it raises."""
+    charge_ = await charge(email, counter, amount, status_code, missing_status)
+    try:
+        yield charge_
+    except BaseException:
+        await charge_.refund()
+        raise
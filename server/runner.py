@@ -0,0 +1,234 @@
+import os
+import asyncio
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import ccxt
+from db import users_collection, find_strategies, update_strategy, ensure_indexes
+from bot import StrategyBot, create_exchange, CANDLE_BUFFER
+from strategy_state import StateStore
+from market_feed import MarketFeed
+from market_hub import HubFeed
+
+# Multi-strategy runner: hosts many deployed strategies in one process instead
+# of one container each. Bots share market feeds (per symbol/timeframe),
+# market metadata and the Mongo connection; their ticks are multiplexed on
+# one asyncio loop with blocking work on a small thread pool. Each bot has its
+# own exchange client: ccxt's sync clients are not safe to share between the
+# pool's threads, and a per-key lock would serialize every bot of an account.
+# A failing strategy only errors itself. Strategies deployed with
+# DEPLOY_MODE=runner (see algo.py) are picked up from Mongo automatically.
+#
+#   python runner.py
+
+RUNNER_ID = os.getenv("RUNNER_ID", "default")
+RUNNER_SYNC_SECONDS = float(os.getenv("RUNNER_SYNC_SECONDS", 15))
+# How quickly /api/stop and /api/squareoff (a status change in Mongo) reach a hosted bot;
+# the bot also re-reads its status before every order
+RUNNER_STOP_SECONDS = float(os.getenv("RUNNER_STOP_SECONDS", 1))
+RUNNER_THREADS = int(os.getenv("RUNNER_THREADS", 16))
+RUNNER_FEED = os.getenv("RUNNER_FEED", "ws")  # ws | hub | rest
+RUNNER_FLUSH_SECONDS = float(os.getenv("RUNNER_FLUSH_SECONDS", 1))
+# Like the containers' restart policy (MaximumRetryCount 5): a strategy whose
+# setup keeps failing is left in error until it is redeployed or changed
+RUNNER_MAX_RESTARTS = int(os.getenv("RUNNER_MAX_RESTARTS", 5))
+
+ACTIVE_STATUSES = ("running", "error")  # errors are retried, like a container restart (see RUNNER_MAX_RESTARTS)
+
+
+def strategy_fingerprint(strategy, binance):
+    """Anything that requires restarting the bot when it changes."""
+    return tuple(str(strategy.get(key)) for key in (
+        "code", "symbol", "timeframe", "amount", "leverage", "stop_loss", "take_profit"
+    )) + (binance.get("apiKey"), str(binance.get("demo")))
+
+
+class StrategyRunner:
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=RUNNER_THREADS, thread_name_prefix="runner")
+        self.feeds = {}
+        self.public_exchange = None
+        self.bots = {}  # strategy id -> (task, fingerprint, bot)
+        self.failures = {}  # strategy id -> (fingerprint, failed starts)
+        # One bulk write per flush for the state of every hosted strategy
+        self.state_store = StateStore()
+
+    async def _call(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    def _feed(self, symbol, timeframe):
+        if RUNNER_FEED == "rest":
+            return None
+        key = (symbol, timeframe)
+        if key not in self.feeds:
+            if RUNNER_FEED == "hub":
+                self.feeds[key] = HubFeed(symbol, timeframe, capacity=CANDLE_BUFFER).start()
+            else:
+                if self.public_exchange is None:
+                    self.public_exchange = ccxt.binance({"enableRateLimit": True, "options": {"defaultType": "future"}})
+                self.feeds[key] = MarketFeed(self.public_exchange, symbol, timeframe, capacity=CANDLE_BUFFER).start()
+        return self.feeds[key]
+
+    def _load_strategies(self):
+        strategies = find_strategies({
+            "deploy_mode": "runner",
+            "runner_id": RUNNER_ID,
+            "status": {"$in": list(ACTIVE_STATUSES)},
+        })
+        emails = list({s["email"] for s in strategies})
+        credentials = {
+            user["email"]: user.get("binance", {})
+            for user in users_collection.find({"email": {"$in": emails}}, {"email": 1, "binance": 1})
+        }
+        return {
+            s["id"]: (s["email"], credentials.get(s["email"], {}), s)
+            for s in strategies if s.get("code")
+        }
+
+    def _record_failure(self, strategy_id, email, fingerprint, error=None):
+        previous, count = self.failures.get(strategy_id, (fingerprint, 0))
+        count = count + 1 if previous == fingerprint else 1
+        self.failures[strategy_id] = (fingerprint, count)
+        if count == RUNNER_MAX_RESTARTS + 1:
+            error = f"Stopped after {count} failed starts"
+            print(f"❌ Strategy {strategy_id}: {error}")
+        if error is not None:
+            update_strategy(email, strategy_id, {"$set": {
+                "status": "error", "last_error": str(error), "error_at": datetime.now()
+            }})
+
+    def _gave_up(self, strategy_id, fingerprint, strategy):
+        failed = self.failures.get(strategy_id)
+        if failed is None:
+            return False
+        if failed[0] != fingerprint or strategy.get("status") != "error":
+            # Changed or redeployed (deploy sets it running again): start counting afresh
+            del self.failures[strategy_id]
+            return False
+        return failed[1] > RUNNER_MAX_RESTARTS
+
+    async def _run_bot(self, bot):
+        try:
+            await self._call(bot.setup)
+        except Exception as e:
+            bot.log(f"❌ Setup Error: {e}")
+            traceback.print_exc()
+            await self._call(bot.log_error_to_db, e)
+            return
+
+        tick = "candle"
+        while not bot.stopped.is_set():
+            try:
+                if await self._call(bot.tick, tick):
+                    continue
+                delay, tick = bot.scheduler.next_delay()
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                bot.log(f"❌ Loop Error: {e}")
+                traceback.print_exc()
+                await self._call(bot.log_error_to_db, e)
+                await asyncio.sleep(15)
+
+    async def _remove(self, strategy_ids):
+        strategy_ids = [i for i in strategy_ids if i in self.bots]
+        if not strategy_ids:
+            return
+        for strategy_id in strategy_ids:
+            task, _, bot = self.bots.pop(strategy_id)
+            # A tick already running in the executor ignores cancel(); stop() keeps it from ordering
+            bot.stop()
+            task.cancel()
+            # The API owns the status now; a pending "running" must not overwrite it
+            self.state_store.release(strategy_id)
+        # Restarted bots reload their state from Mongo, so write it out first
+        await self._call(self.state_store.flush, True)
+        for strategy_id in strategy_ids:
+            self.state_store.discard(strategy_id)
+
+    def _stopped_strategies(self, strategy_ids):
+        return [s["id"] for s in find_strategies({
+            "id": {"$in": strategy_ids},
+            "status": {"$nin": list(ACTIVE_STATUSES)},
+        }, ["id"])]
+
+    async def sync(self):
+        """Starts newly deployed strategies, restarts changed ones, stops removed ones."""
+        wanted = await self._call(self._load_strategies)
+
+        removed = []
+        for strategy_id in list(self.bots):
+            task, fingerprint, bot = self.bots[strategy_id]
+            current = wanted.get(strategy_id)
+            if task.done() or current is None or strategy_fingerprint(current[2], current[1]) != fingerprint:
+                if task.done() and not task.cancelled() and not bot.stopped.is_set() and current is not None:
+                    # Only a failed setup ends a bot's task
+                    await self._call(self._record_failure, strategy_id, current[0], fingerprint)
+                removed.append(strategy_id)
+        if removed:
+            await self._remove(removed)
+
+        for strategy_id, (email, binance, strategy) in wanted.items():
+            fingerprint = strategy_fingerprint(strategy, binance)
+            if strategy_id in self.bots or self._gave_up(strategy_id, fingerprint, strategy):
+                continue
+            try:
+                bot = StrategyBot(
+                    email=email,
+                    strategy_id=strategy_id,
+                    code=strategy["code"],
+                    symbol=strategy["symbol"],
+                    timeframe=strategy["timeframe"],
+                    amount=strategy["amount"],
+                    leverage=strategy["leverage"],
+                    stop_loss=strategy["stop_loss"],
+                    take_profit=strategy["take_profit"],
+                    demo=binance.get("demo"),
+                    exchange=create_exchange(binance.get("apiKey"), binance.get("apiSecret"), binance.get("demo")),
+                    market_feed=await self._call(self._feed, strategy["symbol"], strategy["timeframe"]),
+                    log_prefix=f"[{strategy_id[:8]}] ",
+                    state_store=self.state_store,
+                )
+            except Exception as e:
+                print(f"❌ Could not start strategy {strategy_id}: {e}")
+                await self._call(self._record_failure, strategy_id, email, fingerprint, e)
+                continue
+            task = asyncio.create_task(self._run_bot(bot))
+            self.bots[strategy_id] = (task, fingerprint, bot)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(RUNNER_FLUSH_SECONDS)
+            try:
+                await self._call(self.state_store.flush)
+            except Exception as e:
+                print(f"❌ State Flush Error: {e}")
+
+    async def _stop_loop(self):
+        # Between syncs, only looks for hosted strategies the API stopped
+        while True:
+            await asyncio.sleep(RUNNER_STOP_SECONDS)
+            try:
+                if self.bots:
+                    await self._remove(await self._call(self._stopped_strategies, list(self.bots)))
+            except Exception as e:
+                print(f"❌ Runner Stop Check Error: {e}")
+
+    async def run(self):
+        print(f"🚀 Runner {RUNNER_ID} starting | Feed: {RUNNER_FEED}")
+        await self._call(ensure_indexes)
+        asyncio.create_task(self._flush_loop())
+        asyncio.create_task(self._stop_loop())
+        while True:
+            try:
+                await self.sync()
+                print(f"🧩 Runner {RUNNER_ID} | Active strategies: {len(self.bots)}")
+            except Exception as e:
+                print(f"❌ Runner Sync Error: {e}")
+                traceback.print_exc()
+            await asyncio.sleep(RUNNER_SYNC_SECONDS)
+
+
+if __name__ == "__main__":
+    asyncio.run(StrategyRunner().run())
@@ -0,0 +1,62 @@
+import os
+import time
+import ccxt
+
+# Wakes the bot loop right after each candle of its timeframe closes, plus
+# optional in-between wake-ups for SL/TP checks, instead of a flat sleep(60).
+
+# How late the bar of the current candle may show up in a streamed buffer
+# before the bot stops trusting the stream and polls REST instead
+FEED_STALE_SECONDS = float(os.getenv("FEED_STALE_SECONDS", 10))
+
+
+def timeframe_ms(timeframe):
+    return ccxt.Exchange.parse_timeframe(timeframe) * 1000
+
+
+def next_candle_close(now_ms, tf_ms):
+    return (now_ms // tf_ms + 1) * tf_ms
+
+
+def is_stale(last_ms, tf_ms, now_ms=None, grace_ms=FEED_STALE_SECONDS * 1000):
+    """True when the newest bar (opened at `last_ms`) is missing or older than one candle."""
+    if last_ms is None:
+        return True
+    if now_ms is None:
+        now_ms = time.time() * 1000
+    return now_ms - last_ms > tf_ms + grace_ms
+
+
+class CandleScheduler:
+    """
+    `wait()` sleeps until the next event and returns its kind: "candle" just
+    after a candle closes (plus `close_delay` seconds for the exchange to
+    finalize it) or "sltp" every `sltp_interval` seconds in between.
+    An `sltp_interval` of 0 disables the intra-candle checks.
+    """
+
+    def __init__(self, timeframe, close_delay=2.0, sltp_interval=60.0, clock=time.time, sleep=time.sleep):
+        self.tf_ms = timeframe_ms(timeframe)
+        self.close_delay_ms = int(close_delay * 1000)
+        self.sltp_ms = int(sltp_interval * 1000)
+        self.clock = clock
+        self.sleep = sleep
+
+    def next_event(self, now_ms):
+        candle_at = next_candle_close(now_ms - self.close_delay_ms, self.tf_ms) + self.close_delay_ms
+        if self.sltp_ms and self.sltp_ms < self.tf_ms:
+            sltp_at = now_ms + self.sltp_ms
+            if sltp_at < candle_at:
+                return sltp_at, "sltp"
+        return candle_at, "candle"
+
+    def next_delay(self):
+        """Returns (seconds until the next event, its kind) without sleeping."""
+        now_ms = int(self.clock() * 1000)
+        at, kind = self.next_event(now_ms)
+        return max(0.0, (at - now_ms) / 1000), kind
+
+    def wait(self):
+        delay, kind = self.next_delay()
+        self.sleep(delay)
+        return kind
@@ -0,0 +1,144 @@
+import os
+import numpy as np
+from decision import check_sl_tp, signal_actions, HOLD, BUY, SELL
+from metrics import score_trades, summarize
+
+# Bar-by-bar replay of the live loop in bot.py. Each bar is one bot tick at
+# the candle close: SL/TP is checked first (and ends the tick, like the bot's
+# `continue`), then the signal closes/flips the position with leverage-sized
+# market orders. Adds taker fees, slippage and periodic funding on top.
+# State lives in plain floats and preallocated arrays so ~1M bars replay in
+# seconds.
+
+TAKER_FEE = float(os.getenv("SIM_TAKER_FEE", 0.0004))
+SLIPPAGE = float(os.getenv("SIM_SLIPPAGE", 0.0002))
+FUNDING_RATE = float(os.getenv("SIM_FUNDING_RATE", 0.0001))
+FUNDING_INTERVAL_MS = 8 * 60 * 60 * 1000
+
+
+def signals_from_trades(entry_idx, exit_idx, n):
+    """
+    Turns located strategy trades into per-bar BUY/SELL/HOLD codes, as the
+    bot reads them: an exit becomes SELL, which closes the long and then
+    opens a short (see decision.signal_actions). The replay of a long-only
+    strategy therefore holds shorts between its trades, as the live bot would.
+    """
+    signals = np.full(n, HOLD, dtype=np.int8)
+    signals[entry_idx[entry_idx >= 0]] = BUY
+    signals[exit_idx[exit_idx >= 0]] = SELL
+    return signals
+
+
+def simulate(
+    timestamps,
+    close,
+    signals,
+    amount=100.0,
+    leverage=1,
+    stop_loss=0.02,
+    take_profit=0.05,
+    fee_rate=TAKER_FEE,
+    slippage=SLIPPAGE,
+    funding_rate=FUNDING_RATE,
+    qty_step=0.0,
+):
+    """
+    Replays `signals` (per-bar HOLD/BUY/SELL codes) over candle closes.
+    `funding_rate` may be a scalar or a per-bar array; longs pay when it is
+    positive. `qty_step` mimics exchange.amount_to_precision (truncation).
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    prices = np.asarray(close, dtype=np.float64).tolist()
+    signal_list = np.asarray(signals).tolist()
+    funding = np.broadcast_to(np.asarray(funding_rate, dtype=np.float64), (len(prices),)).tolist()
+    funding_slot = (timestamps // FUNDING_INTERVAL_MS).tolist()
+
+    n = len(prices)
+    equity = np.empty(n, dtype=np.float64)
+    position = np.empty(n, dtype=np.float64)
+    trade_rows = []  # (entry_idx, exit_idx, qty, entry_price, exit_price, fees, funding, reason)
+
+    pos = entry = realized = 0.0
+    entry_idx = 0
+    trade_fees = trade_funding = 0.0
+
+    def fill(price, side):
+        return price * (1 + slippage) if side > 0 else price * (1 - slippage)
+
+    def close_position(i, price, reason):
+        nonlocal pos, entry, realized
+        exit_price = fill(price, -1 if pos > 0 else 1)
+        fee = abs(pos) * exit_price * fee_rate
+        realized += (exit_price - entry) * pos - fee
+        trade_rows.append((entry_idx, i, pos, entry, exit_price, trade_fees + fee, trade_funding, reason))
+        pos = entry = 0.0
+
+    for i in range(n):
+        price = prices[i]
+
+        if pos != 0 and i and funding_slot[i] != funding_slot[i - 1]:
+            cost = pos * price * funding[i]
+            realized -= cost
+            trade_funding += cost
+
+        if pos != 0:
+            status, _ = check_sl_tp(pos, entry, price, stop_loss, take_profit)
+            if status:
+                close_position(i, price, status)
+                equity[i] = realized
+                position[i] = 0.0
+                continue
+
+        close_existing, direction = signal_actions(pos, signal_list[i])
+        if close_existing:
+            close_position(i, price, "signal")
+
+        if direction and pos == 0:
+            qty = amount * leverage / price
+            if qty_step:
+                qty = (qty // qty_step) * qty_step
+            if qty > 0:
+                entry = fill(price, direction)
+                pos = qty * direction
+                entry_idx = i
+                trade_fees = qty * entry * fee_rate
+                trade_funding = 0.0
+                realized -= trade_fees
+
+        equity[i] = realized + (price - entry) * pos
+        position[i] = pos
+
+    columns = list(zip(*trade_rows)) if trade_rows else [()] * 8
+    trades = {
+        "entry_idx": np.asarray(columns[0], dtype=np.int64),
+        "exit_idx": np.asarray(columns[1], dtype=np.int64),
+        "qty": np.asarray(columns[2], dtype=np.float64),
+        "entry_price": np.asarray(columns[3], dtype=np.float64),
+        "exit_price": np.asarray(columns[4], dtype=np.float64),
+        "fees": np.asarray(columns[5], dtype=np.float64),
+        "funding": np.asarray(columns[6], dtype=np.float64),
+        "reason": list(columns[7]),
+    }
+    return {"trades": trades, "equity": equity, "position": position, "open_pos": pos, "open_entry": entry}
+
+
+def simulation_metrics(result, timestamps):
+    """Scores a simulation; PnL is net of fees and funding."""
+    trades = result["trades"]
+    # Fees and funding are folded into the exit price so score_trades sees net PnL
+    qty = trades["qty"]
+    costs = trades["fees"] + trades["funding"]
+    net_exit = trades["exit_price"] - np.divide(costs, qty, out=np.zeros(len(qty)), where=qty != 0)
+    metrics = score_trades(trades["entry_price"], net_exit, qty)
+
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    bars_held = (trades["exit_idx"] - trades["entry_idx"]).sum()
+    metrics["exposure_percent"] = float(bars_held / len(timestamps) * 100) if len(timestamps) else None
+    if len(qty):
+        durations = timestamps[trades["exit_idx"]] - timestamps[trades["entry_idx"]]
+        metrics["avg_trade_duration_hours"] = float(durations.mean() / 3_600_000)
+    metrics["fees"] = float(trades["fees"].sum())
+    metrics["funding"] = float(trades["funding"].sum())
+    metrics["stop_losses"] = trades["reason"].count("loss")
+    metrics["take_profits"] = trades["reason"].count("profit")
+    return summarize(metrics)
@@ -0,0 +1,185 @@
+import os
+import ast
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from metrics import trades_to_arrays, trade_bars, locate_trades
+from trade_kernel import apply_exits
+from indicators import ind
+from vectorized import STRATEGY_FAST_LOOP, CACHE_CLASS, ColumnCache, rewrite_row_access, run_signals, signals_as_run_strategy
+
+# Loads user strategy source once per distinct code. The source is hashed,
+# parsed and validated (only whitelisted imports, a top-level run_strategy or
+# on_bar) and compiled; code objects are kept in a bounded LRU keyed by the
+# hash, so iterating on a strategy only pays for parsing when the code changes.
+#
+# Validation and compilation never execute user code. The module body runs
+# on first use of `run_strategy`, which callers do inside the backtest pool's
+# child process; the API validates the code before fetching any candles.
+#
+# Strategies may define `signals(df)` instead of run_strategy (see
+# vectorized.py); row-loop run_strategy code is compiled with its
+# `df[col].iloc[i]` reads served from NumPy arrays when that is safe.
+# Code runs with `pd`, `np` and the memoized indicator library `ind`.
+
+STRATEGY_CACHE_SIZE = int(os.getenv("STRATEGY_CACHE_SIZE", 256))
+STRATEGY_IMPORTS = {m for m in os.getenv(
+    "STRATEGY_IMPORTS", "math,statistics,datetime,collections,itertools,functools,numpy,pandas"
+).split(",") if m}
+ENTRY_POINTS = {"run_strategy": "run_strategy(df)", "signals": "signals(df)", "on_bar": "on_bar(bar, ind, state)"}
+TRADE_ENTRY_POINTS = ("run_strategy", "signals")  # what backtests can score
+
+
+class StrategyError(Exception):
+    pass
+
+
+def code_hash(code):
+    return hashlib.sha256(code.encode()).hexdigest()
+
+
+def check_imports(tree):
+    """Raises StrategyError for imports outside STRATEGY_IMPORTS."""
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            modules = [node.module or ""] if not node.level else ["."]
+        elif isinstance(node, ast.Name) and node.id == "__import__":
+            raise StrategyError("Strategy may not call __import__")
+        else:
+            continue
+        for module in modules:
+            if module.split(".")[0] not in STRATEGY_IMPORTS:
+                raise StrategyError(f"Import of '{module}' is not allowed in strategies")
+
+
+def require_entry_point(defined, require):
+    if require and not defined.intersection(require):
+        raise StrategyError("Strategy must define " + " or ".join(ENTRY_POINTS[name] for name in require))
+
+
+class LoadedStrategy:
+    def __init__(self, digest, code, defined, fast_loop=False):
+        self.hash = digest
+        self.code = code
+        self.defined = defined  # top-level function names
+        self.fast_loop = fast_loop  # row reads rewritten to NumPy
+        self._namespace = None
+        self._lock = threading.Lock()
+
+    def namespace(self):
+        """Runs the module body in a fresh namespace (per bot, so state is not shared)."""
+        namespace = {"pd": pd, "np": np, "ind": ind, CACHE_CLASS: ColumnCache}
+        exec(self.code, namespace)
+        return namespace
+
+    def _shared(self):
+        with self._lock:
+            if self._namespace is None:
+                self._namespace = self.namespace()
+            return self._namespace
+
+    @staticmethod
+    def entry(namespace, stop_loss=0.0, take_profit=0.0):
+        """
+        run_strategy(df) -> (trades, latest_signal) from a namespace, or None.
+        SL/TP only apply to the signal form; row loops manage their own exits.
+        """
+        if callable(namespace.get("run_strategy")):
+            return namespace["run_strategy"]
+        if callable(namespace.get("signals")):
+            return signals_as_run_strategy(namespace["signals"], stop_loss, take_profit)
+        return None
+
+    @property
+    def run_strategy(self):
+        """The resolved run_strategy, executed once per process and reused."""
+        fn = self.entry(self._shared())
+        if fn is None:
+            raise StrategyError("Strategy must define " + " or ".join(ENTRY_POINTS[n] for n in TRADE_ENTRY_POINTS))
+        return fn
+
+    def trade_arrays(self, df, stop_loss=0.0, take_profit=0.0):
+        """
+        Runs the strategy on df and returns entry/exit/qty arrays plus the
+        entry/exit bar indices: reported by the trades (entry_idx/exit_idx)
+        or else located by price (-1 where that failed).
+        The signal form yields bar indices directly, without a trade list.
+        With SL/TP, run_strategy trades keep their size and side and exit at
+        the stop or target price; all of them must then be located.
+        """
+        namespace = self._shared()
+        if "run_strategy" not in namespace and callable(namespace.get("signals")):
+            trades, _ = run_signals(namespace["signals"], df, stop_loss, take_profit)
+        else:
+            trades, _ = self.run_strategy(df)
+            if not isinstance(trades, list):
+                raise StrategyError("run_strategy must return a list")
+            entry, exit, qty = trades_to_arrays(trades)
+            bars = trade_bars(trades)
+            if bars is None:
+                bars = locate_trades(
+                    entry, exit, df["close"].to_numpy(dtype=np.float64),
+                    df["high"].to_numpy(dtype=np.float64), df["low"].to_numpy(dtype=np.float64),
+                )
+            entry_idx, exit_idx = bars
+            if not (stop_loss or take_profit):
+                return entry, exit, qty, entry_idx, exit_idx
+            unlocated = int(np.count_nonzero((entry_idx < 0) | (exit_idx < entry_idx)))
+            if unlocated:
+                raise StrategyError(
+                    f"{unlocated} of {len(entry)} trades could not be placed on the candles, "
+                    "so stop loss / take profit cannot be applied to them"
+                )
+            exit_idx, exit, _ = apply_exits(
+                entry_idx, exit_idx, entry, exit, np.where(qty < 0, -1, 1),
+                df["high"].to_numpy(dtype=np.float64), df["low"].to_numpy(dtype=np.float64), stop_loss, take_profit,
+            )
+            return entry, exit, qty, entry_idx, exit_idx
+        count = len(trades["entry_idx"])
+        return trades["entry_price"], trades["exit_price"], np.ones(count), trades["entry_idx"], trades["exit_idx"]
+
+
+class StrategyLoader:
+    def __init__(self, maxsize=STRATEGY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # hash -> LoadedStrategy
+        self._lock = threading.Lock()
+
+    def load(self, source, require=TRADE_ENTRY_POINTS):
+        """Returns the validated, compiled strategy; raises StrategyError if it is malformed."""
+        if not isinstance(source, str) or not source.strip():
+            raise StrategyError("Strategy code is empty")
+        digest = code_hash(source)
+        with self._lock:
+            loaded = self._entries.get(digest)
+            if loaded is not None:
+                self._entries.move_to_end(digest)
+        if loaded is None:
+            try:
+                tree = ast.parse(source, filename="<strategy>")
+            except SyntaxError as e:
+                raise StrategyError(f"Strategy has a syntax error on line {e.lineno}: {e.msg}")
+            check_imports(tree)
+            defined = {node.name for node in tree.body if isinstance(node, ast.FunctionDef)}
+            require_entry_point(defined, tuple(ENTRY_POINTS))
+            fast = rewrite_row_access(tree) if STRATEGY_FAST_LOOP and "run_strategy" in defined else None
+            loaded = LoadedStrategy(
+                digest, compile(fast or tree, "<strategy>", "exec"), defined, fast is not None
+            )
+            with self._lock:
+                self._entries[digest] = loaded
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        require_entry_point(loaded.defined, require)
+        return loaded
+
+
+strategy_loader = StrategyLoader()
+
+
+def load_strategy(source, require=TRADE_ENTRY_POINTS):
+    return strategy_loader.load(source, require)
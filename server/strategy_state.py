@@ -0,0 +1,178 @@
+import os
+import time
+import threading
+from datetime import datetime
+from pymongo.errors import BulkWriteError
+from db import find_strategy, strategy_update_op, strategy_bulk_write
+
+# In-memory position state for live bots. The hot path reads the local copy
+# and writes only mark fields dirty; `StateStore.flush()` turns the changes of
+# every strategy into one bulk write. Trades (position, entry, realized PnL)
+# are flushed on the next call, unrealized-PnL-only changes and heartbeats
+# are coalesced for up to STATE_FLUSH_SECONDS.
+
+STATE_FLUSH_SECONDS = float(os.getenv("STATE_FLUSH_SECONDS", 30))
+
+
+class StrategyState:
+    """Position state of one strategy, mirrored to its strategy document."""
+
+    def __init__(self, email, strategy_id, prefix):
+        self.email = email
+        self.strategy_id = strategy_id
+        self.prefix = prefix
+        self.pos = self.entry = self.total_pnl = self.unpnl = 0.0
+        self.status = None
+        # Cleared once the bot is stopped, so a late flush cannot write
+        # "running" over the status /api/stop set
+        self.owns_status = True
+        self._set = {}
+        self._pnl_inc = 0.0
+        self._urgent = False
+        self._since = None  # when the oldest unflushed change was made
+        self._lock = threading.Lock()  # bot thread vs. flusher
+
+    def load(self):
+        fields = [f"{self.prefix}_{k}" for k in ("pos", "entry", "pnl", "unrealized_pnl")] + ["status"]
+        strat = find_strategy(self.email, self.strategy_id, fields) or {}
+        self.pos = float(strat.get(f"{self.prefix}_pos", 0.0))
+        self.entry = float(strat.get(f"{self.prefix}_entry", 0.0))
+        self.total_pnl = float(strat.get(f"{self.prefix}_pnl", 0.0))
+        self.unpnl = float(strat.get(f"{self.prefix}_unrealized_pnl", 0.0))
+        self.status = strat.get("status")
+        return self
+
+    def snapshot(self):
+        return {"pos": self.pos, "entry": self.entry, "total_pnl": self.total_pnl}
+
+    def _mark(self, field, value, urgent):
+        self._set[field] = value
+        self._urgent = self._urgent or urgent
+        if self._since is None:
+            self._since = time.monotonic()
+
+    def update(self, pos, entry=0.0, pnl_inc=0.0, unpnl=0.0):
+        """Same contract as the old per-call Mongo update, applied locally."""
+        with self._lock:
+            self._update(pos, entry, pnl_inc, unpnl)
+
+    def _update(self, pos, entry, pnl_inc, unpnl):
+        if pos != self.pos:
+            self.pos = pos
+            self._mark(f"{self.prefix}_pos", pos, True)
+        if entry != self.entry:
+            self.entry = entry
+            self._mark(f"{self.prefix}_entry", entry, True)
+        if unpnl != self.unpnl:
+            self.unpnl = unpnl
+            self._mark(f"{self.prefix}_unrealized_pnl", unpnl, False)
+        if pnl_inc:
+            self.total_pnl += pnl_inc
+            self._pnl_inc += pnl_inc
+            self._urgent = True
+            if self._since is None:
+                self._since = time.monotonic()
+        if self.owns_status and self.status != "running":
+            self.status = "running"
+            self._mark("status", "running", True)
+        # Heartbeat for the UI; only forces a write once per flush interval
+        self._mark("last_update", datetime.now(), False)
+
+    def due(self, now, max_age):
+        return bool(self._set or self._pnl_inc) and (self._urgent or now - self._since >= max_age)
+
+    def take(self):
+        """Returns the pending (set, inc) and clears them."""
+        with self._lock:
+            return self._take()
+
+    def _take(self):
+        pending = (self._set, self._pnl_inc)
+        self._set, self._pnl_inc, self._urgent, self._since = {}, 0.0, False, None
+        return pending
+
+    def restore(self, pending):
+        """Puts back changes whose write failed, under anything newer."""
+        fields, pnl_inc = pending
+        with self._lock:
+            self._restore(fields, pnl_inc)
+
+    def _restore(self, fields, pnl_inc):
+        for field, value in fields.items():
+            if field != "status" or self.owns_status:
+                self._set.setdefault(field, value)
+        self._pnl_inc += pnl_inc
+        self._urgent = True
+        if self._since is None:
+            self._since = time.monotonic()
+
+    def operation(self, pending):
+        fields, pnl_inc = pending
+        update = {"$set": dict(fields)}
+        if pnl_inc:
+            update["$inc"] = {f"{self.prefix}_pnl": pnl_inc}
+        return strategy_update_op(self.email, self.strategy_id, update)
+
+
+class StateStore:
+    """
+    Holds the StrategyState of every bot in the process and flushes their
+    changes with one ordered bulk_write. Shared by all bots of a runner.
+    """
+
+    def __init__(self, flush_seconds=STATE_FLUSH_SECONDS):
+        self.flush_seconds = flush_seconds
+        self.states = {}
+        self._lock = threading.Lock()
+
+    def get(self, email, strategy_id, prefix):
+        key = (strategy_id, prefix)
+        with self._lock:
+            state = self.states.get(key)
+        if state is None:
+            state = StrategyState(email, strategy_id, prefix).load()
+            with self._lock:
+                state = self.states.setdefault(key, state)
+        return state
+
+    def release(self, strategy_id):
+        """Drops the pending status of a stopped strategy; its trades still get flushed."""
+        with self._lock:
+            states = [s for k, s in self.states.items() if k[0] == strategy_id]
+        for state in states:
+            with state._lock:
+                state.owns_status = False
+                state._set.pop("status", None)
+
+    def discard(self, strategy_id):
+        with self._lock:
+            for key in [k for k in self.states if k[0] == strategy_id]:
+                del self.states[key]
+
+    def flush(self, force=False):
+        """Writes every state that is due (or all dirty ones when forced)."""
+        now = time.monotonic()
+        with self._lock:
+            states = [s for s in self.states.values() if s.due(now, 0 if force else self.flush_seconds)]
+            batch = [(s, s.take()) for s in states]
+        if not batch:
+            return 0
+
+        try:
+            strategy_bulk_write([s.operation(p) for s, p in batch], ordered=True)
+        except BulkWriteError as e:
+            # Ordered: everything before the first failed op was applied
+            failed = e.details["writeErrors"][0]["index"]
+            self._restore(batch[failed:])
+            print(f"⚠️ State flush failed at {failed}/{len(batch)}: {e.details['writeErrors'][0].get('errmsg')}")
+            return failed
+        except Exception as e:
+            self._restore(batch)
+            print(f"⚠️ State flush error: {e}")
+            return 0
+        return len(batch)
+
+    def _restore(self, batch):
+        with self._lock:
+            for state, pending in batch:
+                state.restore(pending)
@@ -0,0 +1,122 @@
+import itertools
+import random
+import asyncio
+import traceback
+import numpy as np
+from typing import Optional, List
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+from quota import metered
+from candle_cache import candle_cache
+from backtest_pool import backtest_pool, BacktestError, BACKTEST_WORKERS
+from backtest_tasks import extract_trades, prepare_overlay, evaluate_combinations
+from strategy_loader import load_strategy, StrategyError
+
+# Stop loss / take profit / leverage sweeps. The strategy runs once to get its
+# trades; every parameter combination then re-applies an SL/TP overlay on top
+# of those trades using precomputed per-trade price excursions, so each
+# combination costs a couple of searchsorted calls instead of a full backtest.
+# The overlay functions live in backtest_tasks.py, which the pool runs.
+# Generated strategies are long-only, so overlays assume long positions.
+#
+# Leverage is more than a qty multiplier: an isolated position is liquidated
+# once the adverse move reaches 1/leverage less the maintenance margin, which
+# overrides a wider stop loss and loses the trade's whole margin.
+
+router = APIRouter()
+
+MAX_SWEEP_COMBINATIONS = 5000
+
+# Metrics results can be ranked by, and whether higher is better
+SORT_METRICS = {
+    "total_pnl": True,
+    "return_percent": True,
+    "max_drawdown": False,  # a positive amount; smaller is better
+    "win_rate_percent": True,
+    "profit_factor": True,
+    "sharpe": True,
+    "sortino": True,
+    "total_trades": True,
+}
+
+
+class SweepRequest(BaseModel):
+    email: str
+    strategy: str
+    symbol: str = "BTC/USDT"
+    timeframe: str = "1h"
+    amount: float = 100.0
+    stop_loss: List[float] = [0.01, 0.02, 0.03, 0.05]
+    take_profit: List[float] = [0.02, 0.05, 0.10]
+    leverage: List[int] = [1, 2, 5, 10]
+    mode: str = "grid"  # "grid" or "random"
+    samples: Optional[int] = None
+    sort_by: str = "total_pnl"
+    top: int = 20
+
+
+def rank(rows, metric):
+    """Best first by `metric`; rows without a value (e.g. no profit factor) go last."""
+    higher_is_better = SORT_METRICS[metric]
+    present = [r for r in rows if r.get(metric) is not None]
+    present.sort(key=lambda r: r[metric], reverse=higher_is_better)
+    return present + [r for r in rows if r.get(metric) is None]
+
+
+def build_combinations(req):
+    grid = list(itertools.product(req.stop_loss, req.take_profit, req.leverage))
+    if req.mode == "random" and req.samples and req.samples < len(grid):
+        grid = random.sample(grid, req.samples)
+    return grid
+
+
+@router.post("/api/sweep")
+async def sweep(req: SweepRequest):
+    try:
+        if req.sort_by not in SORT_METRICS:
+            raise HTTPException(status_code=400, detail=f"sort_by must be one of: {', '.join(SORT_METRICS)}")
+        combinations = build_combinations(req)
+        if not combinations or len(combinations) > MAX_SWEEP_COMBINATIONS:
+            raise HTTPException(status_code=400, detail=f"Sweep must have 1-{MAX_SWEEP_COMBINATIONS} combinations")
+        try:
+            load_strategy(req.strategy)
+        except StrategyError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        # One backtest unit, refunded if the sweep fails
+        async with metered(req.email, "backtest"):
+            df = await backtest_pool.offload(candle_cache.get, "kraken", req.symbol, req.timeframe)
+
+            # Signals are computed once; overlays are cheap to re-apply
+            entry_idx, exit_idx, entry, exit = await backtest_pool.run(extract_trades, req.strategy, df)
+            overlay = prepare_overlay(
+                entry_idx, exit_idx, entry,
+                df["high"].to_numpy(dtype=np.float64),
+                df["low"].to_numpy(dtype=np.float64),
+            )
+
+            chunk = -(-len(combinations) // BACKTEST_WORKERS)
+            parts = await asyncio.gather(*[
+                backtest_pool.run(evaluate_combinations, overlay, entry, exit, combinations[i:i + chunk], req.amount)
+                for i in range(0, len(combinations), chunk)
+            ])
+            rows = rank([row for part in parts for row in part], req.sort_by)
+
+        return {
+            "status": "success",
+            "evaluated": len(rows),
+            "trades": len(entry),
+            "results": rows[:req.top],
+        }
+
+    except HTTPException as he:
+        raise he
+
+    except BacktestError as e:
+        raise HTTPException(status_code=500, detail=f"Sweep failed: {str(e)}")
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Sweep failed: {str(e)}\n{traceback.format_exc()}"
+        )
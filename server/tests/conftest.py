@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Tests import the server modules the way the app does, from the server directory.
+# Modules that open a database connection run against the in-memory stand-in (see db.py).
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URI", "mongomock://localhost")
+os.environ.setdefault("MONGO_DB", "test")
+os.environ.setdefault("OPENAI_API_KEY", "test")
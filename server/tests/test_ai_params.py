@@ -0,0 +1,35 @@
+import pytest
+from ai_assistent import clean_params, MAX_LEVERAGE
+
+DEFAULTS = {"name": "Strategy", "symbol": "BTC/USDT", "amount": 100.0, "leverage": 1,
+            "take_profit": 0.05, "stop_loss": 0.02, "timeframe": "1m"}
+
+
+@pytest.mark.parametrize("raw", [None, "text", [], {}, {"unknown": 1}])
+def test_defaults(raw):
+    assert clean_params(raw) == DEFAULTS
+
+
+def test_invalid_fields_fall_back_one_by_one():
+    params = clean_params({"amount": "lots", "leverage": 3, "timeframe": "2h", "stop_loss": None})
+    assert params["amount"] == 100.0
+    assert params["leverage"] == 3
+    assert params["timeframe"] == "1m"
+    assert params["stop_loss"] == 0.02
+
+
+@pytest.mark.parametrize("symbol, expected", [
+    ("sol", "SOL/USDT"), ("ETHUSDT", "ETH/USDT"), ("btc-usdt", "BTC/USDT"), ("USDT", "BTC/USDT"), (" xrp/usdt ", "XRP/USDT"),
+])
+def test_symbol(symbol, expected):
+    assert clean_params({"symbol": symbol})["symbol"] == expected
+
+
+def test_ranges():
+    params = clean_params({"name": ' "Trend" ', "amount": -5, "leverage": 50, "take_profit": 5, "stop_loss": 0})
+    assert params["name"] == "Trend"
+    assert params["amount"] == 100.0
+    assert params["leverage"] == MAX_LEVERAGE
+    assert params["take_profit"] == 0.05  # "5" meant 5%
+    assert params["stop_loss"] == 0.02
+    assert clean_params({"leverage": 0})["leverage"] == 1
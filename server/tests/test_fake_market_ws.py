@@ -0,0 +1,52 @@
+import time
+import socket
+import asyncio
+import threading
+import pytest
+import fake_market_ws
+from market_feed import MarketFeed
+
+
+class NoHistory:
+    def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None):
+        return []
+
+
+@pytest.fixture
+def market_ws_url():
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        port = sock.getsockname()[1]
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    server = asyncio.run_coroutine_threadsafe(start_server(port), loop).result(5)
+    yield f"ws://localhost:{port}"
+
+    async def stop():
+        server.cancel()
+        await asyncio.gather(server, return_exceptions=True)
+    asyncio.run_coroutine_threadsafe(stop(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    loop.close()
+
+
+async def start_server(port):
+    return asyncio.create_task(fake_market_ws.main(port, 60))
+
+
+def test_market_feed_streams_from_fake(market_ws_url):
+    feed = MarketFeed(NoHistory(), "BTC/USDT", "1m", url=market_ws_url).start()
+    try:
+        deadline = time.time() + 10
+        while not feed.fresh() and time.time() < deadline:
+            time.sleep(0.1)
+        assert feed.fresh()
+        bars = feed.bars_since()
+        timestamp, _, high, low, close, _ = bars[-1]
+        assert timestamp % 60_000 == 0
+        assert low <= close <= high
+        assert feed.last_price() == close
+    finally:
+        feed.stop()
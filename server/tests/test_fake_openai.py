@@ -0,0 +1,79 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+import pytest
+from fake_openai import Handler, FAKE_STRATEGY, fake_params
+from strategy_loader import load_strategy
+
+
+@pytest.fixture(scope="module")
+def openai_url():
+    server = ThreadingHTTPServer(("localhost", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://localhost:{server.server_address[1]}/v1"
+    server.shutdown()
+
+
+def post(url, body):
+    request = urllib.request.Request(url, json.dumps(body).encode(), {"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=5) as response:
+        return json.loads(response.read())
+
+
+def test_fake_params_reads_the_prompt():
+    params = fake_params("Buy SOL with $250 at 3x, TP 4% SL 1.5% on 15m")
+    assert params["symbol"] == "SOL/USDT"
+    assert params["amount"] == 250
+    assert params["leverage"] == 3
+    assert params["take_profit"] == pytest.approx(0.04)
+    assert params["stop_loss"] == pytest.approx(0.015)
+    assert params["timeframe"] == "15m"
+
+
+def test_structured_response(openai_url):
+    text = "ema cross on ETH, 5x"
+    body = post(f"{openai_url}/responses", {
+        "model": "gpt-4o-mini",
+        "input": [{"role": "system", "content": "Extract"}, {"role": "user", "content": text}],
+        "text": {"format": {"type": "json_schema", "name": "strategy_params", "schema": {}, "strict": True}},
+    })
+    assert body["object"] == "response"
+    assert json.loads(body["output"][0]["content"][0]["text"]) == fake_params(text)
+
+
+def test_code_response_is_a_valid_strategy(openai_url):
+    body = post(f"{openai_url}/responses", {"model": "gpt-4o-mini", "input": "ema strategy"})
+    code = body["output"][0]["content"][0]["text"]
+    assert code == FAKE_STRATEGY
+    close = 100 + np.sin(np.arange(200) / 10) * 5
+    df = pd.DataFrame({"timestamp": np.arange(200) * 60_000, "open": close, "high": close, "low": close,
+                       "close": close, "volume": 1.0})
+    entry, exit, *_ = load_strategy(code).trade_arrays(df)
+    assert len(entry) > 0
+
+
+def test_chat_completions(openai_url):
+    analysis = post(f"{openai_url}/chat/completions", {
+        "messages": [{"role": "user", "content": "why"}], "response_format": {"type": "json_object"},
+    })
+    content = json.loads(analysis["choices"][0]["message"]["content"])
+    assert content["optimized_code"] == FAKE_STRATEGY
+    completion = post(f"{openai_url}/chat/completions", {"messages": [{"role": "user", "content": "Buy BTC"}]})
+    assert completion["choices"][0]["message"]["content"].startswith(" on ")
+
+
+def test_unknown_endpoint(openai_url):
+    with pytest.raises(urllib.error.HTTPError) as error:
+        post(f"{openai_url}/embeddings", {})
+    assert error.value.code == 404
+
+
+def test_openai_client_accepts_responses(openai_url):
+    openai = pytest.importorskip("openai")
+    client = openai.OpenAI(base_url=openai_url, api_key="test")
+    res = client.responses.create(model="gpt-4o-mini", input="ema strategy")
+    assert res.output_text == FAKE_STRATEGY
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from metrics import trade_bars, locate_trades, score_trades, compute_metrics
+
+
+def test_trade_bars_needs_every_trade_to_report_bars():
+    trades = [{"entry_idx": 1, "exit_idx": 3}, {"entry_idx": 4, "exit_idx": 6}]
+    entry_idx, exit_idx = trade_bars(trades)
+    assert entry_idx.tolist() == [1, 4]
+    assert exit_idx.tolist() == [3, 6]
+    assert trade_bars(trades + [{"entry_price": 1.0, "exit_price": 2.0}]) is None
+
+
+def test_locate_trades_by_close():
+    close = np.array([1.0, 2, 3, 2, 5])
+    entry_idx, exit_idx = locate_trades(np.array([2.0, 2]), np.array([3.0, 5]), close)
+    # The second entry at 2 binds after the first trade's exit, not to bar 1
+    assert entry_idx.tolist() == [1, 3]
+    assert exit_idx.tolist() == [2, 4]
+
+
+def test_locate_trades_falls_back_to_bar_range():
+    close = np.array([10.0, 11, 12, 13])
+    high, low = close + 0.5, close - 0.5
+    entry, exit = np.array([10.8]), np.array([12.7])
+    assert [a.tolist() for a in locate_trades(entry, exit, close)] == [[-1], [-1]]
+    assert [a.tolist() for a in locate_trades(entry, exit, close, high, low)] == [[1], [3]]
+
+
+def test_locate_trades_never_moves_backwards():
+    close = np.array([5.0, 4, 3, 2, 1])
+    entry_idx, exit_idx = locate_trades(np.array([3.0]), np.array([5.0]), close)
+    assert entry_idx.tolist() == [2]
+    assert exit_idx.tolist() == [-1]
+
+
+def test_score_trades():
+    entry = np.array([100.0, 100, 100])
+    exit = np.array([110.0, 95, 105])
+    metrics = score_trades(entry, exit, np.ones(3))
+    assert metrics["total_pnl"] == 10
+    assert metrics["wins"] == 2 and metrics["losses"] == 1
+    assert metrics["max_drawdown"] == 5
+    assert metrics["profit_factor"] == 3
+
+
+def test_compute_metrics_uses_reported_bars():
+    timestamps = np.arange(10) * 3_600_000
+    close = np.full(10, 100.0)
+    trades = [{"entry_price": 100.0, "exit_price": 101.0, "entry_idx": 2, "exit_idx": 6}]
+    metrics = compute_metrics(trades, timestamps, close)
+    assert metrics["exposure_percent"] == pytest.approx(40)
+    assert metrics["avg_trade_duration_hours"] == pytest.approx(4)
@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+import trade_kernel
+from trade_kernel import generate_trades, apply_exits, EXIT_SIGNAL, EXIT_STOP_LOSS, EXIT_TAKE_PROFIT, EXIT_END
+
+
+def flags(*bars, n):
+    mask = np.zeros(n, dtype=bool)
+    mask[list(bars)] = True
+    return mask
+
+
+def test_signals_without_exits():
+    close = np.array([10.0, 11, 12, 11, 10, 12, 13])
+    trades = generate_trades(flags(1, 5, n=7), flags(3, n=7), close)
+    assert trades["entry_idx"].tolist() == [1, 5]
+    assert trades["exit_idx"].tolist() == [3, 6]
+    assert trades["entry_price"].tolist() == [11, 12]
+    assert trades["exit_price"].tolist() == [11, 13]
+    assert trades["reason"].tolist() == [EXIT_SIGNAL, EXIT_END]
+
+
+def test_bar_with_both_signals_keeps_position():
+    close = np.array([10.0, 11, 12, 13])
+    trades = generate_trades(flags(0, 2, n=4), flags(2, n=4), close)
+    assert trades["entry_idx"].tolist() == [0]
+    assert trades["exit_idx"].tolist() == [3]
+    assert trades["reason"].tolist() == [EXIT_END]
+
+
+@pytest.mark.parametrize("jit", [True, False])
+def test_stop_loss_wins_ties_and_does_not_reenter(jit):
+    close = np.full(4, 100.0)
+    high = np.array([100.0, 101, 100, 100])
+    low = np.array([90.0, 97, 100, 100])  # the entry bar's low is not checked
+    trades = generate_trades(flags(0, 1, n=4), flags(n=4), close, high, low,
+                             stop_loss=0.02, take_profit=0.01, jit=jit)
+    assert trades["entry_idx"].tolist() == [0]
+    assert trades["exit_idx"].tolist() == [1]
+    assert trades["exit_price"].tolist() == [98.0]
+    assert trades["reason"].tolist() == [EXIT_STOP_LOSS]
+
+
+def test_take_profit_before_exit_signal():
+    close = np.array([100.0, 100, 100])
+    high = np.array([100.0, 106, 100])
+    trades = generate_trades(flags(0, n=3), flags(1, n=3), close, high, close, take_profit=0.05)
+    assert trades["exit_idx"].tolist() == [1]
+    assert trades["exit_price"].tolist() == [105.0]
+    assert trades["reason"].tolist() == [EXIT_TAKE_PROFIT]
+
+
+def test_walk_matches_vectorized_state_machine():
+    rng = np.random.default_rng(1)
+    n = 2000
+    entry, exit = rng.random(n) < 0.05, rng.random(n) < 0.05
+    close = 100 + rng.standard_normal(n).cumsum()
+    vectorized = generate_trades(entry, exit, close)
+    out = [np.empty(n, dtype=np.int64), np.empty(n, dtype=np.int64), np.empty(n), np.empty(n, dtype=np.int8)]
+    count = trade_kernel._walk(entry, exit, close, close, close, 0.0, 0.0, *out)
+    assert vectorized["entry_idx"].tolist() == out[0][:count].tolist()
+    assert vectorized["exit_idx"].tolist() == out[1][:count].tolist()
+    assert vectorized["reason"].tolist() == out[3][:count].tolist()
+
+
+@pytest.mark.skipif(trade_kernel._walk_jit is None, reason="Numba is not installed")
+def test_compiled_walk_matches_python():
+    rng = np.random.default_rng(2)
+    n = 5000
+    close = 100 + rng.standard_normal(n).cumsum()
+    high, low = close + rng.random(n), close - rng.random(n)
+    entry, exit = rng.random(n) < 0.05, rng.random(n) < 0.05
+    compiled = generate_trades(entry, exit, close, high, low, 0.01, 0.02, jit=True)
+    python = generate_trades(entry, exit, close, high, low, 0.01, 0.02, jit=False)
+    for key in compiled:
+        np.testing.assert_array_equal(compiled[key], python[key])
+
+
+@pytest.mark.parametrize("jit", [True, False])
+def test_apply_exits_long_and_short(jit):
+    high = np.array([100.0, 101, 103, 100, 100])
+    low = np.array([100.0, 99, 97, 100, 94])
+    exit_idx, exit_price, reason = apply_exits(
+        entry_idx=[0, 0, 2, 3], exit_idx=[3, 3, 4, 3],
+        entry_price=[100.0, 100, 100, 100], exit_price=[99.0, 101, 98, 100],
+        side=[1, -1, -1, 1], high=high, low=low, stop_loss=0.02, take_profit=0.05, jit=jit,
+    )
+    # Long stopped at 98 on bar 2; short stopped at 102 on bar 2; short from bar 2
+    # takes profit at 95 on its own exit bar; a trade that exits on its entry bar keeps its exit
+    assert exit_idx.tolist() == [2, 2, 4, 3]
+    assert exit_price.tolist() == [98.0, 102.0, 95.0, 100.0]
+    assert reason.tolist() == [EXIT_STOP_LOSS, EXIT_STOP_LOSS, EXIT_TAKE_PROFIT, EXIT_SIGNAL]
+
+
+def test_apply_exits_ignores_bars_after_exit():
+    high = np.full(4, 100.0)
+    low = np.array([100.0, 100, 100, 50])
+    exit_idx, exit_price, reason = apply_exits([0], [2], [100.0], [101.0], [1], high, low, stop_loss=0.02)
+    assert exit_idx.tolist() == [2]
+    assert exit_price.tolist() == [101.0]
+    assert reason.tolist() == [EXIT_SIGNAL]
@@ -0,0 +1,88 @@
+import ast
+import textwrap
+import numpy as np
+import pandas as pd
+import pytest
+from vectorized import rewrite_row_access, ColumnCache, CACHE_CLASS, COLUMNS_VAR
+
+
+def run(source, df, fast):
+    tree = ast.parse(textwrap.dedent(source))
+    if fast:
+        tree = rewrite_row_access(tree)
+        assert tree is not None
+    namespace = {"pd": pd, "np": np, CACHE_CLASS: ColumnCache}
+    exec(compile(tree, "<strategy>", "exec"), namespace)
+    return namespace["run_strategy"](df)
+
+
+@pytest.fixture
+def df():
+    close = 100 + np.random.default_rng(0).standard_normal(300).cumsum()
+    return pd.DataFrame({"close": close, "high": close + 1, "low": close - 1})
+
+
+ROW_LOOP = """
+def run_strategy(df):
+    trades = []
+    for i in range(1, len(df)):
+        if df['close'].iloc[i] > df['close'].iloc[i - 1]:
+            trades.append(i)
+    return trades, "HOLD"
+"""
+
+COLUMN_BEFORE_LOOP = """
+def run_strategy(df):
+    df['ema'] = df['close'].ewm(span=5).mean()
+    trades = []
+    for i in range(len(df)):
+        if df['close'].iloc[i] > df['ema'].iloc[i]:
+            trades.append(i)
+    return trades, "HOLD"
+"""
+
+
+@pytest.mark.parametrize("source", [ROW_LOOP, COLUMN_BEFORE_LOOP])
+def test_rewrite_keeps_results(source, df):
+    assert run(source, df.copy(), fast=True) == run(source, df.copy(), fast=False)
+
+
+def test_rewrite_reads_numpy_columns():
+    fn = rewrite_row_access(ast.parse(ROW_LOOP)).body[0]
+    assert f"{COLUMNS_VAR} = {CACHE_CLASS}(df)" == ast.unparse(fn.body[0])
+    assert "iloc" not in ast.unparse(fn)
+
+
+def test_column_written_before_loop_is_reread():
+    fn = rewrite_row_access(ast.parse(COLUMN_BEFORE_LOOP)).body[0]
+    assert f"{COLUMNS_VAR}.clear()" in ast.unparse(fn)
+
+
+@pytest.mark.parametrize("body", [
+    # Written inside the loop
+    "for i in range(len(df)):\n    df.loc[i, 'close'] = 1.0\n    x = df['close'].iloc[i]",
+    "for i in range(len(df)):\n    df['close'].fillna(0, inplace=True)\n    x = df['close'].iloc[i]",
+    # Aliased, passed on, captured or rebound
+    "d = df\nx = df['close'].iloc[0]",
+    "col = df['close']\nx = df['close'].iloc[0]",
+    "helper(df)\nx = df['close'].iloc[0]",
+    "f = lambda: df\nx = df['close'].iloc[0]",
+    "items = [df]\nx = df['close'].iloc[0]",
+    "df = df.copy()\nx = df['close'].iloc[0]",
+    # Nothing to rewrite
+    "x = len(df)",
+])
+def test_unsafe_or_unchanged_code_is_not_rewritten(body):
+    source = "def run_strategy(df):\n" + textwrap.indent(body, "    ") + "\n    return [], 'HOLD'\n"
+    assert rewrite_row_access(ast.parse(source)) is None
+
+
+def test_reserved_names_are_not_rewritten():
+    source = ROW_LOOP.replace("trades = []", f"trades = []\n    {COLUMNS_VAR} = 1")
+    assert rewrite_row_access(ast.parse(source)) is None
+
+
+def test_column_cache_keeps_pandas_semantics_for_non_numeric_columns():
+    cache = ColumnCache(pd.DataFrame({"close": [1.0, 2.0], "side": ["buy", "sell"]}))
+    assert isinstance(cache["close"], np.ndarray)
+    assert cache["side"][1] == "sell"
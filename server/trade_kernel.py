@@ -0,0 +1,189 @@
+import os
+import numpy as np
+
+try:
+    import numba
+except ImportError:  # Optional: the NumPy kernel is used instead
+    numba = None
+
+# Trade generation from per-bar entry/exit signals: the long-only state
+# machine every generated strategy hand-rolls (enter while flat, leave on an
+# exit signal) plus stop loss / take profit against each bar's low/high.
+#
+#   trades = generate_trades(entry, exit, close, high, low, stop_loss=0.02, take_profit=0.05)
+#
+# Rules, shared with the sweep overlays and the bot: a bar with both signals
+# keeps the current position; SL/TP are checked from the bar after entry, at
+# entry * (1 -/+ pct), SL winning ties and both before that bar's signal; a
+# bar that stops out does not re-enter; a trade still open at the end closes
+# at the last close. Without SL/TP the state machine is pure NumPy; with
+# them it is a bar walk, compiled by Numba when it is installed and run as
+# plain Python otherwise.
+#
+# apply_exits() applies the same SL/TP rules to trades that already sit on
+# bars (long or short, any size), without re-deriving them from signals.
+
+TRADE_KERNEL_JIT = os.getenv("TRADE_KERNEL_JIT", "1") == "1"
+
+EXIT_SIGNAL, EXIT_STOP_LOSS, EXIT_TAKE_PROFIT, EXIT_END = 0, 1, 2, 3
+
+
+def signal_bars(entry, exit):
+    """
+    Entry/exit bar indices of the state machine without SL/TP, fully
+    vectorized. `closed_at_end` says whether the last trade was still open.
+    """
+    n = len(entry)
+    state = np.full(n, np.nan)
+    state[entry & ~exit] = 1.0
+    state[exit & ~entry] = 0.0
+
+    # Forward-fill the last decided state over undecided bars
+    decided = np.where(np.isnan(state), 0, np.arange(n))
+    np.maximum.accumulate(decided, out=decided)
+    position = np.nan_to_num(state[decided]) if n else state
+    previous = np.concatenate(([0.0], position[:-1]))
+
+    entry_idx = np.flatnonzero((position == 1) & (previous == 0))
+    exit_idx = np.flatnonzero((position == 0) & (previous == 1))
+    closed_at_end = len(exit_idx) < len(entry_idx)
+    if closed_at_end:
+        exit_idx = np.append(exit_idx, n - 1)
+    return entry_idx, exit_idx, closed_at_end
+
+
+def _walk(entry, exit, close, high, low, stop_loss, take_profit, out_entry, out_exit, out_price, out_reason):
+    """Bar-by-bar state machine; compiled by Numba when available. Returns the trade count."""
+    n = len(close)
+    count = 0
+    in_trade = False
+    entry_price = stop = take = 0.0
+    for i in range(n):
+        if not in_trade:
+            if entry[i] and not exit[i]:
+                in_trade = True
+                entry_price = close[i]
+                stop = entry_price * (1.0 - stop_loss) if stop_loss > 0 else -np.inf
+                take = entry_price * (1.0 + take_profit) if take_profit > 0 else np.inf
+                out_entry[count] = i
+            continue
+        reason = -1
+        price = 0.0
+        if low[i] <= stop:
+            reason, price = EXIT_STOP_LOSS, stop
+        elif high[i] >= take:
+            reason, price = EXIT_TAKE_PROFIT, take
+        elif exit[i] and not entry[i]:
+            reason, price = EXIT_SIGNAL, close[i]
+        if reason >= 0:
+            out_exit[count] = i
+            out_price[count] = price
+            out_reason[count] = reason
+            count += 1
+            in_trade = False
+    if in_trade:
+        out_exit[count] = n - 1
+        out_price[count] = close[n - 1]
+        out_reason[count] = EXIT_END
+        count += 1
+    return count
+
+
+if numba is not None and TRADE_KERNEL_JIT:
+    # Compiled once at import (and cached on disk); the backtest pool's fork server preloads it
+    _walk_jit = numba.njit("i8(b1[:], b1[:], f8[:], f8[:], f8[:], f8, f8, i8[:], i8[:], f8[:], i1[:])",
+                           cache=True, nogil=True)(_walk)
+else:
+    _walk_jit = None
+
+
+def _array(values, dtype):
+    # The compiled signature takes writeable C arrays; copy-on-write frames hand out read-only ones
+    return np.require(values, dtype, ("C", "W"))
+
+
+def generate_trades(entry, exit, close, high=None, low=None, stop_loss=0.0, take_profit=0.0, jit=True):
+    """
+    Runs the state machine over boolean `entry`/`exit` arrays. Returns a dict
+    of arrays: entry_idx, exit_idx, entry_price, exit_price and reason (one
+    of the EXIT_* codes).
+    """
+    entry = _array(entry, np.bool_)
+    exit = _array(exit, np.bool_)
+    close = _array(close, np.float64)
+    stop_loss = float(stop_loss or 0.0)
+    take_profit = float(take_profit or 0.0)
+
+    if stop_loss <= 0 and take_profit <= 0:
+        entry_idx, exit_idx, closed_at_end = signal_bars(entry, exit)
+        reason = np.full(len(entry_idx), EXIT_SIGNAL, dtype=np.int8)
+        if closed_at_end:
+            reason[-1] = EXIT_END
+        return {
+            "entry_idx": entry_idx, "exit_idx": exit_idx,
+            "entry_price": close[entry_idx], "exit_price": close[exit_idx], "reason": reason,
+        }
+
+    high = close if high is None else _array(high, np.float64)
+    low = close if low is None else _array(low, np.float64)
+    n = len(close)
+    out_entry = np.empty(n, dtype=np.int64)
+    out_exit = np.empty(n, dtype=np.int64)
+    out_price = np.empty(n, dtype=np.float64)
+    out_reason = np.empty(n, dtype=np.int8)
+    walk = _walk_jit if jit and _walk_jit is not None else _walk
+    count = walk(entry, exit, close, high, low, stop_loss, take_profit, out_entry, out_exit, out_price, out_reason)
+    return {
+        "entry_idx": out_entry[:count], "exit_idx": out_exit[:count],
+        "entry_price": close[out_entry[:count]], "exit_price": out_price[:count], "reason": out_reason[:count],
+    }
+
+
+def _walk_exits(entry_idx, exit_idx, entry_price, side, high, low, stop_loss, take_profit,
+                out_exit, out_price, out_reason):
+    """Per-trade SL/TP scan for trades with known bars; compiled by Numba when available."""
+    for t in range(len(entry_idx)):
+        entry = entry_price[t]
+        if side[t] > 0:
+            stop = entry * (1.0 - stop_loss) if stop_loss > 0 else -np.inf
+            take = entry * (1.0 + take_profit) if take_profit > 0 else np.inf
+        else:
+            stop = entry * (1.0 + stop_loss) if stop_loss > 0 else np.inf
+            take = entry * (1.0 - take_profit) if take_profit > 0 else -np.inf
+        for i in range(entry_idx[t] + 1, exit_idx[t] + 1):
+            if side[t] > 0:
+                stopped, taken = low[i] <= stop, high[i] >= take
+            else:
+                stopped, taken = high[i] >= stop, low[i] <= take
+            if stopped or taken:
+                out_exit[t] = i
+                out_price[t] = stop if stopped else take
+                out_reason[t] = EXIT_STOP_LOSS if stopped else EXIT_TAKE_PROFIT
+                break
+
+
+if numba is not None and TRADE_KERNEL_JIT:
+    _walk_exits_jit = numba.njit("void(i8[:], i8[:], f8[:], i1[:], f8[:], f8[:], f8, f8, i8[:], f8[:], i1[:])",
+                                 cache=True, nogil=True)(_walk_exits)
+else:
+    _walk_exits_jit = None
+
+
+def apply_exits(entry_idx, exit_idx, entry_price, exit_price, side, high, low, stop_loss=0.0, take_profit=0.0, jit=True):
+    """
+    SL/TP for trades that already sit on bars, such as a run_strategy trade
+    list: each trade keeps its side (+1 long, -1 short) and size and exits at
+    its stop or target on the first bar after entry that reaches it, up to
+    and including its own exit bar. Same price and tie rules as
+    generate_trades. Returns exit_idx, exit_price and reason arrays.
+    """
+    out_exit = np.array(exit_idx, dtype=np.int64)
+    out_price = np.array(exit_price, dtype=np.float64)
+    out_reason = np.full(len(out_exit), EXIT_SIGNAL, dtype=np.int8)
+    walk = _walk_exits_jit if jit and _walk_exits_jit is not None else _walk_exits
+    walk(
+        _array(entry_idx, np.int64), out_exit.copy(), _array(entry_price, np.float64), _array(side, np.int8),
+        _array(high, np.float64), _array(low, np.float64), float(stop_loss or 0.0), float(take_profit or 0.0),
+        out_exit, out_price, out_reason,
+    )
+    return out_exit, out_price, out_reason
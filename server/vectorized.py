@@ -0,0 +1,269 @@
+import os
+import ast
+import copy
+import numpy as np
+import pandas as pd
+from trade_kernel import generate_trades, EXIT_SIGNAL
+
+# Faster execution of generated strategies, in two forms:
+#
+# Signal form: the strategy defines `signals(df)` returning boolean entry and
+# exit Series (or arrays), and the long-only open/close state machine the
+# generated loops hand-roll is run by the trade kernel (trade_kernel.py):
+#
+#   def signals(df):
+#       ema = df['close'].ewm(span=20).mean()
+#       return df['close'] > ema, df['close'] < ema
+#
+# Row loops: existing run_strategy(df) loops read `df['close'].iloc[i]`, which
+# costs a pandas indexing call per access. rewrite_row_access() rewrites those
+# reads to index NumPy arrays extracted once per column, when it can prove the
+# loop does not write to df and df never escapes under another name
+# (otherwise the strategy runs unchanged).
+
+STRATEGY_FAST_LOOP = os.getenv("STRATEGY_FAST_LOOP", "1") == "1"
+
+COLUMNS_VAR = "_np_cols"
+CACHE_CLASS = "_ColumnCache"
+
+
+# --- Signal form ---
+
+def _as_mask(values, n, name):
+    mask = np.asarray(values)
+    if mask.dtype != np.bool_:
+        # NaN from indicator warm-up means "no signal"
+        mask = np.nan_to_num(mask.astype(np.float64)) != 0
+    if mask.shape != (n,):
+        raise ValueError(f"signals(df) must return {name} with one value per candle")
+    return mask
+
+
+def latest_signal(trades, n):
+    """BUY/SELL when the last bar opened/closed a trade on a signal, else HOLD."""
+    if len(trades["entry_idx"]) and trades["entry_idx"][-1] == n - 1:
+        return "BUY"
+    if len(trades["exit_idx"]) and trades["exit_idx"][-1] == n - 1 and trades["reason"][-1] == EXIT_SIGNAL:
+        return "SELL"
+    return "HOLD"  # SL/TP exits are the bot's own job
+
+
+def run_signals(signals_fn, df, stop_loss=0.0, take_profit=0.0):
+    """Calls `signals(df)` and runs the trade kernel; returns its trades and the latest signal."""
+    n = len(df)
+    result = signals_fn(df)
+    if not isinstance(result, tuple) or len(result) != 2:
+        raise ValueError("signals(df) must return (entry, exit)")
+    trades = generate_trades(
+        _as_mask(result[0], n, "entry"), _as_mask(result[1], n, "exit"),
+        df["close"].to_numpy(dtype=np.float64), df["high"].to_numpy(dtype=np.float64),
+        df["low"].to_numpy(dtype=np.float64), stop_loss, take_profit,
+    )
+    return trades, latest_signal(trades, n)
+
+
+def signals_as_run_strategy(signals_fn, stop_loss=0.0, take_profit=0.0):
+    """
+    Adapts `signals(df)` to the run_strategy(df) contract: (trades, latest_signal).
+    With SL/TP the signal state follows stop-outs, as the bot's position does.
+    """
+    def run_strategy(df):
+        trades, signal = run_signals(signals_fn, df, stop_loss, take_profit)
+        return [
+            {"entry_price": entry, "exit_price": exit, "qty": 1, "entry_idx": entry_idx, "exit_idx": exit_idx}
+            for entry, exit, entry_idx, exit_idx in zip(
+                trades["entry_price"].tolist(), trades["exit_price"].tolist(),
+                trades["entry_idx"].tolist(), trades["exit_idx"].tolist(),
+            )
+        ], signal
+    return run_strategy
+
+
+# --- Row loops over NumPy arrays ---
+
+class ColumnCache(dict):
+    """Column name -> NumPy array (or .iloc for non-numeric columns), extracted on first use."""
+
+    def __init__(self, df):
+        super().__init__()
+        self.df = df
+
+    def __missing__(self, key):
+        column = self.df[key]
+        if isinstance(column, pd.Series) and column.dtype.kind in "biuf":
+            values = column.to_numpy()
+        else:
+            # Timestamps, objects and duplicate columns keep pandas semantics
+            values = column.iloc
+        self[key] = values
+        return values
+
+
+def _rooted_at(node, name):
+    while isinstance(node, (ast.Subscript, ast.Attribute, ast.Starred)):
+        node = node.value
+    return isinstance(node, ast.Name) and node.id == name
+
+
+IN_PLACE_METHODS = {"insert", "pop", "update", "__setitem__", "__delitem__"}
+
+
+def _mutates(stmt, df):
+    """True if the (simple) statement may change df's columns."""
+    if isinstance(stmt, (ast.For, ast.While, ast.If, ast.With, ast.Try, ast.FunctionDef)):
+        return False  # bodies are checked statement by statement
+    if isinstance(stmt, ast.Assign):
+        if any(_rooted_at(t, df) for target in stmt.targets for t in ast.walk(target)
+               if isinstance(t, (ast.Subscript, ast.Attribute))):
+            return True
+    elif isinstance(stmt, (ast.AugAssign, ast.AnnAssign, ast.Delete)):
+        targets = stmt.targets if isinstance(stmt, ast.Delete) else [stmt.target]
+        if any(_rooted_at(t, df) for t in targets):
+            return True
+    # df.insert(...), df['x'].fillna(0, inplace=True), ...
+    return any(
+        isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and _rooted_at(node.func, df)
+        and (node.func.attr in IN_PLACE_METHODS or any(k.arg == "inplace" for k in node.keywords))
+        for node in ast.walk(stmt)
+    )
+
+
+# Calls that only read their argument
+READ_ONLY_CALLS = {"len", "print", "isinstance", "type", "id", "repr", "str"}
+INDEXERS = {"iloc", "loc", "at", "iat"}
+CONTAINERS = (ast.List, ast.Tuple, ast.Set, ast.Dict, ast.Starred, ast.ListComp, ast.SetComp,
+              ast.GeneratorExp, ast.DictComp, ast.Yield, ast.YieldFrom, ast.Await)
+
+
+def _is_scalar_read(node):
+    """df[col].iloc[i], df.at[i, col], df.loc[i, col]: a single value, not a view of df."""
+    if not (isinstance(node, ast.Subscript) and isinstance(node.value, ast.Attribute)
+            and node.value.attr in INDEXERS):
+        return False
+    index = node.slice
+    if isinstance(index, ast.Slice) or (isinstance(index, ast.Tuple)
+                                        and any(isinstance(e, ast.Slice) for e in index.elts)):
+        return False
+    return node.value.attr in ("at", "iat") or isinstance(index, ast.Tuple) or isinstance(node.value.value, ast.Subscript)
+
+
+def _aliases(fn, df):
+    """
+    True if df, or something that may share its data (a column, df.loc,
+    df.values, ...), is bound to another name, stored in a container, passed
+    to a call or captured by a nested function: writes through the alias
+    would go unseen and the cached arrays would go stale.
+    """
+    parents = {child: node for node in ast.walk(fn) for child in ast.iter_child_nodes(node)}
+    for node in ast.walk(fn):
+        if not (isinstance(node, ast.Name) and node.id == df):
+            continue
+        top = node
+        while isinstance(parents.get(top), (ast.Attribute, ast.Subscript)) and parents[top].value is top:
+            top = parents[top]
+        if _is_scalar_read(top):
+            continue
+        parent = parents.get(top)
+        if isinstance(parent, ast.Call):
+            if top is parent.func:
+                continue  # a method call, checked by _mutates when it writes in place
+            if not (isinstance(parent.func, ast.Name) and parent.func.id in READ_ONLY_CALLS):
+                return True
+        elif isinstance(parent, ast.keyword) or isinstance(parent, CONTAINERS):
+            return True
+        elif isinstance(parent, (ast.Assign, ast.AnnAssign, ast.NamedExpr)) and top is parent.value:
+            targets = parent.targets if isinstance(parent, ast.Assign) else [parent.target]
+            if not all(_rooted_at(t, df) and not isinstance(t, ast.Name) for t in targets):
+                return True  # `d = df`, `col = df['close']`; df['x'] = df['y'] copies
+        elif isinstance(parent, (ast.For, ast.comprehension, ast.withitem)) and top is not getattr(parent, "iter", None):
+            return True
+        # Nested functions and lambdas can keep df past the loop
+        scope = parent
+        while scope is not None and scope is not fn:
+            if isinstance(scope, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+                return True
+            scope = parents.get(scope)
+    return False
+
+
+class _RowAccess(ast.NodeTransformer):
+    def __init__(self, df):
+        self.df = df
+
+    def visit_Subscript(self, node):
+        self.generic_visit(node)
+        target = node.value
+        if (
+            isinstance(node.ctx, ast.Load)
+            and isinstance(target, ast.Attribute) and target.attr == "iloc"
+            and isinstance(target.value, ast.Subscript)
+            and isinstance(target.value.value, ast.Name) and target.value.value.id == self.df
+            and isinstance(target.value.slice, ast.Constant) and isinstance(target.value.slice.value, str)
+            and not isinstance(node.slice, (ast.Slice, ast.Tuple))
+        ):
+            column = ast.Subscript(
+                value=ast.Name(id=COLUMNS_VAR, ctx=ast.Load()), slice=target.value.slice, ctx=ast.Load()
+            )
+            return ast.copy_location(ast.Subscript(value=column, slice=node.slice, ctx=ast.Load()), node)
+        return node
+
+    def _statement(self, node):
+        self.generic_visit(node)
+        if _mutates(node, self.df):
+            # Columns written outside loops are re-read on next access
+            clear = ast.Expr(ast.Call(
+                func=ast.Attribute(value=ast.Name(id=COLUMNS_VAR, ctx=ast.Load()), attr="clear", ctx=ast.Load()),
+                args=[], keywords=[],
+            ))
+            return [node, ast.copy_location(clear, node)]
+        return node
+
+    visit_Assign = visit_AugAssign = visit_AnnAssign = visit_Delete = visit_Expr = _statement
+
+    def visit_FunctionDef(self, node):
+        return node  # nested functions have their own scope
+
+    visit_AsyncFunctionDef = visit_Lambda = visit_FunctionDef
+
+
+def rewrite_row_access(tree, name="run_strategy"):
+    """
+    Returns a copy of the module with `df[col].iloc[i]` reads in `name`
+    served from NumPy arrays, or None when the rewrite is not known to be
+    safe (df rebound, aliased or written inside a loop) or would change nothing.
+    """
+    names = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+    if COLUMNS_VAR in names or CACHE_CLASS in names:
+        return None
+    tree = copy.deepcopy(tree)
+    fn = next((node for node in tree.body if isinstance(node, ast.FunctionDef) and node.name == name), None)
+    if fn is None or not fn.args.args:
+        return None
+    df = fn.args.args[0].arg
+
+    if _aliases(fn, df):
+        return None
+    for node in ast.walk(fn):
+        if isinstance(node, (ast.Global, ast.Nonlocal)) and df in node.names:
+            return None
+        if isinstance(node, ast.Name) and node.id == df and not isinstance(node.ctx, ast.Load):
+            return None
+        if isinstance(node, (ast.For, ast.While)):
+            # A write per iteration would invalidate the arrays every time
+            if any(_mutates(stmt, df) for part in node.body + node.orelse
+                   for stmt in ast.walk(part) if isinstance(stmt, ast.stmt)):
+                return None
+
+    before = ast.dump(fn)
+    fn.body = [stmt for node in fn.body for stmt in _as_list(_RowAccess(df).visit(node))]
+    if ast.dump(fn) == before:
+        return None
+    fn.body.insert(0, ast.Assign(
+        targets=[ast.Name(id=COLUMNS_VAR, ctx=ast.Store())],
+        value=ast.Call(func=ast.Name(id=CACHE_CLASS, ctx=ast.Load()), args=[ast.Name(id=df, ctx=ast.Load())], keywords=[]),
+    ))
+    return ast.fix_missing_locations(tree)
+
+
+def _as_list(result):
+    return result if isinstance(result, list) else [result]